@@ -1,3 +1,59 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from blog.models import Category
+from blog.testing import query_budget, route_names
+from . import urls as aboutblog_urls
+
+# Queries and milliseconds each route may take, logged in: the session and
+# user queries, then the categories and calendar of the sidebar.
+ROUTE_BUDGETS = {
+    'aboutblog:about': (4, 500),
+}
+
+# The same for an anonymous visitor.
+ANONYMOUS_ROUTE_BUDGETS = {
+    'aboutblog:about': (2, 500),
+}
+
+
+@override_settings(BLOG_RESPONSE_CACHE = None)
+class Test_Query_Budgets(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+
+    def test_every_route_has_a_budget(self):
+        """
+        A new route comes with its budget.
+        """
+        self.assertEqual(set(ROUTE_BUDGETS), route_names(aboutblog_urls))
+        self.assertEqual(set(ANONYMOUS_ROUTE_BUDGETS), route_names(aboutblog_urls))
+
+    def test_route_budgets(self):
+        """
+        No route runs more queries, or takes longer, than its budget.
+        """
+        self.client.login(username = 'test_usr', password = 'secret')
+        self.check_budgets(ROUTE_BUDGETS)
+
+    def test_anonymous_route_budgets(self):
+        """
+        No route runs more queries, or takes longer, than its budget for an
+        anonymous visitor.
+        """
+        self.check_budgets(ANONYMOUS_ROUTE_BUDGETS)
+
+    def check_budgets(self, budgets):
+        for name, (queries, ms) in sorted(budgets.items()):
+            with self.subTest(route = name):
+                path = reverse(name)
+                # The first request compiles the templates.
+                self.client.get(path)
+                with query_budget(queries, ms = ms, label = name):
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
@@ -1,4 +1,15 @@
 from django.shortcuts import render
 
+from blog.cache import EPOCH, SIDEBAR_CACHE_TAGS, cache_response, conditional_page
+
+def about_cache_tags(request, *args, **kwargs):
+    return SIDEBAR_CACHE_TAGS
+
+def about_validators(request, *args, **kwargs):
+    # Only the sidebar changes; its tags are part of the validators.
+    return (), EPOCH
+
+@cache_response(about_cache_tags)
+@conditional_page(about_cache_tags, about_validators)
 def about_page(request):
     return render(request, 'aboutblog/about.html')
@@ -7,10 +7,26 @@ class ArticleAdmin(admin.ModelAdmin):
         ('Date information', {'fields': ['created_date', 'published_date',]}),
         ('Text', {'fields': ['text', 'image']}),
     ]
-    list_display = ('title', 'published_date', 'was_published_recently')
+    list_display = ('title', 'published_date', 'was_published_recently', 'approved_comment_count')
     list_filter = ['published_date']
     search_fields = ['title']
 
+class CommentAdmin(admin.ModelAdmin):
+    list_display = ('text', 'author', 'article', 'created_date', 'approved_comment')
+    list_filter = ['approved_comment']
+    actions = ['approve_comments']
+
+    def approve_comments(self, request, queryset):
+        # One save() per comment rather than update(): the save hooks keep
+        # Article.approved_comment_count and the page caches current.
+        comments = queryset.filter(approved_comment=False)
+        approved = 0
+        for comment in comments:
+            comment.approve()
+            approved += 1
+        self.message_user(request, '%s comments approved.' % approved)
+    approve_comments.short_description = 'Approve selected comments'
+
 admin.site.register(Category)
 admin.site.register(Article, ArticleAdmin)
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
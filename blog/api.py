@@ -0,0 +1,208 @@
+"""
+Read-only JSON feeds of the published articles and their approved comments.
+
+Rows are read with values_list() and written to the response one at a time
+as they are serialized, with orjson when it is installed. Pages are keyset
+pages (see blog.pagination); ?fields= selects the fields of every item and
+the ETag follows the cache generations of the data (see blog.cache).
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import condition, require_safe
+
+from .cache import get_generation_etag, get_next_publication, get_publication_timeout, get_response_cache
+from .models import Article, Comment
+from .pagination import get_keyset_page, parse_ordering
+from .views import published_day_range
+
+API_PAGE_SIZE = 10
+API_MAX_PAGE_SIZE = 50
+
+
+def media_url(path):
+    return settings.MEDIA_URL + path if path else ''
+
+
+# API field name: (column, conversion of the column value or None).
+ARTICLE_FIELDS = {
+    'id': ('id', None),
+    'title': ('title', None),
+    'excerpt': ('excerpt', None),
+    'image': ('image', media_url),
+    'published_date': ('published_date', None),
+    'author': ('author__username', None),
+    'category': ('category__urlstext', None),
+    'category_title': ('category__title', None),
+    'approved_comments': ('approved_comment_count', None),
+}
+ARTICLE_DEFAULT_FIELDS = ('id', 'title', 'excerpt', 'image', 'published_date', 'author',
+    'category', 'category_title', 'approved_comments')
+ARTICLE_ORDERING = ('-published_date', 'title', 'id')
+
+COMMENT_FIELDS = {
+    'id': ('id', None),
+    'author': ('author', None),
+    'text': ('text', None),
+    'created_date': ('created_date', None),
+}
+COMMENT_DEFAULT_FIELDS = ('id', 'author', 'text', 'created_date')
+COMMENT_ORDERING = ('created_date', 'id')
+
+
+def _default(value):
+    # isoformat() keeps the microseconds, like orjson and the cursors do.
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    raise TypeError('%r is not JSON serializable' % value)
+
+
+if orjson is not None:
+    def dumps(value):
+        return orjson.dumps(value)
+else:
+    _encoder = json.JSONEncoder(default=_default, separators=(',', ':'), ensure_ascii=False)
+
+    def dumps(value):
+        return _encoder.encode(value).encode('utf-8')
+
+
+def parse_fields(request, available, default):
+    """
+    The field names asked for with ?fields=a,b (all by default). Raises
+    ValueError on an unknown name.
+    """
+    value = request.GET.get('fields')
+    if not value:
+        return list(default)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in available]
+    if unknown or not names:
+        raise ValueError('Unknown fields: %s' % ', '.join(unknown))
+    return names
+
+
+def parse_limit(request):
+    value = request.GET.get('limit')
+    if not value:
+        return API_PAGE_SIZE
+    limit = int(value)
+    if not 1 <= limit <= API_MAX_PAGE_SIZE:
+        raise ValueError('limit must be between 1 and %s' % API_MAX_PAGE_SIZE)
+    return limit
+
+
+def bad_request(error):
+    return JsonResponse({'error': str(error)}, status=400)
+
+
+def stream_page(queryset, request, available, default, ordering):
+    """
+    Return a StreamingHttpResponse with one keyset page of queryset, each
+    item carrying the requested fields.
+    """
+    try:
+        names = parse_fields(request, available, default)
+        limit = parse_limit(request)
+    except ValueError as error:
+        return bad_request(error)
+
+    columns = [available[name][0] for name in names]
+    # The cursor needs the ordering keys, whether they are shown or not.
+    columns.extend(key for key, desc in parse_ordering(ordering) if key not in columns)
+    page = get_keyset_page(queryset.values_list(*columns), request.GET.get('cursor'),
+        ordering, limit, columns)
+    fields = [(name, columns.index(available[name][0]), available[name][1]) for name in names]
+
+    def content():
+        yield b'{"data":['
+        for i, row in enumerate(page):
+            item = {}
+            for name, position, convert in fields:
+                item[name] = convert(row[position]) if convert else row[position]
+            yield (b',' if i else b'') + dumps(item)
+        yield b'],"next_cursor":' + dumps(page.next_cursor)
+        yield b',"previous_cursor":' + dumps(page.previous_cursor) + b'}'
+
+    return StreamingHttpResponse(content(), content_type='application/json')
+
+
+def parse_date(value):
+    """
+    The [start, end) datetimes of the local day value (YYYY-MM-DD), or None.
+    """
+    parts = value.split('-')
+    if len(parts) != 3:
+        return None
+    return published_day_range(*parts)
+
+
+def article_feed_tags(request):
+    if request.GET.get('category'):
+        return ['category:%s' % request.GET['category']]
+    if request.GET.get('author'):
+        return ['author:%s' % request.GET['author']]
+    if request.GET.get('date'):
+        day_range = parse_date(request.GET['date'])
+        if day_range is not None:
+            return ['date:%s' % timezone.localtime(day_range[0]).date().isoformat()]
+    return ['articles']
+
+
+def article_feed_etag(request):
+    cache = get_response_cache()
+    # A scheduled publication is not announced by any save(), so the
+    # generations would not change: the ETag follows the next publication
+    # too, and there is none while it is due.
+    if cache is None or get_publication_timeout(cache) == 0:
+        return None
+    next_publication = get_next_publication(cache)
+    # The items carry the category titles.
+    return get_generation_etag(cache, article_feed_tags(request) + ['categories'], request.get_full_path(),
+        next_publication.isoformat() if next_publication else '')
+
+
+def comment_feed_etag(request, pk):
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    return get_generation_etag(cache, ['article:%s' % pk], request.get_full_path())
+
+
+@require_safe
+@condition(etag_func=article_feed_etag)
+def article_feed(request):
+    """
+    The published articles, newest first. Filtered by ?category=<urlstext>,
+    ?author=<username> or ?date=YYYY-MM-DD.
+    """
+    articles = Article.objects.filter(published_date__lte=timezone.now())
+    if request.GET.get('category'):
+        articles = articles.filter(category__urlstext=request.GET['category'])
+    elif request.GET.get('author'):
+        articles = articles.filter(author__username=request.GET['author'])
+    elif request.GET.get('date'):
+        day_range = parse_date(request.GET['date'])
+        if day_range is None:
+            return bad_request('date must be YYYY-MM-DD')
+        articles = articles.filter(published_date__gte=day_range[0], published_date__lt=day_range[1])
+    return stream_page(articles, request, ARTICLE_FIELDS, ARTICLE_DEFAULT_FIELDS, ARTICLE_ORDERING)
+
+
+@require_safe
+@condition(etag_func=comment_feed_etag)
+def comment_feed(request, pk):
+    """
+    The approved comments of a published article, oldest first.
+    """
+    article = get_object_or_404(Article.objects.only('id'), pk=pk, published_date__lte=timezone.now())
+    comments = Comment.objects.filter(article=article, approved_comment=True)
+    return stream_page(comments, request, COMMENT_FIELDS, COMMENT_DEFAULT_FIELDS, COMMENT_ORDERING)
@@ -1,5 +1,10 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class BlogConfig(AppConfig):
     name = 'blog'
+
+    def ready(self):
+        from .instrumentation import instrument_connection
+        connection_created.connect(instrument_connection)
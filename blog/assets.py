@@ -0,0 +1,176 @@
+"""
+Bundled, minified and precompressed static files.
+
+BUNDLES lists the CSS and JavaScript files the blog templates load. On
+collectstatic, BundleStaticFilesStorage concatenates each list into one
+minified file under blog/bundles/, then hashes every file as
+ManifestStaticFilesStorage does and writes a .gz and, when the brotli
+module is installed, a .br copy next to each text file for
+myblog.static_serving. Templates load a bundle with {% bundle %} from
+asset_extras, which falls back to the separate files in DEBUG and before
+collectstatic has run.
+
+CKEditor is not bundled: ckeditor.js loads its plugins and skins relative
+to its own URL.
+"""
+import gzip
+import posixpath
+import re
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import rcssmin
+except ImportError:
+    rcssmin = None
+
+try:
+    import rjsmin
+except ImportError:
+    rjsmin = None
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+BUNDLES = OrderedDict([
+    ('blog/bundles/blog.css', [
+        'blog/vendor/bootstrap/css/bootstrap.min.css',
+        'blog/vendor/bootstrap/css/bootstrap-glyphicons.css',
+        'blog/vendor/bootstrap/css/bootstrap-theme.min.css',
+        'blog/vendor/bootstrap/css/bootstrap-datepicker.min.css',
+        'blog/css/blog.css',
+        'aboutblog/css/aboutblog.css',
+    ]),
+    ('blog/bundles/blog.js', [
+        'blog/vendor/jquery/jquery.min.js',
+        'blog/vendor/popper/popper.min.js',
+        'blog/vendor/bootstrap/js/bootstrap.min.js',
+        'blog/vendor/bootstrap/js/bootstrap-datepicker.min.js',
+    ]),
+])
+
+# Files worth a compressed copy; images and woff fonts are compressed already.
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.xml', '.eot', '.ttf', '.map')
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+CSS_TOKENS = re.compile(r'''("(?:\\.|[^"\\])*"|'(?:\\.|[^'\\])*')|(/\*.*?\*/)|(\s+)|([^"'/\s]+|/)''', re.S)
+SOURCE_MAP = re.compile(r'^\s*(?://|/\*)#\s*sourceMappingURL=.*$', re.M)
+
+
+def rebase_css_urls(css, source, bundle):
+    """
+    Rewrite the relative url()s of the CSS file source for its new location
+    in bundle.
+    """
+    source_directory, bundle_directory = posixpath.dirname(source), posixpath.dirname(bundle)
+
+    def rebase(match):
+        quote, url = match.groups()
+        if url.startswith(('data:', '#', '/')) or '://' in url:
+            return match.group(0)
+        path, suffix = re.match(r'^([^?#]*)(.*)$', url).groups()
+        path = posixpath.relpath(posixpath.normpath(posixpath.join(source_directory, path)), bundle_directory)
+        return 'url(%s%s%s%s)' % (quote, path, suffix, quote)
+    return CSS_URL.sub(rebase, css)
+
+
+def minify_css(css):
+    """
+    Drop the comments (but /*! licences) and the whitespace around braces,
+    semicolons and commas. Spaces after colons stay: "a :hover" is not
+    "a:hover".
+    """
+    if rcssmin is not None:
+        return rcssmin.cssmin(css, keep_bang_comments=True)
+    output = []
+    for string, comment, space, other in CSS_TOKENS.findall(css):
+        if comment:
+            if comment.startswith('/*!'):
+                output.append(comment + '\n')
+        elif space:
+            if output and output[-1][-1:] not in '{};,\n' and not output[-1].endswith(' '):
+                output.append(' ')
+        else:
+            if other[:1] in ('{', '}', ';', ',') and output and output[-1] == ' ':
+                output.pop()
+            output.append(string or other)
+    return ''.join(output).strip() + '\n'
+
+
+def minify_js(js):
+    js = SOURCE_MAP.sub('', js)
+    if rjsmin is not None:
+        return rjsmin.jsmin(js, keep_bang_comments=True)
+    # The sources are the vendors' .min.js files already.
+    return js.strip() + '\n'
+
+
+def build_bundle(name, sources):
+    """
+    The content of the bundle name from sources, a list of (static path,
+    text).
+    """
+    if name.endswith('.css'):
+        return ''.join(minify_css(rebase_css_urls(text, path, name)) for path, text in sources)
+    # A file without its final semicolon must not run into the next one.
+    return ''.join(minify_js(text).rstrip().rstrip(';') + ';\n' for path, text in sources)
+
+
+def compress(content):
+    """
+    [(suffix, compressed content)] of the copies worth keeping.
+    """
+    variants = [('.gz', gzip.compress(content, GZIP_LEVEL))]
+    if brotli is not None:
+        variants.append(('.br', brotli.compress(content, quality=BROTLI_QUALITY)))
+    return [(suffix, data) for suffix, data in variants if len(data) < len(content)]
+
+
+class BundleStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes the BUNDLES and the
+    compressed copies of the collected text files.
+    """
+
+    def stored_name(self, name):
+        try:
+            return super(BundleStaticFilesStorage, self).stored_name(name)
+        except ValueError:
+            # Not collected yet (development, tests): the unhashed file.
+            return name
+
+    def write(self, name, content):
+        if self.exists(name):
+            self.delete(name)
+        self.save(name, ContentFile(content))
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            return
+        for name, source_names in BUNDLES.items():
+            sources = []
+            for source_name in source_names:
+                storage, path = paths[source_name]
+                with storage.open(path) as source:
+                    sources.append((source_name, source.read().decode('utf-8')))
+            self.write(name, build_bundle(name, sources).encode('utf-8'))
+            paths[name] = (self, name)
+
+        for processed in super(BundleStaticFilesStorage, self).post_process(paths, dry_run, **options):
+            yield processed
+
+        # CSS files are hashed again in every pass: compress the final names.
+        for name in paths:
+            if not name.lower().endswith(COMPRESSED_EXTENSIONS):
+                continue
+            for stored in set([name, self.hashed_files.get(self.hash_key(name), name)]):
+                with self.open(stored) as original:
+                    content = original.read()
+                for suffix, data in compress(content):
+                    self.write(stored + suffix, data)
@@ -0,0 +1,218 @@
+"""
+Timings of the blog's hot paths over a seeded corpus, for the benchmark
+command.
+
+seed_corpus() fills an empty database with generated categories, authors,
+articles and comments, with bulk inserts and the derived columns
+(excerpt, approved_comment_count, PublishedDay) computed on the way.
+run_benchmarks() then requests every page of get_scenarios() through the test
+client, the whole middleware stack included, and reports latency
+percentiles, queries per request and the memory each request allocates.
+"""
+import collections
+import datetime
+import random
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .cache import get_response_cache
+from .models import Article, Category, Comment, PublishedDay, make_excerpt, published_day
+from .search import get_search_backend
+
+BATCH_SIZE = 1000
+APPROVED_RATIO = 0.8
+DRAFT_RATIO = 0.02
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def make_vocabulary(rng, size=3000):
+    syllables = ['ka', 'lo', 'mi', 'ne', 'ru', 'sa', 'ti', 'vo', 'ze', 'bra', 'pol', 'dis', 'ten', 'gor', 'fin']
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(syllables) for i in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def make_text(rng, vocabulary, paragraphs):
+    # Word frequencies follow a power law, as in real text.
+    return ''.join('<p>%s.</p>\n' % ' '.join(vocabulary[int(len(vocabulary) * rng.random() ** 3)]
+        for j in range(rng.randint(40, 120))) for i in range(paragraphs))
+
+
+def seed_corpus(articles=1000, comments=10000, categories=50, authors=20, hot_comments=500, seed=0,
+        log=lambda message: None):
+    """
+    Fill the database with a generated corpus. The most recent article gets
+    hot_comments of the comments, for the detail page benchmark. Return the
+    ids of (most recent article, its category, its author).
+    """
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    now = timezone.now()
+
+    with transaction.atomic():
+        Category.objects.bulk_create([Category(title='Category %s' % i, text='Category %s.' % i,
+            urlstext='category%s' % i) for i in range(categories)])
+        User.objects.bulk_create([User(username='author%s' % i, password='!') for i in range(authors)])
+        category_ids = list(Category.objects.order_by('id').values_list('id', flat=True))
+        author_ids = list(User.objects.filter(username__startswith='author').values_list('id', flat=True))
+
+        # Place the comments first: the articles are inserted with their
+        # approved-comment counts.
+        hot_comments = min(hot_comments, comments)
+        comment_plan = [0] * hot_comments + [rng.randrange(articles) for i in range(comments - hot_comments)]
+        approved_plan = [rng.random() < APPROVED_RATIO for i in comment_plan]
+        approved_counts = collections.Counter(index for index, approved in zip(comment_plan, approved_plan)
+            if approved)
+
+        # Article 0 is the most recent one, then older and older.
+        dates = sorted((now - datetime.timedelta(seconds=rng.randint(60, 730 * 86400))
+            for i in range(articles)), reverse=True)
+        published_days = collections.Counter()
+        batch = []
+        for index, date in enumerate(dates):
+            published = date if index == 0 or rng.random() >= DRAFT_RATIO else None
+            text = make_text(rng, vocabulary, rng.randint(2, 6))
+            batch.append(Article(author_id=rng.choice(author_ids), category_id=rng.choice(category_ids),
+                title=' '.join(rng.choice(vocabulary) for i in range(rng.randint(3, 8))).capitalize(),
+                text=text, excerpt=make_excerpt(text), created_date=date, published_date=published,
+                approved_comment_count=approved_counts[index]))
+            if published is not None:
+                published_days[published_day(published)] += 1
+            if len(batch) == BATCH_SIZE:
+                Article.objects.bulk_create(batch)
+                batch = []
+                log('%s articles' % (index + 1))
+        Article.objects.bulk_create(batch)
+        PublishedDay.objects.bulk_create([PublishedDay(day=day, articles=count)
+            for day, count in published_days.items()])
+
+        # A fresh table numbers the rows in insertion order.
+        article_rows = list(Article.objects.order_by('id').values_list('id', 'created_date'))
+        batch = []
+        for number, (index, approved) in enumerate(zip(comment_plan, approved_plan)):
+            article_id, created = article_rows[index]
+            batch.append(Comment(article_id=article_id, author='reader%s' % rng.randrange(1000),
+                text=' '.join(rng.choice(vocabulary) for i in range(rng.randint(5, 40))),
+                created_date=min(now, created + datetime.timedelta(seconds=rng.randint(60, 30 * 86400))),
+                approved_comment=approved))
+            if len(batch) == BATCH_SIZE:
+                Comment.objects.bulk_create(batch)
+                batch = []
+                if (number + 1) % (BATCH_SIZE * 10) == 0:
+                    log('%s comments' % (number + 1))
+        Comment.objects.bulk_create(batch)
+
+    hot = Article.objects.select_related('category', 'author').get(pk=article_rows[0][0])
+    return hot.pk, hot.category.urlstext, hot.author.username
+
+
+def get_scenarios(hot_article_id, category, author):
+    """
+    [(name, request function(client))] of the measured paths.
+    """
+    hot = Article.objects.get(pk=hot_article_id)
+    day = timezone.localtime(hot.published_date)
+    query = ' '.join(hot.title.split()[:2])
+    sidebar = Template('{% load collection_extras %}{% get_widgets %}{% get_widgets_calendar %}')
+
+    def get(path, **headers):
+        return lambda client: client.get(path, **headers)
+
+    return [
+        ('article_list', get(reverse('blog:article_list'))),
+        ('article_list_ajax', get(reverse('blog:article_list'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')),
+        ('category_list', get(reverse('blog:article_categories_list', kwargs={'categoryName': category}))),
+        ('author_list', get(reverse('blog:article_author_list', kwargs={'authorName': author}))),
+        ('date_list', get(reverse('blog:article_date_list', kwargs={'year': '%04d' % day.year,
+            'month': '%02d' % day.month, 'day': '%02d' % day.day}))),
+        ('search', get('%s?srchtxt=%s' % (reverse('blog:search_list'), query))),
+        ('article_detail', get(reverse('blog:article_detail', kwargs={'pk': hot_article_id}))),
+        ('sidebar_tags', lambda client: sidebar.render(Context())),
+    ]
+
+
+def measure(function, client, iterations, warmup, allocation_iterations):
+    for i in range(warmup):
+        function(client)
+    timings, queries = [], []
+    for i in range(iterations):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = function(client)
+            timings.append(time.perf_counter() - start)
+        queries.append(len(captured))
+        status = getattr(response, 'status_code', 200)
+        if status != 200:
+            raise ValueError('HTTP %s' % status)
+    allocations = []
+    for i in range(allocation_iterations):
+        tracemalloc.start()
+        try:
+            function(client)
+            allocations.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+    return {
+        'iterations': iterations,
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 3),
+        'min_ms': round(min(timings) * 1000, 3),
+        'p50_ms': round(percentile(timings, 0.5) * 1000, 3),
+        'p90_ms': round(percentile(timings, 0.9) * 1000, 3),
+        'p99_ms': round(percentile(timings, 0.99) * 1000, 3),
+        'max_ms': round(max(timings) * 1000, 3),
+        'queries': percentile(queries, 0.5),
+        'peak_alloc_kb': round(percentile(allocations, 0.5) / 1024.0, 1) if allocations else None,
+    }
+
+
+def run_benchmarks(scenarios, iterations=50, warmup=5, allocation_iterations=5, only=None):
+    """
+    {scenario name: measurements} of the scenarios, with an empty response
+    cache at the start of each.
+    """
+    client = Client()
+    results = collections.OrderedDict()
+    for name, function in scenarios:
+        if only and name not in only:
+            continue
+        cache = get_response_cache()
+        if cache is not None:
+            cache.clear()
+        results[name] = measure(function, client, iterations, warmup, allocation_iterations)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    [(scenario, message)] of the regressions of results against baseline:
+    a median slower by more than tolerance (a fraction) or more queries.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['p50_ms'] > before['p50_ms'] * (1 + tolerance):
+            regressions.append((name, 'p50 %.3f ms, was %.3f ms' % (result['p50_ms'], before['p50_ms'])))
+        if result['queries'] > before['queries']:
+            regressions.append((name, '%s queries, was %s' % (result['queries'], before['queries'])))
+    return regressions
+
+
+def rebuild_search_index():
+    start = time.perf_counter()
+    get_search_backend().rebuild()
+    return time.perf_counter() - start
@@ -0,0 +1,311 @@
+import datetime
+import hashlib
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from django.views.decorators.http import condition
+
+from .routers import get_replica, get_replica_lag
+
+
+class LRUCache(BaseCache):
+    """
+    In-process cache backend that evicts the least recently used entry once
+    OPTIONS['MAX_ENTRIES'] entries are stored. Values are pickled, so cached
+    responses are never shared between requests as live objects.
+    """
+
+    def __init__(self, location, params):
+        super(LRUCache, self).__init__(params)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_live(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expiry, value = item
+        if expiry is not None and expiry <= time.time():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item
+
+    def _set(self, key, value, timeout):
+        expiry = self.get_backend_timeout(timeout)
+        self._data[key] = (expiry, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self._data.move_to_end(key)
+        while len(self._data) > self._max_entries:
+            self._data.popitem(last=False)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            if self._get_live(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            item = self._get_live(key)
+        if item is None:
+            return default
+        return pickle.loads(item[1])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._data.pop(key, None)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            return self._get_live(key) is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            item = self._get_live(key)
+            if item is None:
+                raise ValueError("Key '%s' not found" % key)
+            expiry, value = item
+            value = pickle.loads(value) + delta
+            self._data[key] = (expiry, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Tags of the data shown in the sidebar of every page.
+SIDEBAR_CACHE_TAGS = ['categories', 'calendar']
+
+EPOCH = datetime.datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def get_response_cache():
+    alias = getattr(settings, 'BLOG_RESPONSE_CACHE', 'default')
+    if not alias:
+        return None
+    return caches[alias]
+
+
+def generation_key(tag):
+    return 'blog:generation:%s' % tag
+
+
+def changed_key(tag):
+    return 'blog:changed:%s' % tag
+
+
+def get_generations(cache, tags):
+    """
+    Return the current generation of every tag. A missing counter starts
+    from the clock, so a counter lost to eviction never repeats an old value.
+    """
+    keys = [generation_key(tag) for tag in tags]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            cache.add(key, int(time.time() * 1000), None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generations(tags):
+    """
+    Move every tag to a new generation, which orphans the cached pages
+    built from the previous one.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return
+    for tag in set(tags):
+        key = generation_key(tag)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, int(time.time() * 1000), None)
+    cache.set_many(dict((changed_key(tag), time.time()) for tag in tags), None)
+
+
+def get_last_changed(cache, tags):
+    """
+    When one of the tags was last invalidated. A time that is not known
+    (never recorded or evicted) is taken to be now.
+    """
+    keys = [changed_key(tag) for tag in tags]
+    changed = cache.get_many(keys)
+    for key in keys:
+        if key not in changed:
+            cache.add(key, time.time(), None)
+            changed[key] = cache.get(key)
+    return datetime.datetime.fromtimestamp(max(changed.values()), timezone.utc)
+
+
+def invalidate(tags):
+    tags = list(tags)
+    bump_generations(tags)
+    # Bump again once the transaction commits, so a page rendered from the
+    # old rows in between is not kept under the new generation.
+    transaction.on_commit(lambda: bump_generations(tags))
+
+
+def get_next_publication(cache):
+    """
+    When the next scheduled article goes live, or None. Computed once per
+    generation of the 'articles' tag, and again once that moment passed,
+    as no save() announces a scheduled publication.
+    """
+    from .models import Article
+    key = 'blog:next_publication:%s' % get_generations(cache, ['articles'])[0]
+    next_publication = cache.get(key)
+    now = timezone.now()
+    if next_publication is None or (next_publication and next_publication <= now):
+        next_publication = Article.objects.filter(published_date__gt=now).order_by(
+            'published_date').values_list('published_date', flat=True).first() or False
+        cache.set(key, next_publication, None)
+    return next_publication or None
+
+
+def get_publication_timeout(cache):
+    """
+    Seconds until the next scheduled article goes live: lists must not be
+    cached past that moment.
+    """
+    next_publication = get_next_publication(cache)
+    timeout = get_default_timeout()
+    if next_publication:
+        timeout = min(timeout, max(0, int((next_publication - timezone.now()).total_seconds())))
+    return timeout
+
+
+def get_generation_etag(cache, tags, *parts):
+    """
+    An ETag that changes whenever one of the tags is invalidated: the
+    current generations of the tags, hashed with the given parts.
+    """
+    generations = get_generations(cache, tags)
+    return hashlib.md5(('%s|%s' % (','.join(str(generation) for generation in generations),
+        '|'.join(parts))).encode('utf-8')).hexdigest()
+
+
+def conditional_page(get_tags, get_validators):
+    """
+    Answer conditional GET requests of anonymous visitors with 304 Not
+    Modified before the view runs. Apply it inside cache_response(), which
+    answers from the validators stored with a cached page.
+
+    get_validators(request, *args, **kwargs) returns (key, last modified)
+    of the data the page is built from, read with queries much cheaper than
+    the view's own, or None to skip the validation. The ETag hashes the key
+    with the generations of the page's cache tags, which cover the sidebar;
+    Last-Modified is the later of the data's time and the last invalidation
+    of those tags.
+    """
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, '_page_validators'):
+            request._page_validators = (None, None)
+            cache = get_response_cache()
+            if (cache is not None and request.method in ('GET', 'HEAD')
+                    and not request.user.is_authenticated()):
+                data = get_validators(request, *args, **kwargs)
+                if data is not None:
+                    key, modified = data
+                    tags = list(get_tags(request, *args, **kwargs))
+                    etag = get_generation_etag(cache, tags, request.get_full_path(),
+                        request.META.get('HTTP_X_REQUESTED_WITH', ''), *[str(value) for value in key])
+                    request._page_validators = (etag, max(modified, get_last_changed(cache, tags)))
+        return request._page_validators
+
+    return condition(etag_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[0],
+        last_modified_func=lambda request, *args, **kwargs: validators(request, *args, **kwargs)[1])
+
+
+def get_default_timeout():
+    return getattr(settings, 'BLOG_RESPONSE_CACHE_TIMEOUT', 300)
+
+
+def cache_response(get_tags, expire_on_publication=False):
+    """
+    Cache the rendered GET responses of a view for anonymous visitors.
+
+    get_tags(request, *args, **kwargs) names the data the page is built
+    from; the page is keyed on the current generation of each tag, plus the
+    URL with its query string and the X-Requested-With header. Pages that
+    embed a CSRF token are stored per CSRF cookie. With
+    expire_on_publication the page expires when the next scheduled article
+    is due. Pages read from a replica are not stored until the replica had
+    time to catch up with the data (see blog.routers).
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            cache = get_response_cache()
+            if (cache is None or request.method not in ('GET', 'HEAD')
+                    or request.user.is_authenticated()):
+                return view_func(request, *args, **kwargs)
+
+            tags = list(get_tags(request, *args, **kwargs))
+            generations = get_generations(cache, tags)
+            key = 'blog:response:%s' % hashlib.md5(('%s|%s|%s|anonymous' % (
+                ','.join(str(generation) for generation in generations),
+                request.get_full_path(),
+                request.META.get('HTTP_X_REQUESTED_WITH', ''))).encode('utf-8')).hexdigest()
+            csrf_cookie = request.COOKIES.get(settings.CSRF_COOKIE_NAME)
+            csrf_key = '%s:%s' % (key, hashlib.md5(csrf_cookie.encode('utf-8')).hexdigest()) if csrf_cookie else None
+
+            cached = cache.get_many([key, csrf_key] if csrf_key else [key])
+            response = cached.get(key) or (cached.get(csrf_key) if csrf_key else None)
+            if response is not None:
+                # Validators set by conditional_page() are stored with the page.
+                return get_conditional_response(request, etag=response.get('ETag'),
+                    last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+                    response=response)
+
+            response = view_func(request, *args, **kwargs)
+            if response.status_code != 200 or response.streaming or response.cookies:
+                return response
+            if hasattr(response, 'render') and callable(response.render):
+                response = response.render()
+            if request.META.get('CSRF_COOKIE_USED'):
+                if not csrf_key:
+                    return response
+                key = csrf_key
+            if (get_replica() is not None and get_last_changed(cache, tags)
+                    > timezone.now() - datetime.timedelta(seconds=get_replica_lag())):
+                # The replica may not have the change that invalidated the
+                # previous page yet: do not keep this one.
+                return response
+            if expire_on_publication:
+                timeout = get_publication_timeout(cache)
+            else:
+                timeout = get_default_timeout()
+            cache.set(key, response, timeout)
+            return response
+        return _wrapped_view
+    return decorator
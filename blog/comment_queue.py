@@ -0,0 +1,293 @@
+"""
+Write-behind ingestion of comments.
+
+With BLOG_COMMENT_QUEUE set to the path of an SQLite file, ArticleDetail
+does not insert a posted comment: enqueue_comment() appends it to that
+journal and the request returns. A worker thread of the process (see
+start_worker) moves the journal into blog_comment every
+BLOG_COMMENT_QUEUE_INTERVAL seconds, BLOG_COMMENT_QUEUE_BATCH rows per
+bulk_create(), so a burst of comments costs the database a few large
+inserts instead of one transaction per comment.
+
+Delivery is at least once. A batch leaves the journal only after its
+insert committed, and a batch claimed by a worker that died is claimed
+again once its lease expires, so a crash between the two replays the
+batch. manage.py drain_comment_queue empties the journal, for deploys and
+for processes that run no worker.
+
+A comment that cannot be inserted, such as one for an article deleted
+since it was queued, is moved to the dead_comment table of the journal
+with the reason, so that it does not hold up the comments behind it.
+
+bulk_create() sends no post_save, so the worker invalidates the cached
+article pages itself. Queued comments are not approved and do not change
+approved_comment_count.
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .cache import invalidate
+
+logger = logging.getLogger('blog.comment_queue')
+
+# Seconds a claimed batch belongs to its worker before another one may
+# claim it again.
+CLAIM_LEASE = 60
+
+_worker = None
+_worker_lock = threading.Lock()
+_journals = {}
+_journals_lock = threading.Lock()
+
+
+def get_queue_path():
+    return getattr(settings, 'BLOG_COMMENT_QUEUE', None)
+
+
+def get_batch_size():
+    return getattr(settings, 'BLOG_COMMENT_QUEUE_BATCH', 500)
+
+
+def get_interval():
+    return getattr(settings, 'BLOG_COMMENT_QUEUE_INTERVAL', 1.0)
+
+
+class CommentJournal(object):
+    """
+    The durable queue of comments waiting for their insert, an SQLite
+    database in WAL mode shared by the processes of the site.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self.connect() as db:
+            db.execute('''CREATE TABLE IF NOT EXISTS comment (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                article_id INTEGER NOT NULL,
+                author TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_date TEXT NOT NULL,
+                claim TEXT,
+                claimed_until REAL NOT NULL DEFAULT 0)''')
+            db.execute('''CREATE TABLE IF NOT EXISTS dead_comment (
+                id INTEGER PRIMARY KEY,
+                article_id INTEGER NOT NULL,
+                author TEXT NOT NULL,
+                text TEXT NOT NULL,
+                created_date TEXT NOT NULL,
+                reason TEXT NOT NULL,
+                failed_at REAL NOT NULL)''')
+
+    def connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or getattr(self._local, 'pid', None) != os.getpid():
+            # isolation_level None: the transactions below are explicit.
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            # A comment acknowledged to its author survives a power cut.
+            db.execute('PRAGMA synchronous=FULL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def append(self, article_id, author, text, created_date):
+        self.connect().execute('INSERT INTO comment (article_id, author, text, created_date) VALUES (?, ?, ?, ?)',
+            (article_id, author, text, created_date.isoformat()))
+
+    def claim(self, limit, lease=CLAIM_LEASE):
+        """
+        Reserve the oldest limit rows that no live worker holds, and return
+        (claim, [(id, article_id, author, text, created_date)]).
+        """
+        db = self.connect()
+        claim, now = uuid.uuid4().hex, time.time()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('UPDATE comment SET claim = ?, claimed_until = ? WHERE id IN '
+                '(SELECT id FROM comment WHERE claimed_until < ? ORDER BY id LIMIT ?)',
+                (claim, now + lease, now, limit))
+            rows = db.execute('SELECT id, article_id, author, text, created_date FROM comment '
+                'WHERE claim = ? ORDER BY id', (claim,)).fetchall()
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+        return claim, [(row[0], row[1], row[2], row[3], parse_datetime(row[4])) for row in rows]
+
+    def acknowledge(self, claim):
+        self.connect().execute('DELETE FROM comment WHERE claim = ?', (claim,))
+
+    def acknowledge_rows(self, ids):
+        db = self.connect()
+        db.executemany('DELETE FROM comment WHERE id = ?', [(id,) for id in ids])
+
+    def bury(self, id, reason):
+        """
+        Move the row id to dead_comment.
+        """
+        db = self.connect()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute('INSERT OR REPLACE INTO dead_comment (id, article_id, author, text, created_date, reason, '
+                'failed_at) SELECT id, article_id, author, text, created_date, ?, ? FROM comment WHERE id = ?',
+                (reason, time.time(), id))
+            db.execute('DELETE FROM comment WHERE id = ?', (id,))
+            db.execute('COMMIT')
+        except Exception:
+            db.execute('ROLLBACK')
+            raise
+
+    def dead(self):
+        """
+        [(id, article_id, author, text, reason)] of the buried rows.
+        """
+        return self.connect().execute('SELECT id, article_id, author, text, reason FROM dead_comment '
+            'ORDER BY id').fetchall()
+
+    def release(self, claim):
+        self.connect().execute('UPDATE comment SET claim = NULL, claimed_until = 0 WHERE claim = ?', (claim,))
+
+    def __len__(self):
+        return self.connect().execute('SELECT COUNT(*) FROM comment').fetchone()[0]
+
+
+def get_journal(path=None):
+    path = path or get_queue_path()
+    with _journals_lock:
+        journal = _journals.get(path)
+        if journal is None:
+            journal = _journals[path] = CommentJournal(path)
+        return journal
+
+
+def enqueue_comment(article_id, author, text):
+    """
+    Append a validated comment to the journal and make sure a worker will
+    insert it.
+    """
+    get_journal().append(article_id, author, text, timezone.now())
+    start_worker()
+
+
+def deliver_batch(journal, batch_size):
+    """
+    Insert one batch of the journal into blog_comment. Return the number of
+    rows taken off the journal, inserted or buried, and of comments
+    inserted.
+    """
+    from .models import Article, Comment
+    claim, rows = journal.claim(batch_size)
+    if not rows:
+        return 0, 0
+    taken = len(rows)
+    try:
+        existing = set(Article.objects.filter(pk__in=set(row[1] for row in rows)).values_list('id', flat=True))
+        for row in rows:
+            if row[1] not in existing:
+                logger.warning('Dropping queued comment %s: article %s does not exist.', row[0], row[1])
+                journal.bury(row[0], 'article %s does not exist' % row[1])
+        rows = [row for row in rows if row[1] in existing]
+        comments = [(row[0], Comment(article_id=row[1], author=row[2], text=row[3], created_date=row[4]))
+            for row in rows]
+        try:
+            with transaction.atomic():
+                Comment.objects.bulk_create([comment for id, comment in comments])
+        except (IntegrityError, DataError):
+            # One bad row fails the whole insert: find it row by row.
+            inserted = []
+            for id, comment in comments:
+                try:
+                    with transaction.atomic():
+                        comment.save(force_insert=True)
+                except (IntegrityError, DataError) as error:
+                    logger.warning('Dropping queued comment %s: %s', id, error)
+                    journal.bury(id, str(error))
+                else:
+                    # Off the journal as soon as it is in, should a later
+                    # row fail differently.
+                    journal.acknowledge_rows([id])
+                    inserted.append(comment)
+            comments = [(None, comment) for comment in inserted]
+    except Exception:
+        # Let the next attempt have the batch now rather than after the lease.
+        journal.release(claim)
+        raise
+    journal.acknowledge(claim)
+    invalidate(['article:%s' % article_id for article_id in sorted(set(comment.article_id
+        for id, comment in comments))])
+    return taken, len(comments)
+
+
+def drain(journal=None, batch_size=None):
+    """
+    Deliver the journal until it is empty. Return the number of comments
+    inserted.
+    """
+    journal = journal or get_journal()
+    batch_size = batch_size or get_batch_size()
+    delivered = 0
+    while True:
+        taken, inserted = deliver_batch(journal, batch_size)
+        if not taken:
+            return delivered
+        delivered += inserted
+
+
+class CommentQueueWorker(threading.Thread):
+    def __init__(self, journal, interval, batch_size):
+        super(CommentQueueWorker, self).__init__(name='blog-comment-queue', daemon=True)
+        self.journal = journal
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pid = os.getpid()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                drain(self.journal, self.batch_size)
+            except Exception:
+                # The journal keeps the comments until the next round.
+                logger.exception('Delivering the queued comments failed.')
+            finally:
+                connection.close()
+
+    def stop(self):
+        self.stopped.set()
+
+
+def start_worker():
+    """
+    Start the worker thread of this process, once per process; nothing
+    without BLOG_COMMENT_QUEUE.
+    """
+    global _worker
+    if not get_queue_path():
+        return None
+    with _worker_lock:
+        # A forked child does not inherit the thread.
+        if _worker is None or _worker.pid != os.getpid() or not _worker.is_alive():
+            _worker = CommentQueueWorker(get_journal(), get_interval(), get_batch_size())
+            _worker.start()
+        return _worker
+
+
+def stop_worker():
+    global _worker
+    with _worker_lock:
+        worker, _worker = _worker, None
+    if worker is not None:
+        worker.stop()
+        worker.join()
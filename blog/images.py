@@ -0,0 +1,184 @@
+"""
+Resized, re-encoded copies of Article.image for the templates' srcset.
+
+Every uploaded image gets one derivative per size in DERIVATIVE_SIZES, in
+WebP (when Pillow can write it) and JPEG. They are written next to the
+original under derivatives/ by a pool of BLOG_IMAGE_WORKERS threads, then
+Article.image_widths records their widths. With BLOG_IMAGE_WORKERS = 0 the
+derivatives are built in the calling thread.
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+# Size name: maximum width in pixels. Smaller originals are not enlarged.
+DERIVATIVE_SIZES = OrderedDict([
+    ('thumb', 320),
+    ('card', 750),
+    ('full', 1600),
+])
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+
+logger = logging.getLogger('blog.images')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def derivative_formats():
+    """
+    The formats written for every size, preferred first: (extension, Pillow
+    format, MIME type).
+    """
+    Image.init()
+    formats = []
+    if 'WEBP' in Image.SAVE:
+        formats.append(('webp', 'WEBP', 'image/webp'))
+    formats.append(('jpg', 'JPEG', 'image/jpeg'))
+    return formats
+
+
+def derivative_name(name, size, extension):
+    """
+    'blog/images/2017/09/26/photo.png' -> 'derivatives/blog/images/2017/09/26/photo.card.webp'
+    """
+    return 'derivatives/%s.%s.%s' % (os.path.splitext(name)[0], size, extension)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=settings.BLOG_IMAGE_WORKERS,
+                    thread_name_prefix='blog-images')
+    return _executor
+
+
+def run_in_background(function, *args):
+    if not getattr(settings, 'BLOG_IMAGE_WORKERS', 0):
+        return function(*args)
+
+    def task():
+        try:
+            function(*args)
+        except Exception:
+            # Nobody waits on the future: the error would go unseen.
+            logger.exception('%s%r failed.', function.__name__, args)
+        finally:
+            # Worker threads open their own connection; do not leak it.
+            connection.close()
+    return get_executor().submit(task)
+
+
+def open_image(name):
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        image.load()
+    exif_transpose = getattr(ImageOps, 'exif_transpose', None)
+    if exif_transpose is not None:
+        # Phone photos are stored sideways with an EXIF rotation.
+        image = exif_transpose(image)
+    return image
+
+
+def encode(image, pillow_format):
+    if pillow_format == 'JPEG':
+        if image.mode != 'RGB':
+            background = Image.new('RGB', image.size, (255, 255, 255))
+            rgba = image.convert('RGBA')
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        options = {'quality': JPEG_QUALITY, 'optimize': True, 'progressive': True}
+    else:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        options = {'quality': WEBP_QUALITY, 'method': 4}
+    output = BytesIO()
+    image.save(output, pillow_format, **options)
+    return output.getvalue()
+
+
+def build_derivatives(name):
+    """
+    Write every derivative of the image stored as name and return their
+    widths, in the order of DERIVATIVE_SIZES.
+    """
+    image = open_image(name)
+    widths = []
+    for size, max_width in DERIVATIVE_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((max_width, max_width * 4), Image.LANCZOS)
+        widths.append(resized.size[0])
+        for extension, pillow_format, mime_type in derivative_formats():
+            path = derivative_name(name, size, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+            default_storage.save(path, ContentFile(encode(resized, pillow_format)))
+    return widths
+
+
+def delete_derivatives(name):
+    for size in DERIVATIVE_SIZES:
+        for extension in ('webp', 'jpg'):
+            path = derivative_name(name, size, extension)
+            if default_storage.exists(path):
+                default_storage.delete(path)
+
+
+def process_article_image(article_id, name):
+    """
+    Build the derivatives of an article's new image and record their widths
+    on the article. The derivatives of the image it replaced may be shared
+    with other articles; gc_media deletes them with the image.
+    """
+    from .cache import invalidate
+    from .models import Article, article_cache_tags
+    if not name:
+        return
+    widths = build_derivatives(name)
+    # Only if the article still shows this image; update() so that the
+    # form's save is not replayed.
+    if Article.objects.filter(pk=article_id, image=name).update(
+            image_widths=','.join(str(width) for width in widths), updated_at=timezone.now()):
+        article = Article.objects.only('id', 'category_id', 'author_id', 'published_date').get(pk=article_id)
+        invalidate(article_cache_tags(article))
+
+
+def schedule_article_image(article):
+    """
+    Queue process_article_image() once the current transaction commits.
+    """
+    article_id, name = article.pk, article.image.name if article.image else ''
+    transaction.on_commit(lambda: run_in_background(process_article_image, article_id, name))
+
+
+def image_sources(article):
+    """
+    [(MIME type, srcset)] of the derivatives of the article's image, the
+    preferred format first; empty until the derivatives exist.
+    """
+    if not article.image or not article.image_widths:
+        return []
+    # A small original gives several derivatives of the same width; a
+    # srcset must not repeat a width.
+    sizes = OrderedDict()
+    for size, width in zip(DERIVATIVE_SIZES, article.image_widths.split(',')):
+        sizes.setdefault(width, size)
+    sources = []
+    for extension, pillow_format, mime_type in derivative_formats():
+        srcset = ', '.join('%s %sw' % (default_storage.url(derivative_name(article.image.name, size, extension)), width)
+            for width, size in sizes.items())
+        sources.append((mime_type, srcset))
+    return sources
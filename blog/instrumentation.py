@@ -0,0 +1,159 @@
+"""
+Where the time of every request goes.
+
+RequestMetricsMiddleware writes one JSON line per request to the
+'blog.access' logger: the view name, status, duration, number and total
+time of the SQL queries, template render time and response size. A request
+slower than BLOG_SLOW_REQUEST_MS also goes to the 'blog.slow' logger with
+every query it ran and its duration.
+
+Queries are timed by a cursor wrapper installed on each database connection
+as it opens (see BlogConfig.ready), templates by the InstrumentedTemplates
+backend of TEMPLATES. Both only add two clock readings and an append per
+query or page, and do nothing outside a request.
+"""
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db.backends import utils
+from django.template.backends.django import DjangoTemplates, Template
+
+access_logger = logging.getLogger('blog.access')
+slow_logger = logging.getLogger('blog.slow')
+
+_state = threading.local()
+
+
+class RequestMetrics(object):
+    def __init__(self):
+        # (alias, sql, params, seconds) of every query.
+        self.queries = []
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+
+def get_metrics():
+    """
+    The metrics of the request the current thread handles, or None.
+    """
+    return getattr(_state, 'metrics', None)
+
+
+class QueryTimingMixin(object):
+    def _record(self, method, sql, params):
+        metrics = get_metrics()
+        if metrics is None:
+            return method(sql, params)
+        start = time.perf_counter()
+        try:
+            return method(sql, params)
+        finally:
+            duration = time.perf_counter() - start
+            metrics.sql_time += duration
+            metrics.queries.append((self.db.alias, sql, params, duration))
+
+    def execute(self, sql, params=None):
+        return self._record(super(QueryTimingMixin, self).execute, sql, params)
+
+    def executemany(self, sql, param_list):
+        return self._record(super(QueryTimingMixin, self).executemany, sql, param_list)
+
+
+class TimedCursorWrapper(QueryTimingMixin, utils.CursorWrapper):
+    pass
+
+
+class TimedCursorDebugWrapper(QueryTimingMixin, utils.CursorDebugWrapper):
+    pass
+
+
+def instrument_connection(sender, connection, **kwargs):
+    """
+    connection_created receiver: time the queries of the connection.
+    """
+    if getattr(connection, 'queries_timed', False):
+        return
+    connection.make_cursor = lambda cursor: TimedCursorWrapper(cursor, connection)
+    connection.make_debug_cursor = lambda cursor: TimedCursorDebugWrapper(cursor, connection)
+    connection.queries_timed = True
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = get_metrics()
+        if metrics is None:
+            return super(TimedTemplate, self).render(context, request)
+        # Templates rendered by a template tag are part of the outer page.
+        metrics.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super(TimedTemplate, self).render(context, request)
+        finally:
+            metrics.template_depth -= 1
+            if not metrics.template_depth:
+                metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    """
+    The Django template backend, timing the templates it renders.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super(InstrumentedTemplates, self).get_template(template_name)
+        return TimedTemplate(template.template, self)
+
+
+def get_slow_request_threshold():
+    return getattr(settings, 'BLOG_SLOW_REQUEST_MS', 500) / 1000.0
+
+
+def response_size(response):
+    if response.has_header('Content-Length'):
+        return int(response['Content-Length'])
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+class RequestMetricsMiddleware(object):
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = _state.metrics = RequestMetrics()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.metrics = None
+        duration = time.perf_counter() - start
+        self.log(request, response, metrics, duration)
+        return response
+
+    def log(self, request, response, metrics, duration):
+        match = getattr(request, 'resolver_match', None)
+        record = {
+            'time': round(time.time(), 3),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'duration_ms': round(duration * 1000, 2),
+            'queries': len(metrics.queries),
+            'sql_ms': round(metrics.sql_time * 1000, 2),
+            'template_ms': round(metrics.template_time * 1000, 2),
+            'bytes': response_size(response),
+        }
+        access_logger.info(json.dumps(record))
+        if duration >= get_slow_request_threshold():
+            record['sql'] = [{'db': alias, 'sql': sql, 'params': repr(params), 'ms': round(seconds * 1000, 2)}
+                for alias, sql, params, seconds in metrics.queries]
+            slow_logger.warning(json.dumps(record))
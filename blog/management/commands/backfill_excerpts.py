@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Article, make_excerpt
+
+
+class Command(BaseCommand):
+    help = 'Compute Article.excerpt for articles saved before the column existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all',
+            help='Recompute every excerpt, not only the empty ones.')
+
+    def handle(self, *args, **options):
+        articles = Article.objects.only('id', 'text')
+        if not options['all']:
+            articles = articles.filter(excerpt='')
+        updated = 0
+        for article in articles.iterator():
+            # update() rather than save(): only the excerpt column is written.
+            Article.objects.filter(pk=article.pk).update(excerpt=make_excerpt(article.text))
+            updated += 1
+        self.stdout.write('Updated %s article excerpts.' % updated)
@@ -0,0 +1,135 @@
+import json
+import logging
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from blog.benchmarks import compare, get_scenarios, rebuild_search_index, run_benchmarks, seed_corpus
+from blog.models import Article, Category, Comment
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = ('Seed a test database with a generated corpus and measure the latency, queries and '
+        'allocations of the list, search and detail pages and of the sidebar tags.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--articles', type=int, default=100000)
+        parser.add_argument('--comments', type=int, default=1000000)
+        parser.add_argument('--categories', type=int, default=50)
+        parser.add_argument('--authors', type=int, default=20)
+        parser.add_argument('--hot-comments', type=int, default=2000, dest='hot_comments',
+            help='Comments of the article whose detail page is measured.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--allocation-iterations', type=int, default=5, dest='allocation_iterations',
+            help='Extra requests run under tracemalloc, which slows them down too much to time them.')
+        parser.add_argument('--only', action='append', help='Measure this scenario only; repeatable.')
+        parser.add_argument('--cache', action='store_true',
+            help='Keep the response cache on; by default every request renders its page.')
+        parser.add_argument('--keepdb', action='store_true',
+            help='Keep the test database, and its corpus, for the next run.')
+        parser.add_argument('--output', help='Write the results as JSON to this file, - for stdout.')
+        parser.add_argument('--compare', help='JSON results of a previous run to compare with.')
+        parser.add_argument('--tolerance', type=float, default=0.25,
+            help='Fraction by which a median may grow before --compare fails (0.25).')
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options['keepdb'])
+        try:
+            report = self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=options['keepdb'])
+
+        self.print_table(report['results'], baseline)
+        if options['output']:
+            data = json.dumps(report, indent=2, sort_keys=True)
+            if options['output'] == '-':
+                self.stdout.write(data)
+            else:
+                with open(options['output'], 'w') as output:
+                    output.write(data + '\n')
+        if baseline is not None:
+            regressions = compare(report['results'], baseline, options['tolerance'])
+            if regressions:
+                raise CommandError('Regressions:\n%s' % '\n'.join(
+                    '  %s: %s' % regression for regression in regressions))
+
+    def run(self, options):
+        log = lambda message: self.stderr.write('  %s' % message)
+        start = time.perf_counter()
+        if Article.objects.exists():
+            hot = Article.objects.filter(published_date__isnull=False).select_related(
+                'category', 'author').latest('created_date')
+            hot = hot.pk, hot.category.urlstext, hot.author.username
+            self.stderr.write('Reusing the corpus of the kept test database.')
+        else:
+            self.stderr.write('Seeding %(articles)s articles, %(comments)s comments...' % options)
+            hot = seed_corpus(articles=options['articles'], comments=options['comments'],
+                categories=options['categories'], authors=options['authors'],
+                hot_comments=options['hot_comments'], seed=options['seed'], log=log)
+        seed_time = time.perf_counter() - start
+        index_time = rebuild_search_index()
+
+        hosts = list(settings.ALLOWED_HOSTS) + ['testserver']
+        cache_settings = {} if options['cache'] else {'BLOG_RESPONSE_CACHE': None}
+        # The access log would time the disk, not the blog.
+        logging.disable(logging.CRITICAL)
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=hosts, **cache_settings):
+                results = run_benchmarks(get_scenarios(*hot), iterations=options['iterations'],
+                    warmup=options['warmup'], allocation_iterations=options['allocation_iterations'],
+                    only=options['only'])
+        finally:
+            logging.disable(logging.NOTSET)
+
+        return {
+            'meta': {
+                'revision': git_revision(),
+                'time': round(time.time()),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'articles': Article.objects.count(),
+                'published_articles': Article.objects.filter(published_date__isnull=False).count(),
+                'comments': Comment.objects.count(),
+                'categories': Category.objects.count(),
+                'authors': User.objects.filter(username__startswith='author').count(),
+                'response_cache': options['cache'],
+                'seed_s': round(seed_time, 3),
+                'search_index_s': round(index_time, 3),
+            },
+            'results': results,
+        }
+
+    def print_table(self, results, baseline):
+        self.stdout.write('%-18s %9s %9s %9s %9s %8s %10s' % (
+            'scenario', 'mean ms', 'p50 ms', 'p90 ms', 'p99 ms', 'queries', 'alloc KB'))
+        for name, result in results.items():
+            line = '%-18s %9.2f %9.2f %9.2f %9.2f %8s %10s' % (name, result['mean_ms'], result['p50_ms'],
+                result['p90_ms'], result['p99_ms'], result['queries'], result['peak_alloc_kb'])
+            before = (baseline or {}).get(name)
+            if before and before['p50_ms']:
+                line += '  p50 %+.0f%%' % (100.0 * (result['p50_ms'] - before['p50_ms']) / before['p50_ms'])
+            self.stdout.write(line)
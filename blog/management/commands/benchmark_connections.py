@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.utils import load_backend
+
+from blog.benchmarks import percentile
+from myblog.dbpool import PooledDatabaseWrapperMixin, get_pool
+
+
+def with_connect_delay(wrapper_class, delay):
+    """
+    wrapper_class, sleeping delay seconds whenever it opens a connection to
+    the server, as the network and authentication round trips would.
+    """
+    method = 'new_connection' if issubclass(wrapper_class, PooledDatabaseWrapperMixin) else 'get_new_connection'
+    original = getattr(wrapper_class, method)
+
+    def connect(self, conn_params):
+        time.sleep(delay)
+        return original(self, conn_params)
+    return type(wrapper_class.__name__, (wrapper_class,), {method: connect})
+
+
+class Command(BaseCommand):
+    help = ('Measure the latency of a request that connects, runs a few queries and closes the '
+        'connection, with the plain and the pooled (myblog.dbpool) backend.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default='default',
+            help='Database whose server is measured; an in-memory SQLite database is replaced '
+                 'by a temporary file.')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--queries', type=int, default=3, help='Queries per request.')
+        parser.add_argument('--connect-delay', type=float, default=0, dest='connect_delay',
+            help='Milliseconds added to every new connection, to stand for a remote server '
+                 'when measuring against SQLite.')
+
+    def handle(self, *args, **options):
+        settings_dict = dict(connections.databases[options['database']])
+        vendor = settings_dict['ENGINE'].rsplit('.', 1)[-1]
+        if vendor not in ('mysql', 'sqlite3'):
+            raise CommandError('Only the mysql and sqlite3 backends have a pooled version.')
+        temporary = None
+        if vendor == 'sqlite3' and (settings_dict['NAME'] in ('', ':memory:')
+                or 'mode=memory' in settings_dict['NAME']):
+            fd, temporary = tempfile.mkstemp(suffix='.sqlite3')
+            os.close(fd)
+            settings_dict['NAME'] = temporary
+
+        try:
+            results = []
+            for label, engine in (('plain', 'django.db.backends.%s' % vendor),
+                    ('pooled', 'myblog.dbpool.%s' % vendor)):
+                wrapper_class = with_connect_delay(load_backend(engine).DatabaseWrapper,
+                    options['connect_delay'] / 1000.0)
+                timings = self.measure(wrapper_class(dict(settings_dict, ENGINE=engine), alias='benchmark'),
+                    options['requests'], options['queries'])
+                results.append(sum(timings) / len(timings))
+                self.stdout.write('%-7s mean %.3f ms, median %.3f ms, p95 %.3f ms over %s requests' % (
+                    label, results[-1] * 1000, percentile(timings, 0.5) * 1000,
+                    percentile(timings, 0.95) * 1000, len(timings)))
+            get_pool('benchmark', settings_dict).close()
+            plain, pooled = results
+            self.stdout.write('Pooling saves %.3f ms per request (%.0f%%).' % (
+                (plain - pooled) * 1000, 100 * (plain - pooled) / plain if plain else 0))
+        finally:
+            if temporary:
+                os.remove(temporary)
+
+    def measure(self, wrapper, requests, queries):
+        timings = []
+        # One request without timing: the pool starts empty.
+        for i in range(requests + 1):
+            start = time.perf_counter()
+            with wrapper.cursor() as cursor:
+                for j in range(queries):
+                    cursor.execute('SELECT 1')
+                    cursor.fetchall()
+            wrapper.close()
+            timings.append(time.perf_counter() - start)
+        return timings[1:]
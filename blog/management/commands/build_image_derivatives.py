@@ -0,0 +1,46 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from blog.images import process_article_image
+from blog.models import Article
+
+
+class Command(BaseCommand):
+    help = 'Build the resized derivatives of the article images saved before the pipeline existed.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all',
+            help='Rebuild the derivatives of every image, not only the missing ones.')
+        parser.add_argument('--workers', type=int, default=4,
+            help='Number of images resized in parallel.')
+
+    def handle(self, *args, **options):
+        articles = Article.objects.exclude(image='')
+        if not options['all']:
+            articles = articles.filter(image_widths='')
+        images = list(articles.values_list('id', 'image'))
+
+        def process(row):
+            try:
+                process_article_image(*row)
+            except (IOError, OSError) as error:
+                return 'Article %s: %s' % (row[0], error)
+
+        def process_in_thread(row):
+            try:
+                return process(row)
+            finally:
+                connection.close()
+
+        if options['workers'] > 1:
+            with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+                errors = list(executor.map(process_in_thread, images))
+        else:
+            errors = [process(row) for row in images]
+        errors = [error for error in errors if error]
+        for error in errors:
+            self.stderr.write(error)
+        self.stdout.write('Built derivatives for %s article images, %s failed.' % (
+            len(images) - len(errors), len(errors)))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.comment_queue import drain, get_journal, get_queue_path
+
+
+class Command(BaseCommand):
+    help = 'Insert every comment waiting in the BLOG_COMMENT_QUEUE journal.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, dest='batch_size',
+            help='Comments per insert; BLOG_COMMENT_QUEUE_BATCH by default.')
+
+    def handle(self, *args, **options):
+        if not get_queue_path():
+            raise CommandError('BLOG_COMMENT_QUEUE is not set.')
+        journal = get_journal()
+        delivered = drain(journal, options['batch_size'])
+        self.stdout.write('Inserted %s queued comments, %s left.' % (delivered, len(journal)))
+        dead = journal.dead()
+        if dead:
+            self.stdout.write('%s comments could not be inserted, see the dead_comment table of %s.' % (
+                len(dead), journal.path))
@@ -0,0 +1,68 @@
+import datetime
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog.images import delete_derivatives
+from blog.models import ArticleMedia
+from blog.storage import CONTENT_DIRECTORY
+
+
+def walk(storage, directory):
+    """
+    Every file name under directory, recursively.
+    """
+    if not storage.exists(directory):
+        return
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield '%s/%s' % (directory, name)
+    for name in directories:
+        for path in walk(storage, '%s/%s' % (directory, name)):
+            yield path
+
+
+def original_name(name):
+    """
+    The upload a CKEditor thumbnail was made from: 'a/b_thumb.jpg' -> 'a/b.jpg'.
+    """
+    root, extension = os.path.splitext(name)
+    if root.endswith('_thumb'):
+        return root[:-len('_thumb')] + extension
+    return name
+
+
+class Command(BaseCommand):
+    help = ('Delete the uploaded media that no article uses any more, with their '
+        'thumbnails and derivatives.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-hours', type=float, default=24, dest='grace_hours',
+            help='Keep files uploaded or re-uploaded more recently than this: the '
+                 'article using them may not be saved yet.')
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+            help='List the files that would be deleted without deleting them.')
+
+    def handle(self, *args, **options):
+        referenced = set(ArticleMedia.objects.values_list('name', flat=True))
+        cutoff = timezone.now() - datetime.timedelta(hours=options['grace_hours'])
+        directories = [CONTENT_DIRECTORY, settings.CKEDITOR_UPLOAD_PATH.rstrip('/'), 'blog/images']
+        deleted = 0
+        for directory in directories:
+            for name in list(walk(default_storage, directory)):
+                if original_name(name) in referenced or os.path.basename(name).startswith('.'):
+                    continue
+                if default_storage.get_modified_time(name) > cutoff:
+                    continue
+                self.stdout.write('Unused: %s' % name)
+                if not options['dry_run']:
+                    default_storage.delete(name)
+                    delete_derivatives(name)
+                deleted += 1
+        if options['dry_run']:
+            self.stdout.write('%s unused media files.' % deleted)
+        else:
+            self.stdout.write('Deleted %s unused media files.' % deleted)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from blog.cache import invalidate
+from blog.models import Article, Comment, article_cache_tags
+
+
+class Command(BaseCommand):
+    help = 'Recount Article.approved_comment_count from the approved comments and fix any drift.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run',
+            help='Report the articles whose count is wrong without fixing them.')
+
+    def handle(self, *args, **options):
+        counts = dict(Comment.objects.filter(approved_comment=True).values_list(
+            'article_id').annotate(Count('id')).order_by())
+        fixed = 0
+        articles = Article.objects.only('id', 'category_id', 'author_id', 'published_date', 'approved_comment_count')
+        for article in articles.iterator():
+            count = counts.get(article.pk, 0)
+            if article.approved_comment_count == count:
+                continue
+            self.stdout.write('Article %s: %s approved comments, stored %s.' % (
+                article.pk, count, article.approved_comment_count))
+            if not options['dry_run']:
+                # update() rather than save(): only the counter column is written.
+                Article.objects.filter(pk=article.pk).update(approved_comment_count=count)
+                invalidate(article_cache_tags(article))
+            fixed += 1
+        if options['dry_run']:
+            self.stdout.write('%s article comment counts are wrong.' % fixed)
+        else:
+            self.stdout.write('Fixed %s article comment counts.' % fixed)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:46
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def count_published_days(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    PublishedDay = apps.get_model('blog', 'PublishedDay')
+    days = Counter(timezone.localtime(published_date).date() for published_date in
+                   Article.objects.filter(published_date__isnull=False).values_list(
+                       'published_date', flat=True).iterator())
+    PublishedDay.objects.bulk_create(
+        PublishedDay(day=day, articles=articles) for day, articles in days.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0008_article_excerpt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PublishedDay',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('articles', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_published_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:49
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0009_publishedday'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='category',
+            name='urlstext',
+            field=models.CharField(db_index=True, max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['published_date', 'title'], name='blog_articl_publish_1205b2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['category', 'published_date'], name='blog_articl_categor_87950c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='article',
+            index=models.Index(fields=['author', 'published_date', 'created_date'], name='blog_articl_author__828cd2_idx'),
+        ),
+    ]
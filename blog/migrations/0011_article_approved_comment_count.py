@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:51
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_approved_comments(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    Comment = apps.get_model('blog', 'Comment')
+    counts = Comment.objects.filter(approved_comment=True).values_list(
+        'article_id').annotate(Count('id')).order_by()
+    for article_id, count in counts:
+        Article.objects.filter(pk=article_id).update(approved_comment_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='approved_comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_approved_comments, migrations.RunPython.noop),
+    ]
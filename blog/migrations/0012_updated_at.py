@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:56
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_updated_at(apps, schema_editor):
+    # The best known edit time of existing rows, rather than the migration time.
+    Article = apps.get_model('blog', 'Article')
+    Comment = apps.get_model('blog', 'Comment')
+    Article.objects.update(updated_at=Coalesce('published_date', 'created_date'))
+    Comment.objects.update(updated_at=models.F('created_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0011_article_approved_comment_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 03:58
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='image_widths',
+            field=models.CharField(blank=True, editable=False, max_length=50),
+        ),
+    ]
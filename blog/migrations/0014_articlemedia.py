@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-18 04:01
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from blog.storage import media_names
+
+
+def record_article_media(apps, schema_editor):
+    Article = apps.get_model('blog', 'Article')
+    ArticleMedia = apps.get_model('blog', 'ArticleMedia')
+    for article_id, image, text in Article.objects.values_list('id', 'image', 'text').iterator():
+        ArticleMedia.objects.bulk_create(ArticleMedia(article_id=article_id, name=name)
+            for name in media_names(image, text))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0013_article_image_widths'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArticleMedia',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(db_index=True, max_length=255)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='media', to='blog.Article')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='articlemedia',
+            unique_together=set([('article', 'name')]),
+        ),
+        migrations.RunPython(record_article_media, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,30 @@
 import datetime
+from html import unescape
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.urls import reverse
+from django.utils.html import strip_tags
+from django.template.defaultfilters import linebreaksbr, truncatechars
 from ckeditor_uploader.fields import RichTextUploadingField
 
+from .cache import invalidate
+from .storage import media_names
+
+EXCERPT_LENGTH = 400
+
+def make_excerpt(text):
+    """
+    Plain-text preview of the CKEditor body shown on the list pages.
+    """
+    return truncatechars(linebreaksbr(strip_tags(unescape(text))), EXCERPT_LENGTH)
+
 class Category(models.Model):
     title = models.CharField(max_length=200)
     text = models.TextField()
-    urlstext = models.CharField(max_length=20)
+    urlstext = models.CharField(max_length=20, db_index=True)
 
     def __str__(self):
         return self.title
@@ -21,6 +37,54 @@ class Article(models.Model):
     created_date = models.DateTimeField(default=timezone.now)
     published_date = models.DateTimeField(blank=True, null=True)
     image = models.ImageField(blank=True, upload_to='blog/images/%Y/%m/%d')
+    # Widths of the derivatives of image, see blog.images.
+    image_widths = models.CharField(max_length=50, blank=True, editable=False)
+    excerpt = models.TextField(blank=True, editable=False)
+    # Maintained by the Comment hooks with F() updates; see comment_saving.
+    approved_comment_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        # One index per access path of the list pages: the front page and
+        # the date pages, the category pages, and the author pages together
+        # with the drafts of an author (published_date IS NULL, then the
+        # creation order).
+        indexes = [
+            models.Index(fields=['published_date', 'title']),
+            models.Index(fields=['category', 'published_date']),
+            models.Index(fields=['author', 'published_date', 'created_date']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Article, cls).from_db(db, field_names, values)
+        # The cache invalidation compares against the loaded values.
+        instance._loaded_values = dict(zip(field_names, values))
+        instance._row_pk = instance.pk
+        return instance
+
+    def save(self, *args, **kwargs):
+        self.excerpt = make_excerpt(self.text)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None:
+            # Never write back the comment counter held in memory: comments
+            # may have been approved since this instance was loaded. Only
+            # for the row it was loaded from or saved to, so that a copy
+            # (pk = None) or a deleted article is inserted as usual.
+            if self.pk is None:
+                # A new row has no comments yet, whatever a copied instance
+                # held.
+                self.approved_comment_count = 0
+            elif self.pk == getattr(self, '_row_pk', None):
+                deferred = self.get_deferred_fields()
+                kwargs['update_fields'] = [field.attname for field in self._meta.concrete_fields
+                    if not field.primary_key and field.attname not in deferred
+                    and field.attname != 'approved_comment_count']
+        elif 'text' in update_fields and 'excerpt' not in update_fields:
+            # The excerpt is derived from the text.
+            kwargs['update_fields'] = list(update_fields) + ['excerpt']
+        super(Article, self).save(*args, **kwargs)
+        self._row_pk = self.pk
 
     def publish(self):
         self.published_date = timezone.now()
@@ -52,6 +116,20 @@ class Comment(models.Model):
     text = models.TextField()
     created_date = models.DateTimeField(default=timezone.now)
     approved_comment = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # The comment pages of an article, oldest first (see
+        # views.get_comments_page).
+        indexes = [
+            models.Index(fields=['article', 'created_date']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Comment, cls).from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
 
     def approve(self):
         self.approved_comment = True
@@ -59,3 +137,216 @@ class Comment(models.Model):
 
     def __str__(self):
         return self.text
+
+
+class ArticleMedia(models.Model):
+    """
+    A media file used by an article, as its image or inside its body.
+    Uploads are shared between articles (see blog.storage), so a file may
+    only be deleted once no row names it; the gc_media command does that.
+    """
+    article = models.ForeignKey('blog.Article', related_name='media')
+    name = models.CharField(max_length=255, db_index=True)
+
+    class Meta:
+        unique_together = ('article', 'name')
+
+    def __str__(self):
+        return self.name
+
+
+def published_day(published_date):
+    if published_date is None:
+        return None
+    return timezone.localtime(published_date).date()
+
+
+class PublishedDay(models.Model):
+    """
+    Number of published articles per local calendar day. Backs the archive
+    calendar so the sidebar never has to scan Article.
+    """
+    day = models.DateField(unique=True)
+    articles = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return '%s: %s' % (self.day, self.articles)
+
+    @classmethod
+    def move(cls, old_date, new_date):
+        """
+        Account for an article whose publication moved from old_date to
+        new_date; either may be None (draft).
+        """
+        old_day, new_day = published_day(old_date), published_day(new_date)
+        if old_day == new_day:
+            return
+        # The calendar only shows which days have articles, so it is
+        # refreshed when a day appears or disappears, not on every count.
+        changed = False
+        if old_day is not None:
+            cls.objects.filter(day=old_day).update(articles=models.F('articles') - 1)
+            changed = cls.objects.filter(day=old_day, articles__lte=0).delete()[0] > 0
+        if new_day is not None:
+            if not cls.objects.filter(day=new_day).update(articles=models.F('articles') + 1):
+                changed = cls.objects.get_or_create(day=new_day)[1] or changed
+                cls.objects.filter(day=new_day).update(articles=models.F('articles') + 1)
+        if changed:
+            invalidate(['calendar'])
+
+    @classmethod
+    def published_days(cls, first, last):
+        """
+        The days from first to last with a published article, and when the
+        first article of today goes live if it is still scheduled, or None.
+        A day counts from its first publication: today is left out while
+        its articles are only scheduled.
+        """
+        now = timezone.now()
+        today = timezone.localtime(now).date()
+        days = list(cls.objects.filter(day__gte=first, day__lte=min(last, today)).order_by('day').values_list(
+            'day', flat=True))
+        goes_live = None
+        if days and days[-1] == today:
+            start, end = (timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+                for day in (today, today + datetime.timedelta(days=1)))
+            first_publication = Article.objects.filter(published_date__gte=start,
+                published_date__lt=end).aggregate(first=models.Min('published_date'))['first']
+            if first_publication is None or first_publication > now:
+                days.pop()
+                goes_live = first_publication
+        return days, goes_live
+
+
+def article_list_tags(category_ids, author_ids, published_dates):
+    """
+    Cache tags of the list pages showing articles with the given
+    categories, authors and publication dates (see blog.cache).
+    """
+    from django.contrib.auth.models import User
+    published_dates = [date for date in published_dates if date is not None]
+    if not published_dates:
+        # Drafts appear on no cached list.
+        return []
+    tags = ['articles']
+    tags.extend('category:%s' % urlstext for urlstext in
+        Category.objects.filter(pk__in=set(category_ids)).values_list('urlstext', flat=True))
+    tags.extend('author:%s' % username for username in
+        User.objects.filter(pk__in=set(author_ids)).values_list('username', flat=True))
+    tags.extend('date:%s' % timezone.localtime(date).date().isoformat() for date in published_dates)
+    return tags
+
+
+def article_cache_tags(article):
+    """
+    Cache tags of every page the article is on, before and after the change.
+    """
+    loaded = getattr(article, '_loaded_values', {})
+    return ['article:%s' % article.pk] + article_list_tags(
+        [article.category_id, loaded.get('category_id', article.category_id)],
+        [article.author_id, loaded.get('author_id', article.author_id)],
+        [article.published_date, loaded.get('published_date')])
+
+
+def update_article_media(article):
+    """
+    Make the ArticleMedia rows of the article match its image and body.
+    """
+    names = media_names(article.image.name if article.image else '', article.text)
+    stored = set(ArticleMedia.objects.filter(article=article).values_list('name', flat=True))
+    if stored - names:
+        ArticleMedia.objects.filter(article=article, name__in=stored - names).delete()
+    if names - stored:
+        ArticleMedia.objects.bulk_create(ArticleMedia(article=article, name=name) for name in names - stored)
+
+
+@receiver(post_save, sender=Article)
+def article_saved(sender, instance, created, **kwargs):
+    from .search import get_search_backend
+    transaction.on_commit(lambda: get_search_backend().index_article(instance))
+    invalidate(article_cache_tags(instance))
+    loaded = getattr(instance, '_loaded_values', {})
+    if created or 'published_date' in loaded:
+        # A copy of a loaded article is a new publication.
+        PublishedDay.move(None if created else loaded.get('published_date'), instance.published_date)
+    update_fields = kwargs.get('update_fields')
+    if update_fields is None or 'text' in update_fields or 'image' in update_fields:
+        update_article_media(instance)
+    instance._loaded_values = {'category_id': instance.category_id,
+        'author_id': instance.author_id, 'published_date': instance.published_date}
+
+
+@receiver(post_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    from .search import get_search_backend
+    instance._row_pk = None
+    article_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove_article(article_id))
+    invalidate(article_cache_tags(instance))
+    PublishedDay.move(instance.published_date, None)
+
+
+@receiver(pre_save, sender=Comment)
+def comment_saving(sender, instance, **kwargs):
+    """
+    Work out how the save changes the approved-comment counts, as
+    {article id: delta}. Approving a comment and moving it to another
+    article are claimed on its row by conditional updates: of concurrent
+    saves making the same change, only the one whose update changed the row
+    counts it.
+    """
+    if instance._state.adding:
+        instance._count_deltas = {instance.article_id: int(instance.approved_comment)}
+        return
+    rows = Comment.objects.filter(pk=instance.pk)
+    update_fields = kwargs.get('update_fields')
+    old_article_id = getattr(instance, '_loaded_values', {}).get('article_id', instance.article_id)
+    moved = (old_article_id != instance.article_id and (update_fields is None or 'article' in update_fields)
+        and rows.filter(article_id=old_article_id).update(article_id=instance.article_id))
+    approved = instance.approved_comment
+    flipped = ((update_fields is None or 'approved_comment' in update_fields)
+        and rows.filter(approved_comment=not approved).update(approved_comment=approved))
+    was_approved = not approved if flipped else approved
+    if moved:
+        instance._count_deltas = {old_article_id: -int(was_approved), instance.article_id: int(approved)}
+    else:
+        instance._count_deltas = {instance.article_id: int(approved) - int(was_approved)}
+
+
+@receiver(pre_delete, sender=Comment)
+def comment_deleting(sender, instance, **kwargs):
+    # Unapproving the row first claims the decrement, once however many
+    # deletes race.
+    unapproved = Comment.objects.filter(pk=instance.pk, approved_comment=True).update(approved_comment=False)
+    instance._count_deltas = {instance.article_id: -unapproved}
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    deltas = getattr(instance, '_count_deltas', {instance.article_id: 0})
+    tags = ['article:%s' % article_id for article_id in sorted(deltas)]
+    changed = sorted(article_id for article_id, delta in deltas.items() if delta)
+    for article_id in changed:
+        # The count is part of the article row, so it is an edit of the
+        # article for the list pages' Last-Modified.
+        Article.objects.filter(pk=article_id).update(updated_at=timezone.now(),
+            approved_comment_count=models.F('approved_comment_count') + deltas[article_id])
+    if changed:
+        # The lists show the approved-comment count of the articles.
+        articles = list(Article.objects.filter(pk__in=changed).values('category_id', 'author_id',
+            'published_date'))
+        tags.extend(article_list_tags([article['category_id'] for article in articles],
+            [article['author_id'] for article in articles],
+            [article['published_date'] for article in articles]))
+    invalidate(tags)
+    instance._loaded_values = {'approved_comment': instance.approved_comment,
+        'article_id': instance.article_id}
+    instance._count_deltas = {instance.article_id: 0}
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    # Every page shows the categories sidebar.
+    invalidate(['categories'])
@@ -0,0 +1,148 @@
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as BinasciiError
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage(object):
+    """
+    One page of a keyset (seek) pagination.
+
+    Behaves like django.core.paginator.Page for the templates and the AJAX
+    feed, but has no page numbers: the neighbouring pages are reached with the
+    opaque next_cursor / previous_cursor values.
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Keyset page of %s objects>' % len(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def parse_ordering(ordering):
+    """
+    Turn an order_by() list like ['-published_date', 'title', 'id'] into
+    (field name, descending) pairs.
+    """
+    return [(key.lstrip('-'), key.startswith('-')) for key in ordering]
+
+
+def encode_cursor(values, direction):
+    # isoformat() keeps the microseconds, which DjangoJSONEncoder would cut
+    # and the seek predicates compare on exact values.
+    values = [value.isoformat() if hasattr(value, 'isoformat') else value
+              for value in values]
+    data = json.dumps({'v': values, 'd': direction})
+    return urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(model, keys, cursor):
+    """
+    Return (values, direction) for a cursor produced by encode_cursor(), or
+    None if the cursor is missing or malformed.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+        raw_values, direction = data['v'], data['d']
+        if direction not in ('next', 'prev') or len(raw_values) != len(keys):
+            return None
+        values = [model._meta.get_field(name).to_python(value)
+                  for (name, desc), value in zip(keys, raw_values)]
+    except (BinasciiError, ValueError, TypeError, KeyError, UnicodeError, ValidationError):
+        return None
+    if any(value is None for value in values):
+        return None
+    return values, direction
+
+
+def row_values(row, keys, columns=None):
+    """
+    The values of the ordering keys in a model instance, a values() dict or
+    a values_list() tuple whose column names are given in columns.
+    """
+    if isinstance(row, dict):
+        return [row[name] for name, desc in keys]
+    if isinstance(row, tuple):
+        return [row[columns.index(name)] for name, desc in keys]
+    return [getattr(row, name) for name, desc in keys]
+
+
+def seek_filter(keys, values, forward):
+    """
+    Build the WHERE clause for rows strictly after (forward) or before the
+    given key values in the ordering described by keys.
+    """
+    clauses = []
+    for i, (name, desc) in enumerate(keys):
+        lookup = 'lt' if desc == forward else 'gt'
+        clause = {'%s__%s' % (name, lookup): values[i]}
+        clause.update((keys[j][0], values[j]) for j in range(i))
+        clauses.append(Q(**clause))
+    return reduce(or_, clauses)
+
+
+def get_keyset_page(queryset, cursor, ordering, per_page=4, columns=None):
+    """
+    Return a KeysetPage of queryset ordered by ordering, starting after the
+    position encoded in cursor (the first page if the cursor is invalid).
+
+    The ordering must end with a unique column (normally 'id') so that every
+    row has a distinct position. Only per_page + 1 rows are ever fetched and
+    no COUNT(*) is run, so the cost does not depend on how deep the page is.
+    For a values_list() queryset, columns names its columns, which must
+    include the ordering keys.
+    """
+    keys = parse_ordering(ordering)
+    decoded = decode_cursor(queryset.model, keys, cursor)
+    values, direction = decoded if decoded else (None, 'next')
+    forward = direction == 'next'
+
+    if forward:
+        queryset = queryset.order_by(*ordering)
+    else:
+        queryset = queryset.order_by(*[name if desc else '-' + name for name, desc in keys])
+    if values is not None:
+        queryset = queryset.filter(seek_filter(keys, values, forward))
+
+    rows = list(queryset[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or not forward:
+            next_cursor = encode_cursor(row_values(rows[-1], keys, columns), 'next')
+        if values is not None and (forward or has_more):
+            previous_cursor = encode_cursor(row_values(rows[0], keys, columns), 'prev')
+    return KeysetPage(rows, next_cursor, previous_cursor)
@@ -0,0 +1,119 @@
+"""
+Read replicas.
+
+ReplicaRouter sends the reads of the blog and auth models to one of the
+BLOG_READ_REPLICAS databases while a view whose class or function has
+replica_reads = True handles a GET or HEAD request, and while a template
+tag runs reading_from_replica(). Everything else, writes included, goes to
+'default'.
+
+Replicas lag behind the primary. ReplicaRoutingMiddleware gives a client
+whose request wrote anything a cookie that keeps its reads on the primary
+for BLOG_REPLICA_LAG seconds, so authors see what they just published or
+commented. For the same reason blog.cache does not store a page read from a
+replica within BLOG_REPLICA_LAG seconds of the last invalidation of its
+tags.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+PIN_COOKIE_NAME = 'blog_primary_until'
+
+# Apps whose tables are replicated; sessions are never read from a replica,
+# as a login must be seen by the next request.
+REPLICATED_APPS = ('blog', 'auth', 'contenttypes')
+
+_state = threading.local()
+
+
+def get_replicas():
+    return list(getattr(settings, 'BLOG_READ_REPLICAS', []))
+
+
+def get_replica_lag():
+    return getattr(settings, 'BLOG_REPLICA_LAG', 5)
+
+
+def get_replica():
+    """
+    The replica the current thread reads from, or None for the primary.
+    """
+    return getattr(_state, 'replica', None)
+
+
+def is_pinned(request):
+    try:
+        return float(request.COOKIES.get(PIN_COOKIE_NAME, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+@contextmanager
+def reading_from_replica():
+    """
+    Read from a replica inside the block, when the current request may.
+    """
+    replicas = get_replicas()
+    if not getattr(_state, 'replica_allowed', False) or not replicas or get_replica():
+        yield
+        return
+    _state.replica = random.choice(replicas)
+    try:
+        yield
+    finally:
+        _state.replica = None
+
+
+class ReplicaRouter(object):
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects come from where the instance came from.
+            return instance._state.db
+        if model._meta.app_label in REPLICATED_APPS:
+            return get_replica()
+        return None
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
+
+
+class ReplicaRoutingMiddleware(object):
+    """
+    Let the views marked replica_reads read from a replica, and pin to the
+    primary the clients that just wrote.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.replica, _state.wrote = None, False
+        _state.replica_allowed = request.method in ('GET', 'HEAD') and not is_pinned(request)
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                lag = get_replica_lag()
+                response.set_cookie(PIN_COOKIE_NAME, '%.3f' % (time.time() + lag), max_age=lag, httponly=True)
+        finally:
+            _state.replica, _state.wrote, _state.replica_allowed = None, False, False
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view = getattr(view_func, 'view_class', view_func)
+        replicas = get_replicas()
+        if getattr(view, 'replica_reads', False) and _state.replica_allowed and replicas:
+            # One replica for the whole request, template rendering included.
+            _state.replica = random.choice(replicas)
@@ -0,0 +1,367 @@
+import heapq
+import math
+import re
+import threading
+import time
+from array import array
+from html import unescape
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from django.utils.html import escape, strip_tags
+from django.utils.module_loading import import_string
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    """
+    Return the process-wide search backend named by BLOG_SEARCH_BACKEND.
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'BLOG_SEARCH_BACKEND', 'blog.search.InvertedIndexBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def tokenize_spans(text):
+    """
+    Return the tokens of text with their start and end offsets.
+    """
+    return [(match.group().lower(), match.start(), match.end())
+            for match in TOKEN_RE.finditer(text)]
+
+
+def article_plain_text(title, text):
+    """
+    The searchable text of an article: its title and its body without markup.
+    """
+    return '%s\n%s' % (title, strip_tags(unescape(text)))
+
+
+class BaseSearchBackend(object):
+    """
+    Interface of the search backends used by SearchArticleListView.
+
+    search() receives the already filtered queryset of visible articles and
+    returns a sequence of them, best match first, that supports len() and
+    slicing so it can be handed to a Paginator.
+    """
+
+    def index_article(self, article):
+        pass
+
+    def remove_article(self, article_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def snippet(self, article_id, query):
+        return None
+
+    def search(self, query, articles):
+        raise NotImplementedError
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Substring search in the database; no index to maintain, no ranking.
+    """
+
+    def search(self, query, articles):
+        return articles.filter(Q(title__icontains=query) | Q(text__icontains=query))
+
+
+class SearchResults(object):
+    """
+    Ranked search hits. Only the rows of the requested slice are fetched,
+    and only the top of the ranking needed for that slice is sorted.
+    """
+
+    def __init__(self, scores, articles, query='', backend=None):
+        self.scores = scores
+        self.articles = articles
+        self.query = query
+        self.backend = backend
+        self._ranking = None
+
+    def __len__(self):
+        return len(self.scores)
+
+    def count(self):
+        return len(self.scores)
+
+    def ranked_ids(self, stop=None):
+        key = lambda article_id: (self.scores[article_id], article_id)
+        if stop is None or stop >= len(self.scores):
+            if self._ranking is None:
+                self._ranking = sorted(self.scores, key=key, reverse=True)
+            return self._ranking
+        if self._ranking is not None:
+            return self._ranking[:stop]
+        return heapq.nlargest(stop, self.scores, key=key)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step is not None or (index.start or 0) < 0 or (index.stop is not None and index.stop < 0):
+                ids = self.ranked_ids()[index]
+            else:
+                ids = self.ranked_ids(index.stop)[index.start or 0:]
+            rows = self.articles.in_bulk(ids)
+            hits = [rows[article_id] for article_id in ids if article_id in rows]
+            if self.backend is not None:
+                for article in hits:
+                    article.snippet = self.backend.snippet(article.pk, self.query)
+            return hits
+        article_id = self.ranked_ids(index + 1 if index >= 0 else None)[index]
+        return self.articles.get(pk=article_id)
+
+
+class InvertedIndexBackend(BaseSearchBackend):
+    """
+    In-process inverted index over the title and the stripped text of the
+    published articles, ranked with Okapi BM25.
+
+    The index is built from the database on the first search and then kept
+    current by the Article save/delete hooks. Each posting stores the term's
+    BM25 weight for the document, computed with the average document length
+    frozen at build time, so a query only sums precomputed numbers.
+
+    Each process holds its own copy of the index, and the hooks only run in
+    the process that saved. So a search first compares the number of
+    articles and their latest updated_at with what the index has seen, at
+    most every BLOG_SEARCH_REFRESH_INTERVAL seconds (1), and re-indexes the
+    articles changed or deleted by the other processes.
+
+    The plain text, the token offsets and the term positions of every
+    document are kept as well, so result snippets are cut and highlighted
+    without reading the articles again.
+    """
+    k1 = 1.2
+    b = 0.75
+    common_term_ratio = 0.5
+    snippet_tokens = 30
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.built = False
+            self.postings = {}
+            self.doc_positions = {}
+            self.doc_text = {}
+            self.doc_spans = {}
+            self.doc_len = {}
+            self.scheduled = {}
+            self.total_len = 0
+            self.avgdl = 0.0
+            # Every article id, drafts included, and the state of the table
+            # the index reflects.
+            self.article_ids = set()
+            self.stats = None
+            self.checked = 0.0
+
+    def table_stats(self):
+        from .models import Article
+        return Article.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+
+    def rebuild(self):
+        from .models import Article
+        rows = Article.objects.filter(published_date__isnull=False).values_list(
+            'id', 'title', 'text', 'published_date')
+        with self.lock:
+            self.reset()
+            # Read before the rows: a change made meanwhile is seen again.
+            self.stats = self.table_stats()
+            self.checked = time.time()
+            self.article_ids = set(Article.objects.values_list('id', flat=True))
+            documents = []
+            for article_id, title, text, published_date in rows.iterator():
+                plain_text = article_plain_text(title, text)
+                documents.append((article_id, plain_text, tokenize_spans(plain_text), published_date))
+            self.total_len = sum(len(spans) for _, _, spans, _ in documents)
+            self.avgdl = float(self.total_len) / len(documents) if documents else 0.0
+            for article_id, plain_text, spans, published_date in documents:
+                self._add(article_id, plain_text, spans, published_date)
+            self.built = True
+
+    def ensure_built(self):
+        if not self.built:
+            self.rebuild()
+        else:
+            self.refresh()
+
+    def refresh(self):
+        """
+        Re-index the articles other processes changed or deleted since the
+        last check.
+        """
+        from .models import Article
+        interval = getattr(settings, 'BLOG_SEARCH_REFRESH_INTERVAL', 1)
+        with self.lock:
+            if time.time() - self.checked < interval:
+                return
+            self.checked = time.time()
+            stats = self.table_stats()
+            if stats == self.stats:
+                return
+            changed = Article.objects.all()
+            if self.stats['updated'] is not None:
+                # Equal times too: several saves may share a timestamp.
+                changed = changed.filter(updated_at__gte=self.stats['updated'])
+            for article in changed.only('id', 'title', 'text', 'published_date'):
+                self.article_ids.add(article.pk)
+                self._index(article)
+            if len(self.article_ids) != stats['count']:
+                existing = set(Article.objects.values_list('id', flat=True))
+                for article_id in self.article_ids - existing:
+                    self._remove(article_id)
+                self.article_ids = existing
+            self.stats = stats
+
+    def _add(self, article_id, plain_text, spans, published_date):
+        positions = {}
+        for position, (token, start, end) in enumerate(spans):
+            positions.setdefault(token, array('I')).append(position)
+        avgdl = self.avgdl or float(len(spans)) or 1.0
+        norm = self.k1 * (1 - self.b + self.b * len(spans) / avgdl)
+        for term, term_positions in positions.items():
+            tf = len(term_positions)
+            self.postings.setdefault(term, {})[article_id] = tf * (self.k1 + 1) / (tf + norm)
+        self.doc_positions[article_id] = positions
+        self.doc_text[article_id] = plain_text
+        self.doc_spans[article_id] = array('I', [offset for token, start, end in spans for offset in (start, end)])
+        self.doc_len[article_id] = len(spans)
+        if published_date > timezone.now():
+            self.scheduled[article_id] = published_date
+
+    def _remove(self, article_id):
+        for term in self.doc_positions.pop(article_id, {}):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(article_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.doc_text.pop(article_id, None)
+        self.doc_spans.pop(article_id, None)
+        self.total_len -= self.doc_len.pop(article_id, 0)
+        self.scheduled.pop(article_id, None)
+
+    def _index(self, article):
+        self._remove(article.pk)
+        if article.published_date is not None:
+            plain_text = article_plain_text(article.title, article.text)
+            spans = tokenize_spans(plain_text)
+            self.total_len += len(spans)
+            self._add(article.pk, plain_text, spans, article.published_date)
+
+    def index_article(self, article):
+        with self.lock:
+            if not self.built:
+                # The first search reads everything from the database.
+                return
+            self.article_ids.add(article.pk)
+            self._index(article)
+
+    def remove_article(self, article_id):
+        with self.lock:
+            if self.built:
+                self.article_ids.discard(article_id)
+                self._remove(article_id)
+
+    def score(self, query):
+        """
+        Return {article id: BM25 score} for the visible articles matching
+        any term of the query.
+
+        Terms found in more than common_term_ratio of the articles are
+        skipped when the query also has rarer terms: their idf is close to
+        zero, yet summing their postings would dominate the query time.
+        """
+        self.ensure_built()
+        with self.lock:
+            total = len(self.doc_len)
+            terms = []
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if postings:
+                    df = len(postings)
+                    terms.append((df, math.log(1 + (total - df + 0.5) / (df + 0.5)), postings))
+            selective = [term for term in terms if term[0] <= total * self.common_term_ratio]
+            if selective:
+                terms = selective
+
+            if len(terms) == 1:
+                # A single term ranks by its stored weights alone.
+                scores = dict(terms[0][2])
+            else:
+                scores = {}
+                for df, idf, postings in terms:
+                    get = scores.get
+                    for article_id, weight in postings.items():
+                        scores[article_id] = get(article_id, 0.0) + idf * weight
+            now = timezone.now()
+            for article_id, published_date in self.scheduled.items():
+                if published_date > now:
+                    scores.pop(article_id, None)
+        return scores
+
+    def snippet(self, article_id, query):
+        """
+        Return an HTML fragment of about snippet_tokens words around the
+        densest group of query terms in the article, terms wrapped in <mark>.
+        """
+        with self.lock:
+            positions = self.doc_positions.get(article_id)
+            if positions is None:
+                return None
+            text = self.doc_text[article_id]
+            spans = self.doc_spans[article_id]
+            hits = sorted(position for term in set(tokenize(query))
+                          for position in positions.get(term, ()))
+
+        length = len(spans) // 2
+        if not length:
+            return ''
+        first = 0
+        if hits:
+            best = 0
+            low = 0
+            for high in range(len(hits)):
+                while hits[high] - hits[low] >= self.snippet_tokens:
+                    low += 1
+                if high - low + 1 > best:
+                    best = high - low + 1
+                    first = hits[low]
+            first = max(0, min(first - self.snippet_tokens // 4, length - self.snippet_tokens))
+        last = min(length, first + self.snippet_tokens) - 1
+
+        parts = ['&hellip; '] if first else []
+        offset = spans[2 * first]
+        for position in hits:
+            if first <= position <= last:
+                start, end = spans[2 * position], spans[2 * position + 1]
+                parts.append(escape(text[offset:start]))
+                parts.append('<mark>%s</mark>' % escape(text[start:end]))
+                offset = end
+        parts.append(escape(text[offset:spans[2 * last + 1]]))
+        if last < length - 1:
+            parts.append(' &hellip;')
+        return ''.join(parts)
+
+    def search(self, query, articles):
+        return SearchResults(self.score(query), articles, query, self)
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import re
+import tempfile
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+
+CONTENT_DIRECTORY = 'cas'
+
+# Cache-Control of the content-addressed files: a name never changes content.
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def is_content_addressed(name):
+    return name.startswith(CONTENT_DIRECTORY + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage that keeps one copy of every distinct upload.
+
+    Files saved under one of BLOG_CONTENT_ADDRESSED_PREFIXES (the CKEditor
+    upload path and the Article.image directory) are stored as
+    cas/<2 hex digits>/<sha256 of the content><extension>, whatever their
+    name: saving the same content again returns the existing name without
+    writing anything. Other names are stored as FileSystemStorage does.
+
+    Files are never deleted when an article stops using them, as other
+    articles may share them; see blog.models.ArticleMedia and the gc_media
+    command.
+    """
+
+    def hashed_prefixes(self):
+        return tuple(getattr(settings, 'BLOG_CONTENT_ADDRESSED_PREFIXES',
+            (settings.CKEDITOR_UPLOAD_PATH, 'blog/images/')))
+
+    def content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        return '%s/%s/%s%s' % (CONTENT_DIRECTORY, digest[:2], digest, os.path.splitext(name)[1].lower())
+
+    def get_available_name(self, name, max_length=None):
+        if is_content_addressed(name):
+            # The name is the content: an existing file is the same file.
+            return name
+        return super(ContentAddressedStorage, self).get_available_name(name, max_length)
+
+    def _save(self, name, content):
+        if name.replace('\\', '/').startswith(self.hashed_prefixes()):
+            name = self.content_name(name, content)
+        if not is_content_addressed(name):
+            return super(ContentAddressedStorage, self)._save(name, content)
+
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            # Refresh the age checked by gc_media: the file is in use again.
+            os.utime(full_path, None)
+            return name
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        # Write aside and rename: two uploads of the same content may race,
+        # and either of them may win.
+        fd, temporary_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as temporary:
+                for chunk in content.chunks():
+                    temporary.write(chunk)
+            os.chmod(temporary_path, self.file_permissions_mode or 0o644)
+            os.replace(temporary_path, full_path)
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        return name
+
+
+def media_names(image_name, text):
+    """
+    The media files an article uses: its image and the files its rich-text
+    body links to under MEDIA_URL.
+    """
+    names = set()
+    if image_name:
+        names.add(image_name)
+    pattern = re.compile(r'''(?:src|href)\s*=\s*["'](?:https?://[^/"']+)?%s([^"'?#]+)'''
+        % re.escape(settings.MEDIA_URL))
+    names.update(unquote(name) for name in pattern.findall(text or ''))
+    return names
@@ -0,0 +1,29 @@
+from django import template
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.utils.html import format_html_join
+
+from ..assets import BUNDLES
+
+register = template.Library()
+
+def is_collected(name):
+    """
+    Whether collectstatic wrote the bundle: its name is in the manifest.
+    """
+    if settings.DEBUG or not hasattr(staticfiles_storage, 'hashed_files'):
+        return False
+    return staticfiles_storage.hash_key(name) in staticfiles_storage.hashed_files
+
+@register.simple_tag
+def bundle(name):
+    """
+    The <link> or <script> tag of the bundle name of blog.assets.BUNDLES,
+    or one tag per file of the bundle until it is collected.
+    """
+    names = [name] if is_collected(name) else BUNDLES[name]
+    if name.endswith('.css'):
+        html = '<link href="{}" rel="stylesheet">\n'
+    else:
+        html = '<script src="{}"></script>\n'
+    return format_html_join('', html, ((staticfiles_storage.url(path),) for path in names))
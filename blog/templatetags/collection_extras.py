@@ -1,13 +1,18 @@
 from django import template
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from django.utils import timezone
 from math import ceil
 
-from ..models import Category
+from ..cache import get_generations, get_response_cache
+from ..models import Category, PublishedDay
+from ..routers import reading_from_replica
 
 register = template.Library()
 
-@register.inclusion_tag('widgets/categories.html')
-def get_widgets():
-    categories_list = Category.objects.order_by('title')
+def render_categories_widget():
+    with reading_from_replica():
+        categories_list = list(Category.objects.order_by('title').only('title', 'urlstext'))
     categories_list_first_part = []
     categories_list_second_part = []
     len_list = len(categories_list)
@@ -17,12 +22,67 @@ def get_widgets():
         categories_list_first_part = categories_list[:middle_list]
         categories_list_second_part = categories_list[middle_list:]
 
-    return {'categories_list': categories_list, 'middle_list': middle_list,
+    return render_to_string('widgets/categories.html', {
+            'categories_list': categories_list, 'middle_list': middle_list,
             'categories_list_first_part': categories_list_first_part,
-            'categories_list_second_part': categories_list_second_part}
+            'categories_list_second_part': categories_list_second_part})
+
+@register.simple_tag
+def get_widgets():
+    """
+    The categories sidebar, rendered once per generation of the
+    'categories' cache tag.
+    """
+    cache = get_response_cache()
+    if cache is None:
+        return mark_safe(render_categories_widget())
+    key = 'blog:widget:categories:%s' % get_generations(cache, ['categories'])[0]
+    html = cache.get(key)
+    if html is None:
+        html = render_categories_widget()
+        cache.set(key, html, None)
+    return mark_safe(html)
 
 @register.inclusion_tag('widgets/search.html')
 def get_widgets_search(): pass
 
-@register.inclusion_tag('widgets/calendar.html')
-def get_widgets_calendar(): pass
+# Months before the current one whose days the calendar embeds; the
+# page fetches older months from blog:calendar_month when they are shown.
+CALENDAR_MONTHS = 3
+
+def first_day_of_month(day, months_back=0):
+    month = day.year * 12 + day.month - 1 - months_back
+    return day.replace(year=month // 12, month=month % 12 + 1, day=1)
+
+def render_calendar_widget(today):
+    """
+    Return the calendar HTML and when it goes stale: when an article
+    scheduled later today makes today a published day, or None.
+    """
+    first = first_day_of_month(today, CALENDAR_MONTHS)
+    with reading_from_replica():
+        days, goes_live = PublishedDay.published_days(first, today)
+    return render_to_string('widgets/calendar.html', {
+            'published_days': ','.join(day.isoformat() for day in days),
+            'first_day': first.isoformat()}), goes_live
+
+@register.simple_tag
+def get_widgets_calendar():
+    """
+    The archive calendar, listing the days with published articles of the
+    last CALENDAR_MONTHS months. Read from PublishedDay and rendered once
+    per generation of the 'calendar' cache tag and per day.
+    """
+    today = timezone.localdate()
+    cache = get_response_cache()
+    if cache is None:
+        return mark_safe(render_calendar_widget(today)[0])
+    key = 'blog:widget:calendar:%s:%s' % (get_generations(cache, ['calendar'])[0], today.isoformat())
+    html = cache.get(key)
+    if html is None:
+        html, goes_live = render_calendar_widget(today)
+        timeout = None
+        if goes_live is not None:
+            timeout = max(1, int((goes_live - timezone.now()).total_seconds()))
+        cache.set(key, html, timeout)
+    return mark_safe(html)
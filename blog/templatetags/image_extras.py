@@ -0,0 +1,15 @@
+from django import template
+
+from ..images import image_sources
+
+register = template.Library()
+
+@register.inclusion_tag('blog/article_picture.html')
+def article_picture(article, sizes='(min-width: 768px) 750px, 100vw'):
+    """
+    The article image as a <picture> with a srcset of its derivatives, or
+    the original until the derivatives are built.
+    """
+    sources = image_sources(article)
+    return {'article': article, 'sources': sources[:-1], 'fallback': sources[-1][1] if sources else '',
+            'sizes': sizes}
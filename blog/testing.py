@@ -0,0 +1,69 @@
+"""
+Query and time budgets for tests.
+
+    with query_budget(4, ms=200):
+        self.client.get(reverse('blog:article_list'))
+
+fails the test when the block runs more than 4 queries, and lists the SQL it
+ran. query_budget also decorates a test method. Timings depend on the
+machine, so the time budgets are only enforced where BLOG_TIME_BUDGET_SCALE
+is set, multiplied by it: 1 on the machine the budgets were measured on.
+
+route_names() lists the named routes of a URLconf module, for the tests
+that check every route has a budget.
+"""
+import time
+from contextlib import ContextDecorator
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+def get_time_budget_scale():
+    """
+    BLOG_TIME_BUDGET_SCALE, or None when the time budgets are not enforced.
+    """
+    return getattr(settings, 'BLOG_TIME_BUDGET_SCALE', None)
+
+
+class query_budget(ContextDecorator):
+    def __init__(self, queries, ms=None, using=DEFAULT_DB_ALIAS, label=None):
+        self.queries = queries
+        self.ms = ms
+        self.using = using
+        self.label = label
+
+    def __enter__(self):
+        self.captured = CaptureQueriesContext(connections[self.using])
+        self.captured.__enter__()
+        self.start = time.perf_counter()
+        return self.captured
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = (time.perf_counter() - self.start) * 1000
+        self.captured.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return False
+        label = '%s: ' % self.label if self.label else ''
+        if len(self.captured) > self.queries:
+            raise AssertionError('%s%s queries run, the budget is %s:\n%s' % (label, len(self.captured),
+                self.queries, format_queries(self.captured.captured_queries)))
+        scale = get_time_budget_scale()
+        if self.ms is not None and scale is not None and elapsed > self.ms * scale:
+            raise AssertionError('%stook %.1f ms, the budget is %s ms; its queries:\n%s' % (label, elapsed,
+                self.ms * scale, format_queries(self.captured.captured_queries)))
+        return False
+
+
+def format_queries(queries):
+    return '\n'.join('%s. %s (%s s)' % (number, query['sql'], query['time'])
+        for number, query in enumerate(queries, start=1))
+
+
+def route_names(urlconf_module):
+    """
+    'namespace:name' of the named patterns of urlconf_module.
+    """
+    prefix = '%s:' % urlconf_module.app_name if getattr(urlconf_module, 'app_name', None) else ''
+    return set(prefix + pattern.name for pattern in urlconf_module.urlpatterns if getattr(pattern, 'name', None))
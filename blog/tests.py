@@ -1,14 +1,46 @@
 import datetime
+import json
+import logging
 import os
+import re
+import shutil
+import tempfile
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.utils import timezone
-from django.test import TestCase
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.utils import OperationalError
+from django.core.management import CommandError, call_command
 from django.core.urlresolvers import reverse
 
-from .models import Category, Article, Comment
+from .models import Category, Article, ArticleMedia, Comment, PublishedDay
 from .forms import ArticleForm, CommentForm
+from .search import get_search_backend, tokenize
+from .cache import LRUCache, get_default_timeout, get_generations, get_publication_timeout
+from .assets import BUNDLES, minify_css, rebase_css_urls
+from .comment_queue import CommentJournal, drain, get_journal, stop_worker
+from .benchmarks import compare, get_scenarios, run_benchmarks, seed_corpus
+from .routers import PIN_COOKIE_NAME
+from .images import derivative_formats, derivative_name, process_article_image, run_in_background
+from .storage import IMMUTABLE_CACHE_CONTROL
+from .testing import query_budget, route_names
+from .views import COMMENT_PAGE_SIZE, serve_media
+from . import urls as blog_urls
 
 from django.contrib.auth.models import User
+from PIL import Image
+from myblog.dbpool import get_pool
+from myblog.dbpool.sqlite3.base import DatabaseWrapper as PooledSQLiteWrapper
+from myblog.static_serving import StaticFilesApplication
 
 def create_article(title, days):
     time = timezone.now() + datetime.timedelta(days=days)
@@ -1234,6 +1266,2245 @@ class Test_View_Article_Form(TestCase):
 
         self.client.logout()
 
+class Test_View_Article_List_Keyset(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create(username='test_usr', password ='secret')
+        for i in range(6):
+            create_article(title = 'Past article %s.' % i, days = -30 + i)
+
+    def test_article_list_view_exposes_cursors(self):
+        """
+        Numbered pages expose opaque cursors for the neighbouring pages.
+        """
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertTrue(response.context['next_cursor'])
+        self.assertEqual(response.context['previous_cursor'], None)
+
+    def test_article_list_view_follow_cursors(self):
+        """
+        The next cursor leads to the rest of the articles, and the previous
+        cursor of that page leads back to the first page.
+        """
+        response = self.client.get(reverse('blog:article_list'))
+        response = self.client.get(reverse('blog:article_list'),
+            {'cursor': response.context['next_cursor']})
+        self.assertQuerysetEqual(
+            response.context['list_article_pag'],
+            ['<Article: Past article 1.>', '<Article: Past article 0.>']
+        )
+        self.assertEqual(response.context['next_cursor'], None)
+        self.assertContains(response, '?cursor=')
+
+        response = self.client.get(reverse('blog:article_list'),
+            {'cursor': response.context['previous_cursor']})
+        self.assertQuerysetEqual(
+            response.context['list_article_pag'],
+            ['<Article: Past article 5.>', '<Article: Past article 4.>',
+            '<Article: Past article 3.>', '<Article: Past article 2.>']
+        )
+        self.assertEqual(response.context['previous_cursor'], None)
+
+    def test_article_list_view_invalid_cursor(self):
+        """
+        A malformed cursor delivers the first page.
+        """
+        response = self.client.get(reverse('blog:article_list'),
+            {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['list_article_pag']), 4)
+        self.assertEqual(response.context['list_article_pag'][0].title,
+            'Past article 5.')
+
+    def test_article_list_ajax_cursors(self):
+        """
+        The AJAX feed returns the cursors in its json_page block.
+        """
+        response = self.client.get(reverse('blog:article_list'),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        json_page = response.json()['json_page'][0]
+        self.assertFalse(json_page['is_keyset'])
+        response = self.client.get(reverse('blog:article_list'),
+            {'cursor': json_page['next_cursor']},
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        data = response.json()
+        self.assertTrue(data['json_page'][0]['is_keyset'])
+        self.assertEqual([line['title'] for line in data['json_object']],
+            ['Past article 1.', 'Past article 0.'])
+        self.assertEqual(data['json_page'][0]['next_cursor'], None)
+
+    def test_draft_article_list_keyset_mode(self):
+        """
+        Drafts are paged on (-created_date, title, id).
+        """
+        author = User.objects.get(username = 'test_usr')
+        author.set_password('secret')
+        author.save()
+        for i in range(5):
+            create_draft_article(title = 'Draft article %s.' % i, days = -10 + i)
+        self.client.login(username = 'test_usr', password = 'secret')
+        response = self.client.get(reverse('blog:article_draft_list'),
+            {'cursor': ''})
+        self.assertEqual(response.context['list_article_pag'][0].title,
+            'Draft article 4.')
+        response = self.client.get(reverse('blog:article_draft_list'),
+            {'cursor': response.context['next_cursor']})
+        self.assertQuerysetEqual(
+            response.context['list_article_pag'],
+            ['<Article: Draft article 0.>']
+        )
+        self.client.logout()
+
+
+@override_settings(BLOG_RESPONSE_CACHE=None)
+class Test_View_Article_List_Queries(TestCase):
+    """
+    Queries of the rendering path; the response cache is switched off.
+    """
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+        create_draft_article(title = 'Draft article.', days = -5)
+        strdate = date_to_str(timezone.localtime(self.article.published_date))
+        self.list_urls = [
+            reverse('blog:article_list'),
+            reverse('blog:article_categories_list',
+                kwargs={'categoryName': 'url_test_category'}),
+            reverse('blog:article_author_list',
+                kwargs={'authorName': 'test_usr'}),
+            reverse('blog:article_date_list',
+                kwargs={'year': strdate['str_year'],
+                    'month': strdate['str_month'],
+                    'day': strdate['str_day']}),
+        ]
+
+    def test_article_list_html_paginates_once(self):
+        """
+        An HTML list page runs one COUNT and one SELECT for the articles,
+        plus the categories and calendar sidebar widgets.
+        """
+        for url in self.list_urls:
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            self.assertEqual(len(response.context['list_article_pag']), 1)
+            self.assertIs(response.context['list_article_pag'],
+                response.context['page_obj'])
+
+    def test_article_list_ajax_paginates_once(self):
+        """
+        The AJAX feed reuses the page built by the list view: one COUNT and
+        one SELECT.
+        """
+        for url in self.list_urls:
+            with self.assertNumQueries(2):
+                response = self.client.get(url,
+                    HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            self.assertEqual(len(response.json()['json_object']), 1)
+
+    def test_search_article_list_queries(self):
+        """
+        With a warm search index a results page runs one SELECT for the hits
+        plus the categories and calendar sidebar widgets.
+        """
+        get_search_backend().rebuild()
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('blog:search_list'),
+                {'srchtxt': 'test_text'})
+        self.assertEqual(len(response.context['list_article_pag']), 1)
+
+    def test_draft_article_list_paginates_once(self):
+        """
+        The drafts page adds only the session and user lookups.
+        """
+        self.client.login(username = 'test_usr', password = 'secret')
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('blog:article_draft_list'))
+        self.assertEqual(len(response.context['list_article_pag']), 1)
+        self.client.logout()
+
+    def test_article_list_queries_do_not_depend_on_page_size(self):
+        """
+        Authors, categories and approved-comment counts come with the
+        article rows, so a full page costs as many queries as a single card.
+        """
+        for i in range(5):
+            article = create_article(title = 'More past article %s.' % i, days = -4)
+            Comment.objects.create(article = article, author = 'me',
+                text = 'approved', approved_comment = True)
+            Comment.objects.create(article = article, author = 'me',
+                text = 'waiting')
+        for url in self.list_urls[:3]:
+            with self.assertNumQueries(4):
+                response = self.client.get(url)
+            self.assertEqual(len(response.context['list_article_pag']), 4)
+            self.assertContains(response, 'Comments: 1', count = 4)
+
+
+@override_settings(BLOG_RESPONSE_CACHE=None)
+class Test_Query_Plans(TestCase):
+    """
+    EXPLAIN every article and comment query of the list pages and fail on
+    a full table scan.
+    """
+    tables = ('blog_article', 'blog_comment')
+
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+        create_draft_article(title = 'Draft article.', days = -5)
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+
+    def full_scans(self, sql):
+        """
+        Return the plan lines of sql that read one of self.tables in full.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                pattern = re.compile(r'^SCAN (TABLE )?(%s)\b' % '|'.join(self.tables))
+                return [row[-1] for row in cursor.fetchall() if pattern.match(row[-1])]
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql)
+                columns = [column[0] for column in cursor.description]
+                rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                return ['%(table)s: %(type)s' % row for row in rows
+                        if row['table'] in self.tables and row['type'] in ('ALL', 'index')]
+        self.skipTest('No EXPLAIN support for %s' % connection.vendor)
+
+    def assertNoFullScan(self, url, **extra):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, **extra)
+        self.assertEqual(response.status_code, 200)
+        explained = 0
+        for query in queries.captured_queries:
+            if any(table in query['sql'] for table in self.tables):
+                explained += 1
+                self.assertEqual(self.full_scans(query['sql']), [],
+                    '%s: %s' % (url, query['sql']))
+        self.assertTrue(explained)
+
+    def test_list_pages_use_indexes(self):
+        """
+        The front, category, author, date, search and draft pages, HTML and
+        AJAX, only reach articles and comments through indexes.
+        """
+        strdate = date_to_str(timezone.localtime(self.article.published_date))
+        urls = [
+            reverse('blog:article_list'),
+            reverse('blog:article_list') + '?page=2',
+            reverse('blog:article_list') + '?cursor=',
+            reverse('blog:article_categories_list',
+                kwargs={'categoryName': 'url_test_category'}),
+            reverse('blog:article_author_list',
+                kwargs={'authorName': 'test_usr'}),
+            reverse('blog:article_date_list',
+                kwargs={'year': strdate['str_year'],
+                    'month': strdate['str_month'],
+                    'day': strdate['str_day']}),
+        ]
+        for url in urls:
+            self.assertNoFullScan(url)
+            self.assertNoFullScan(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNoFullScan(reverse('blog:api_article_list') + '?category=url_test_category')
+        self.assertNoFullScan(reverse('blog:api_comment_list', kwargs={'pk': self.article.pk}))
+        get_search_backend().rebuild()
+        self.assertNoFullScan(reverse('blog:search_list') + '?srchtxt=test_text')
+        self.assertNoFullScan(reverse('blog:article_detail', kwargs={'pk': self.article.pk}))
+        self.client.login(username = 'test_usr', password = 'secret')
+        self.assertNoFullScan(reverse('blog:article_draft_list'))
+
+    @override_settings(BLOG_RESPONSE_CACHE='default')
+    def test_validators_use_indexes(self):
+        """
+        The aggregates behind the conditional GET validators are indexed too.
+        """
+        caches['default'].clear()
+        self.assertNoFullScan(reverse('blog:article_list'))
+        self.assertNoFullScan(reverse('blog:article_categories_list',
+            kwargs={'categoryName': 'url_test_category'}))
+        self.assertNoFullScan(reverse('blog:article_detail', kwargs={'pk': self.article.pk}))
+
+    def test_date_page_range(self):
+        """
+        A date page covers the local day from midnight included to the next
+        midnight excluded; a date that does not exist lists nothing.
+        """
+        author = User.objects.get(username = 'test_usr')
+        category = Category.objects.get(title = 'test_category')
+        midnight = timezone.make_aware(datetime.datetime(2017, 3, 1))
+        for title, published_date in (
+                ('Before.', midnight - datetime.timedelta(microseconds=1)),
+                ('Midnight.', midnight),
+                ('Last moment.', midnight + datetime.timedelta(days=1, microseconds=-1)),
+                ('Next day.', midnight + datetime.timedelta(days=1))):
+            Article.objects.create(author = author, category = category,
+                title = title, text = 'test_text', published_date = published_date)
+        response = self.client.get(reverse('blog:article_date_list',
+            kwargs={'year': '2017', 'month': '03', 'day': '01'}))
+        self.assertQuerysetEqual(response.context['articles'],
+            ['<Article: Midnight.>', '<Article: Last moment.>'], ordered=False)
+        response = self.client.get(reverse('blog:article_date_list',
+            kwargs={'year': '2017', 'month': '02', 'day': '31'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerysetEqual(response.context['articles'], [])
+
+
+class Test_Approved_Comment_Count(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+
+    def count(self):
+        return Article.objects.get(pk = self.article.pk).approved_comment_count
+
+    def test_count_follows_approval_and_deletion(self):
+        """
+        Approving, unapproving and deleting comments adjust the counter;
+        unapproved comments are not counted.
+        """
+        waiting = Comment.objects.create(article = self.article, author = 'me', text = 'waiting')
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+        self.assertEqual(self.count(), 1)
+        self.client.login(username = 'test_usr', password = 'secret')
+        self.client.get(reverse('blog:comment_approve', kwargs={'pk': waiting.pk}))
+        self.assertEqual(self.count(), 2)
+        waiting = Comment.objects.get(pk = waiting.pk)
+        waiting.approved_comment = False
+        waiting.save()
+        self.assertEqual(self.count(), 1)
+        waiting.delete()
+        self.assertEqual(self.count(), 1)
+        approved = Comment.objects.get(approved_comment = True)
+        self.client.post(reverse('blog:comment_remove', kwargs={'pk': approved.pk}))
+        self.assertEqual(self.count(), 0)
+
+    def test_concurrent_approvals_count_once(self):
+        """
+        Two saves approving the same comment, each loaded while it waited,
+        count it once; so do two deletes of an approved comment.
+        """
+        comment = Comment.objects.create(article = self.article, author = 'me', text = 'waiting')
+        first, second = Comment.objects.get(pk = comment.pk), Comment.objects.get(pk = comment.pk)
+        first.approve()
+        second.approve()
+        self.assertEqual(self.count(), 1)
+        first, second = Comment.objects.get(pk = comment.pk), Comment.objects.get(pk = comment.pk)
+        first.delete()
+        second.delete()
+        self.assertEqual(self.count(), 0)
+
+    def test_moved_comment(self):
+        """
+        Moving an approved comment to another article moves its count and
+        refreshes the pages of both articles.
+        """
+        other = create_article(title = 'Other article.', days = -4)
+        comment = Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+        cache = caches['default']
+        before = get_generations(cache, ['article:%s' % self.article.pk, 'article:%s' % other.pk])
+        comment = Comment.objects.get(pk = comment.pk)
+        comment.article = other
+        comment.save()
+        self.assertEqual(self.count(), 0)
+        self.assertEqual(Article.objects.get(pk = other.pk).approved_comment_count, 1)
+        after = get_generations(cache, ['article:%s' % self.article.pk, 'article:%s' % other.pk])
+        self.assertNotEqual(before[0], after[0])
+        self.assertNotEqual(before[1], after[1])
+        comment.article = self.article
+        comment.approved_comment = False
+        comment.save()
+        self.assertEqual(self.count(), 0)
+        self.assertEqual(Article.objects.get(pk = other.pk).approved_comment_count, 0)
+
+    def test_article_save_keeps_count(self):
+        """
+        Saving an article loaded before a comment was approved does not
+        write its stale counter back.
+        """
+        article = Article.objects.get(pk = self.article.pk)
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+        article.title = 'Edited.'
+        article.save()
+        self.assertEqual(self.count(), 1)
+
+    def test_copied_article(self):
+        """
+        Saving a loaded article with pk = None inserts a copy, which starts
+        without comments and counts on the calendar.
+        """
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+        copy = Article.objects.get(pk = self.article.pk)
+        copy.pk = None
+        copy.save()
+        self.assertNotEqual(copy.pk, self.article.pk)
+        self.assertEqual(Article.objects.count(), 2)
+        self.assertEqual(Article.objects.get(pk = copy.pk).approved_comment_count, 0)
+        self.assertEqual(self.count(), 1)
+        self.assertEqual(PublishedDay.objects.get(day = timezone.localdate(copy.published_date)).articles, 2)
+
+    def test_save_after_delete(self):
+        """
+        Saving a deleted article inserts it again.
+        """
+        article = Article.objects.get(pk = self.article.pk)
+        Comment.objects.create(article = article, author = 'me',
+            text = 'approved', approved_comment = True)
+        article.delete()
+        article.save()
+        self.assertEqual(Article.objects.get(pk = article.pk).approved_comment_count, 0)
+        self.assertEqual(PublishedDay.objects.get(day = timezone.localdate(article.published_date)).articles, 1)
+
+    def test_admin_approve_action(self):
+        """
+        The admin action approves the comments through their save hooks.
+        """
+        User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+        self.client.login(username = 'admin', password = 'secret')
+        comments = [Comment.objects.create(article = self.article, author = 'me',
+            text = 'waiting %s' % i) for i in range(3)]
+        self.client.post(reverse('admin:blog_comment_changelist'), {
+            'action': 'approve_comments',
+            '_selected_action': [comment.pk for comment in comments[:2]]})
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(Comment.objects.filter(approved_comment = True).count(), 2)
+
+    def test_reconcile_command(self):
+        """
+        reconcile_comment_counts repairs a drifted counter.
+        """
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+        Article.objects.update(approved_comment_count = 7)
+        out = StringIO()
+        call_command('reconcile_comment_counts', '--dry-run', stdout = out)
+        self.assertIn('1 article comment counts are wrong.', out.getvalue())
+        self.assertEqual(self.count(), 7)
+        call_command('reconcile_comment_counts', stdout = StringIO())
+        self.assertEqual(self.count(), 1)
+
+    def test_article_list_reads_counter(self):
+        """
+        The HTML and AJAX lists show the stored counter.
+        """
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Comments: 1')
+        response = self.client.get(reverse('blog:article_list'),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['json_object'][0]['approved_comments'], 1)
+
+
+class Test_Api(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.articles = [create_article(title = 'Past article %s.' % i, days = -i - 1)
+            for i in range(3)]
+        create_article(title = 'Future article.', days = 5)
+        create_draft_article(title = 'Draft article.', days = -1)
+
+    def get_json(self, url, data=None, **extra):
+        response = self.client.get(url, data or {}, **extra)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return json.loads(b''.join(response.streaming_content).decode('utf-8'))
+
+    def test_article_feed(self):
+        """
+        The feed lists the visible articles newest first, with every field
+        by default, and walks the pages with the cursors.
+        """
+        data = self.get_json(reverse('blog:api_article_list'), {'limit': 2})
+        self.assertEqual([item['title'] for item in data['data']],
+            ['Past article 0.', 'Past article 1.'])
+        self.assertEqual(set(data['data'][0]), {'id', 'title', 'excerpt', 'image',
+            'published_date', 'author', 'category', 'category_title', 'approved_comments'})
+        self.assertEqual(data['data'][0]['author'], 'test_usr')
+        self.assertIsNone(data['previous_cursor'])
+        data = self.get_json(reverse('blog:api_article_list'),
+            {'limit': 2, 'cursor': data['next_cursor']})
+        self.assertEqual([item['title'] for item in data['data']], ['Past article 2.'])
+        self.assertIsNone(data['next_cursor'])
+        self.assertIsNotNone(data['previous_cursor'])
+
+    def test_sparse_fieldsets_and_filters(self):
+        """
+        ?fields= limits every item to the named fields; the category and
+        date filters narrow the feed; bad parameters are rejected.
+        """
+        data = self.get_json(reverse('blog:api_article_list'), {'fields': 'id,title'})
+        self.assertEqual(data['data'][0], {'id': self.articles[0].pk, 'title': 'Past article 0.'})
+        data = self.get_json(reverse('blog:api_article_list'),
+            {'category': 'url_test_category', 'fields': 'id'})
+        self.assertEqual(len(data['data']), 3)
+        published = timezone.localtime(self.articles[1].published_date).date()
+        data = self.get_json(reverse('blog:api_article_list'),
+            {'date': published.isoformat(), 'fields': 'title'})
+        self.assertEqual(data['data'], [{'title': 'Past article 1.'}])
+        for params in ({'fields': 'id,text'}, {'limit': '0'}, {'date': '2017-02-31'}):
+            response = self.client.get(reverse('blog:api_article_list'), params)
+            self.assertEqual(response.status_code, 400)
+
+    @override_settings(BLOG_RESPONSE_CACHE=None)
+    def test_article_feed_single_query(self):
+        """
+        A page of the feed is one SELECT of the requested columns.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.get_json(reverse('blog:api_article_list'), {'fields': 'id,title'})
+        self.assertEqual(len(queries.captured_queries), 1)
+        self.assertNotIn('"excerpt"', queries.captured_queries[0]['sql'])
+
+    def test_conditional_requests(self):
+        """
+        The ETag holds until an article of the feed changes.
+        """
+        url = reverse('blog:api_article_list')
+        Article.objects.filter(published_date__gt=timezone.now()).delete()
+        response = self.client.get(url)
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        create_article(title = 'New article.', days = -1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_category_rename_changes_etag(self):
+        """
+        The feed shows the category titles: renaming a category changes
+        its ETag.
+        """
+        url = reverse('blog:api_article_list')
+        Article.objects.filter(published_date__gt=timezone.now()).delete()
+        etag = self.client.get(url)['ETag']
+        category = Category.objects.get(title = 'test_category')
+        category.title = 'renamed_category'
+        category.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.get_json(url)['data'][0]['category_title'], 'renamed_category')
+
+    def test_comment_feed(self):
+        """
+        The comment feed lists the approved comments of a visible article
+        oldest first; it is not found for drafts.
+        """
+        article = self.articles[0]
+        for i in range(3):
+            Comment.objects.create(article = article, author = 'me', text = 'comment %s' % i,
+                approved_comment = i != 1,
+                created_date = timezone.now() - datetime.timedelta(hours=3 - i))
+        url = reverse('blog:api_comment_list', kwargs={'pk': article.pk})
+        data = self.get_json(url)
+        self.assertEqual([item['text'] for item in data['data']], ['comment 0', 'comment 2'])
+        etag = self.client.get(url)['ETag']
+        Comment.objects.get(text = 'comment 1').approve()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        draft = Article.objects.get(title = 'Draft article.')
+        response = self.client.get(reverse('blog:api_comment_list', kwargs={'pk': draft.pk}))
+        self.assertEqual(response.status_code, 404)
+
+@override_settings(BLOG_IMAGE_WORKERS=0)
+class Test_Image_Derivatives(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root)
+
+    def store_image(self, name, size):
+        output = BytesIO()
+        Image.new('RGBA', size, (200, 30, 30, 255)).save(output, 'PNG')
+        name = default_storage.save(name, ContentFile(output.getvalue()))
+        Article.objects.filter(pk = self.article.pk).update(image = name)
+        return name
+
+    def test_derivatives_built(self):
+        """
+        Every size is written in every format, no wider than its limit, and
+        the widths are recorded on the article.
+        """
+        name = self.store_image('blog/images/photo.png', (2000, 1000))
+        process_article_image(self.article.pk, name)
+        article = Article.objects.get(pk = self.article.pk)
+        self.assertEqual(article.image_widths, '320,750,1600')
+        for size, width in (('thumb', 320), ('card', 750), ('full', 1600)):
+            for extension, pillow_format, mime_type in derivative_formats():
+                with default_storage.open(derivative_name(name, size, extension)) as derivative:
+                    image = Image.open(derivative)
+                    self.assertEqual((image.format, image.size[0]), (pillow_format, width))
+        html = Template('{% load image_extras %}{% article_picture article %}').render(
+            Context({'article': article}))
+        self.assertIn('/media/%s 320w' % derivative_name(name, 'thumb', 'jpg'), html)
+        self.assertIn('/media/%s 1600w' % derivative_name(name, 'full', 'jpg'), html)
+
+    def test_small_image_not_enlarged(self):
+        """
+        A small original is re-encoded at its own width, listed once.
+        """
+        name = self.store_image('blog/images/small.png', (200, 100))
+        process_article_image(self.article.pk, name)
+        article = Article.objects.get(pk = self.article.pk)
+        self.assertEqual(article.image_widths, '200,200,200')
+        html = Template('{% load image_extras %}{% article_picture article %}').render(
+            Context({'article': article}))
+        self.assertIn('srcset="/media/%s 200w"' % derivative_name(name, 'thumb', 'jpg'), html)
+
+    def test_replaced_image_derivatives_kept(self):
+        """
+        The derivatives of a replaced image stay until gc_media deletes the
+        image: another article may show the same file.
+        """
+        old_name = self.store_image('blog/images/old.png', (400, 300))
+        process_article_image(self.article.pk, old_name)
+        name = self.store_image('blog/images/new.png', (400, 200))
+        process_article_image(self.article.pk, name)
+        self.assertTrue(default_storage.exists(derivative_name(old_name, 'card', 'jpg')))
+        self.assertTrue(default_storage.exists(derivative_name(name, 'card', 'jpg')))
+
+    def test_backfill_command(self):
+        """
+        build_image_derivatives processes the images without derivatives.
+        """
+        self.store_image('blog/images/photo.png', (1000, 500))
+        out = StringIO()
+        call_command('build_image_derivatives', '--workers', '1', stdout = out)
+        self.assertIn('Built derivatives for 1 article images, 0 failed.', out.getvalue())
+        self.assertEqual(Article.objects.get(pk = self.article.pk).image_widths, '320,750,1000')
+        out = StringIO()
+        call_command('build_image_derivatives', '--workers', '1', stdout = out)
+        self.assertIn('Built derivatives for 0 article images', out.getvalue())
+
+    def test_list_without_derivatives_shows_original(self):
+        """
+        Until its derivatives exist a card shows the original image.
+        """
+        name = self.store_image('blog/images/photo.png', (100, 100))
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, '<img  src="/media/%s"' % name)
+
+    @override_settings(BLOG_IMAGE_WORKERS=1)
+    def test_background_failure_is_logged(self):
+        """
+        An error in a background task is logged, not lost with its future.
+        """
+        def fail(article_id, name):
+            raise IOError('disk full')
+        with self.assertLogs('blog.images', 'ERROR') as logs:
+            run_in_background(fail, 1, 'blog/images/photo.png').result()
+        self.assertIn("fail(1, 'blog/images/photo.png') failed.", logs.output[0])
+        self.assertIn('disk full', logs.output[0])
+
+
+class Test_Content_Addressed_Storage(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root, BLOG_IMAGE_WORKERS=0)
+        self.override.enable()
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+
+    def tearDown(self):
+        self.override.disable()
+        shutil.rmtree(self.media_root)
+
+    def png(self, color):
+        output = BytesIO()
+        Image.new('RGB', (40, 30), color).save(output, 'PNG')
+        return output.getvalue()
+
+    def test_identical_uploads_stored_once(self):
+        """
+        The same content uploaded under two names is one file, named after
+        its hash; other content gets another file.
+        """
+        first = default_storage.save('uploads/2017/09/26/a.PNG', ContentFile(self.png('red')))
+        second = default_storage.save('blog/images/2017/10/01/b.png', ContentFile(self.png('red')))
+        other = default_storage.save('uploads/2017/09/26/a.png', ContentFile(self.png('blue')))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertTrue(re.match(r'^cas/([0-9a-f]{2})/\1[0-9a-f]{62}\.png$', first))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.media_root, 'cas'))),
+            sorted(set([first.split('/')[1], other.split('/')[1]])))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, 'uploads')))
+
+    def test_other_names_kept(self):
+        """
+        Files outside the upload directories, such as the derivatives and
+        the CKEditor thumbnails, keep the name they are saved under.
+        """
+        name = default_storage.save('derivatives/photo.card.jpg', ContentFile(b'x'))
+        self.assertEqual(name, 'derivatives/photo.card.jpg')
+        upload = default_storage.save('uploads/photo.png', ContentFile(self.png('red')))
+        thumbnail = upload.replace('.png', '_thumb.png')
+        self.assertEqual(default_storage.save(thumbnail, ContentFile(b'x')), thumbnail)
+        self.assertEqual(default_storage.save(thumbnail, ContentFile(b'x')), thumbnail)
+
+    def test_article_media_recorded(self):
+        """
+        ArticleMedia lists the image and the uploads embedded in the body of
+        every article, and follows their edits.
+        """
+        image = default_storage.save('blog/images/photo.png', ContentFile(self.png('red')))
+        upload = default_storage.save('uploads/body.png', ContentFile(self.png('blue')))
+        article = create_article(title = 'Past article.', days = -5)
+        article.image = image
+        article.text = '<p><img src="/media/%s" /><a href="http://example.com/media/%s">x</a></p>' % (
+            upload, upload)
+        article.save()
+        self.assertEqual(set(ArticleMedia.objects.filter(article = article).values_list('name', flat = True)),
+            set([image, upload]))
+        article.text = '<p>No image.</p>'
+        article.save()
+        self.assertEqual(list(ArticleMedia.objects.filter(article = article).values_list('name', flat = True)),
+            [image])
+
+    def test_gc_media(self):
+        """
+        gc_media deletes a shared file with its thumbnail and derivatives
+        only once the last article using it is gone, and never a recent
+        upload.
+        """
+        image = default_storage.save('blog/images/photo.png', ContentFile(self.png('red')))
+        thumbnail = default_storage.save(image.replace('.png', '_thumb.png'), ContentFile(b'x'))
+        first = create_article(title = 'First article.', days = -5)
+        second = create_article(title = 'Second article.', days = -4)
+        for article in (first, second):
+            article.image = image
+            article.save()
+        process_article_image(second.pk, image)
+        derivative = derivative_name(image, 'card', 'jpg')
+        self.assertTrue(default_storage.exists(derivative))
+
+        first.delete()
+        call_command('gc_media', '--grace-hours', '0', stdout = StringIO())
+        self.assertTrue(default_storage.exists(image))
+
+        second.delete()
+        out = StringIO()
+        call_command('gc_media', stdout = out)
+        self.assertIn('Deleted 0 unused media files.', out.getvalue())
+        out = StringIO()
+        call_command('gc_media', '--grace-hours', '0', stdout = out)
+        self.assertIn('Deleted 2 unused media files.', out.getvalue())
+        for name in (image, thumbnail, derivative):
+            self.assertFalse(default_storage.exists(name))
+
+    def test_content_addressed_files_served_immutable(self):
+        """
+        Only the content-addressed files are marked as cacheable forever.
+        """
+        name = default_storage.save('uploads/photo.png', ContentFile(self.png('red')))
+        default_storage.save('derivatives/photo.card.jpg', ContentFile(b'x'))
+        request = RequestFactory().get('/media/' + name)
+        response = serve_media(request, name, document_root = self.media_root)
+        self.assertEqual(response['Cache-Control'], IMMUTABLE_CACHE_CONTROL)
+        response = serve_media(request, 'derivatives/photo.card.jpg', document_root = self.media_root)
+        self.assertFalse(response.has_header('Cache-Control'))
+
+
+class Test_Static_Serving(TestCase):
+    def setUp(self):
+        self.static_root = tempfile.mkdtemp()
+        self.media_root = tempfile.mkdtemp()
+        self.django_calls = []
+        self.application = StaticFilesApplication(self.django_application,
+            [('/static/', self.static_root), ('/media/', self.media_root)])
+        self.write(self.static_root, 'blog/css/blog.css', b'body { color: red; }\n' * 50)
+        self.write(self.static_root, 'blog/css/blog.css.gz', b'gzip')
+        self.write(self.static_root, 'blog/css/blog.css.br', b'brotli')
+        self.write(self.static_root, 'blog/css/blog.0123456789ab.css', b'body {}')
+        self.write(self.media_root, 'cas/ab/photo.png', b'0123456789')
+
+    def tearDown(self):
+        shutil.rmtree(self.static_root)
+        shutil.rmtree(self.media_root)
+
+    def write(self, root, name, content):
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def django_application(self, environ, start_response):
+        self.django_calls.append(environ['PATH_INFO'])
+        start_response('404 Not Found', [('Content-Type', 'text/plain')])
+        return [b'django']
+
+    def get(self, path, method = 'GET', **headers):
+        environ = RequestFactory().generic(method, path, **headers).environ
+        environ['wsgi.file_wrapper'] = lambda file, block_size: iter(lambda: file.read(block_size), b'')
+        response = {}
+
+        def start_response(status, headers):
+            response['status'] = int(status.split()[0])
+            response['headers'] = dict(headers)
+        body = b''.join(self.application(environ, start_response))
+        return response['status'], response['headers'], body
+
+    def test_file_served_without_django(self):
+        """
+        A file under a root is answered by the WSGI layer; other paths,
+        missing files and escapes from the root reach Django.
+        """
+        status, headers, body = self.get('/static/blog/css/blog.css')
+        self.assertEqual((status, body), (200, b'body { color: red; }\n' * 50))
+        self.assertEqual(headers['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(headers['Content-Length'], '1050')
+        self.assertEqual(headers['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.django_calls, [])
+        for path in ('/', '/static/missing.css', '/static/../etc/passwd', '/static/blog/'):
+            self.assertEqual(self.get(path)[2], b'django')
+        self.assertEqual(self.get('/static/blog/css/blog.css', method = 'POST')[2], b'django')
+
+    def test_head(self):
+        """
+        A HEAD request gets the headers only.
+        """
+        status, headers, body = self.get('/static/blog/css/blog.css', method = 'HEAD')
+        self.assertEqual((status, headers['Content-Length'], body), (200, '1050', b''))
+
+    def test_precompressed_variant(self):
+        """
+        The .br file is preferred to the .gz file, each only when accepted.
+        """
+        status, headers, body = self.get('/static/blog/css/blog.css', HTTP_ACCEPT_ENCODING = 'gzip, br')
+        self.assertEqual((body, headers['Content-Encoding']), (b'brotli', 'br'))
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        status, headers, body = self.get('/static/blog/css/blog.css', HTTP_ACCEPT_ENCODING = 'gzip, br;q=0')
+        self.assertEqual((body, headers['Content-Encoding']), (b'gzip', 'gzip'))
+        self.assertEqual(headers['Content-Type'], 'text/css; charset=utf-8')
+        status, headers, body = self.get('/static/blog/css/blog.css', HTTP_ACCEPT_ENCODING = 'identity')
+        self.assertNotIn('Content-Encoding', headers)
+
+    def test_immutable_names(self):
+        """
+        Hashed static names and content-addressed uploads are cacheable
+        forever.
+        """
+        for path in ('/static/blog/css/blog.0123456789ab.css', '/media/cas/ab/photo.png'):
+            self.assertEqual(self.get(path)[1]['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_ranges(self):
+        """
+        Single byte ranges get 206; multiple ranges and stale If-Range get the
+        whole file.
+        """
+        status, headers, body = self.get('/media/cas/ab/photo.png', HTTP_RANGE = 'bytes=2-5')
+        self.assertEqual((status, body, headers['Content-Range']), (206, b'2345', 'bytes 2-5/10'))
+        status, headers, body = self.get('/media/cas/ab/photo.png', HTTP_RANGE = 'bytes=-3')
+        self.assertEqual((status, body), (206, b'789'))
+        status, headers, body = self.get('/media/cas/ab/photo.png', HTTP_RANGE = 'bytes=8-')
+        self.assertEqual((status, body), (206, b'89'))
+        status, headers, body = self.get('/media/cas/ab/photo.png', HTTP_RANGE = 'bytes=20-')
+        self.assertEqual((status, headers['Content-Range']), (416, 'bytes */10'))
+        status, headers, body = self.get('/media/cas/ab/photo.png', HTTP_RANGE = 'bytes=0-1,4-5')
+        self.assertEqual((status, body), (200, b'0123456789'))
+        status, headers, body = self.get('/media/cas/ab/photo.png', HTTP_RANGE = 'bytes=2-5',
+            HTTP_IF_RANGE = '"stale"')
+        self.assertEqual(status, 200)
+
+    def test_not_modified(self):
+        """
+        If-None-Match takes precedence over If-Modified-Since.
+        """
+        headers = self.get('/media/cas/ab/photo.png')[1]
+        status, headers, body = self.get('/media/cas/ab/photo.png', HTTP_IF_NONE_MATCH = headers['ETag'])
+        self.assertEqual((status, body), (304, b''))
+        status = self.get('/media/cas/ab/photo.png', HTTP_IF_MODIFIED_SINCE = headers['Last-Modified'])[0]
+        self.assertEqual(status, 304)
+        status = self.get('/media/cas/ab/photo.png', HTTP_IF_NONE_MATCH = '"other"',
+            HTTP_IF_MODIFIED_SINCE = headers['Last-Modified'])[0]
+        self.assertEqual(status, 200)
+
+
+class Test_Asset_Bundles(TestCase):
+    def test_minify_css(self):
+        """
+        Comments and needless whitespace go; strings and licences stay.
+        """
+        css = '/*! licence */\n/* note */\na > b ,\n c {\n  content: "  /* x */ ";\n  margin: 0 auto ;\n}\n'
+        self.assertEqual(minify_css(css),
+            '/*! licence */\na > b,c{content: "  /* x */ ";margin: 0 auto;}\n')
+
+    def test_rebase_css_urls(self):
+        """
+        Relative urls keep pointing at the same file from the bundle.
+        """
+        css = ("src: url('../fonts/a.eot?#iefix'); background: url(data:image/png;base64,x) "
+            "url(/static/b.png) url(img/c.png)")
+        self.assertEqual(rebase_css_urls(css, 'blog/vendor/bootstrap/css/x.css', 'blog/bundles/blog.css'),
+            "src: url('../vendor/bootstrap/fonts/a.eot?#iefix'); background: url(data:image/png;base64,x) "
+            "url(/static/b.png) url(../vendor/bootstrap/css/img/c.png)")
+
+    def test_separate_files_before_collectstatic(self):
+        """
+        Until the bundle is collected, the page links every file of it.
+        """
+        response = self.client.get(reverse('blog:article_list'))
+        for name in BUNDLES['blog/bundles/blog.css'] + BUNDLES['blog/bundles/blog.js']:
+            self.assertContains(response, '/static/%s' % name)
+        self.assertNotContains(response, 'bundles/')
+
+    def test_collectstatic(self):
+        """
+        collectstatic writes hashed, compressed bundles, and the page loads
+        one file per bundle.
+        """
+        static_root = tempfile.mkdtemp()
+        try:
+            with override_settings(STATIC_ROOT = static_root, BLOG_RESPONSE_CACHE = None):
+                call_command('collectstatic', interactive = False, verbosity = 0,
+                    ignore_patterns = ['ckeditor', 'admin'])
+                with open(os.path.join(static_root, 'staticfiles.json')) as manifest:
+                    paths = json.load(manifest)['paths']
+                for name in BUNDLES:
+                    self.assertTrue(re.match(r'^blog/bundles/blog\.[0-9a-f]{12}\.(css|js)$', paths[name]))
+                    self.assertTrue(os.path.exists(os.path.join(static_root, paths[name] + '.gz')))
+                with open(os.path.join(static_root, paths['blog/bundles/blog.css'])) as css:
+                    self.assertIn('url("../%s")' % paths['blog/vendor/bootstrap/fonts/glyphicons-halflings-regular.woff2'].replace('blog/', '', 1),
+                        css.read())
+                response = self.client.get(reverse('blog:article_list'))
+                self.assertContains(response, '<link href="/static/%s" rel="stylesheet">'
+                    % paths['blog/bundles/blog.css'], html = False)
+                self.assertContains(response, '<script src="/static/%s"></script>' % paths['blog/bundles/blog.js'])
+                self.assertNotContains(response, 'jquery.min.js')
+        finally:
+            shutil.rmtree(static_root)
+
+
+class Test_Connection_Pool(TestCase):
+    def setUp(self):
+        fd, self.database = tempfile.mkstemp(suffix = '.sqlite3')
+        os.close(fd)
+        self.wrappers = []
+
+    def tearDown(self):
+        for wrapper in self.wrappers:
+            wrapper.close()
+        get_pool('pool_test', self.settings()).close()
+        os.remove(self.database)
+
+    def settings(self, **pool):
+        return {'ENGINE': 'myblog.dbpool.sqlite3', 'NAME': self.database, 'USER': '', 'PASSWORD': '',
+            'HOST': '', 'PORT': '', 'OPTIONS': {}, 'TIME_ZONE': None, 'AUTOCOMMIT': True,
+            'ATOMIC_REQUESTS': False, 'CONN_MAX_AGE': 0, 'POOL': pool}
+
+    def wrapper(self, **pool):
+        wrapper = PooledSQLiteWrapper(self.settings(**pool), alias = 'pool_test')
+        self.wrappers.append(wrapper)
+        return wrapper
+
+    def request(self, wrapper):
+        """
+        Connect, query and close as a request does; return the connection used.
+        """
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        used = wrapper.connection
+        wrapper.close()
+        return used
+
+    def test_connection_reused(self):
+        """
+        A closed connection goes back to the pool, for any wrapper.
+        """
+        first = self.request(self.wrapper())
+        self.assertIs(self.request(self.wrapper()), first)
+        pool = get_pool('pool_test', self.settings())
+        self.assertEqual((pool.size, pool.idle), (1, 1))
+
+    def test_max_lifetime(self):
+        """
+        A connection older than MAX_LIFETIME is closed instead of reused.
+        """
+        wrapper = self.wrapper(MAX_LIFETIME = 0)
+        first = self.request(wrapper)
+        self.assertIsNot(self.request(wrapper), first)
+        self.assertEqual(get_pool('pool_test', self.settings()).idle, 0)
+
+    def test_health_check(self):
+        """
+        A broken idle connection is dropped when it is checked.
+        """
+        wrapper = self.wrapper(HEALTH_CHECK_INTERVAL = 0)
+        first = self.request(wrapper)
+        first.close()
+        self.assertIsNot(self.request(wrapper), first)
+
+    def test_transaction_not_pooled(self):
+        """
+        A connection closed inside a transaction is not handed out again.
+        """
+        wrapper = self.wrapper()
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        first = wrapper.connection
+        wrapper.close()
+        self.assertIsNot(self.request(self.wrapper()), first)
+
+    def test_pool_size_limit(self):
+        """
+        connect() waits TIMEOUT seconds for a free connection, then fails.
+        """
+        busy = self.wrapper(MAX_SIZE = 1, TIMEOUT = 0.05)
+        busy.ensure_connection()
+        with self.assertRaises(OperationalError):
+            self.wrapper().ensure_connection()
+        busy.close()
+        self.request(self.wrapper())
+
+    def test_benchmark_command(self):
+        """
+        benchmark_connections measures both backends on a SQLite stand-in.
+        """
+        out = StringIO()
+        call_command('benchmark_connections', requests = 5, connect_delay = 1, stdout = out)
+        self.assertIn('pooled  mean', out.getvalue())
+        self.assertIn('Pooling saves', out.getvalue())
+
+
+@override_settings(BLOG_READ_REPLICAS = ['replica'], BLOG_RESPONSE_CACHE = None)
+class Test_Read_Replicas(TestCase):
+    """
+    'replica' is a second SQLite database holding the rows replicated so far.
+    """
+    def setUp(self):
+        fd, self.replica_name = tempfile.mkstemp(suffix = '.sqlite3')
+        os.close(fd)
+        connections.databases['replica'] = dict(connections.databases['default'], NAME = self.replica_name)
+        call_command('migrate', database = 'replica', verbosity = 0, interactive = False)
+        category = Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        user = User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.replicated = create_article(title = 'Replicated article.', days = -5)
+        Category.objects.using('replica').bulk_create([category])
+        User.objects.using('replica').bulk_create([user])
+        Article.objects.using('replica').bulk_create([self.replicated])
+        # Written on the primary, not replicated yet.
+        self.fresh = create_article(title = 'Fresh article.', days = -1)
+        Category.objects.create(title = 'Fresh category', text = 'text', urlstext = 'fresh')
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        delattr(connections._connections, 'replica')
+        os.remove(self.replica_name)
+
+    def test_pages_read_from_replica(self):
+        """
+        The list, detail and search pages and the sidebar read from the
+        replica.
+        """
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Replicated article.')
+        self.assertNotContains(response, 'Fresh article.')
+        self.assertNotContains(response, 'Fresh category')
+        response = self.client.get(reverse('blog:article_detail', kwargs = {'pk': self.fresh.pk}))
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(reverse('blog:article_detail', kwargs = {'pk': self.replicated.pk}))
+        self.assertContains(response, 'Replicated article.')
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+    def test_pages_without_replica_reads_use_primary(self):
+        """
+        Views not marked replica_reads, like the drafts, read from the
+        primary; their sidebar still comes from the replica.
+        """
+        create_draft_article(title = 'Draft article.', days = -1)
+        self.client.login(username = 'test_usr', password = 'secret')
+        response = self.client.get(reverse('blog:article_draft_list'))
+        self.assertContains(response, 'Draft article.')
+        self.assertNotContains(response, 'Fresh category')
+
+    def test_writer_pinned_to_primary(self):
+        """
+        A request that writes pins its client to the primary, which then
+        sees its own changes.
+        """
+        response = self.client.post(reverse('blog:article_detail', kwargs = {'pk': self.replicated.pk}),
+            {'author': 'me', 'text': 'A comment.'})
+        self.assertEqual(Comment.objects.using('replica').count(), 0)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+        self.assertEqual(response.cookies[PIN_COOKIE_NAME]['max-age'], 5)
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Fresh article.')
+
+        self.client.cookies[PIN_COOKIE_NAME] = '1'
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertNotContains(response, 'Fresh article.')
+
+    def test_response_cache_not_filled_from_lagging_replica(self):
+        """
+        Within BLOG_REPLICA_LAG of an invalidation a page read from the
+        replica is not cached; later it is.
+        """
+        caches['default'].clear()
+        with override_settings(BLOG_RESPONSE_CACHE = 'default'):
+            self.client.get(reverse('blog:article_list'))
+            with CaptureQueriesContext(connections['replica']) as queries:
+                self.client.get(reverse('blog:article_list'))
+            self.assertTrue(len(queries))
+            with override_settings(BLOG_REPLICA_LAG = 0):
+                self.client.get(reverse('blog:article_list'))
+                with CaptureQueriesContext(connections['replica']) as queries:
+                    self.client.get(reverse('blog:article_list'))
+                self.assertEqual(len(queries), 0)
+        caches['default'].clear()
+
+    def test_session_read_from_primary(self):
+        """
+        A session written on the primary is found while the pages read from
+        the replica.
+        """
+        self.client.login(username = 'test_usr', password = 'secret')
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertNotContains(response, 'Fresh article.')
+        self.assertEqual(response.context['user'].username, 'test_usr')
+
+
+class Test_Request_Metrics(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        create_article(title = 'Past article.', days = -5)
+
+    @override_settings(BLOG_RESPONSE_CACHE = None)
+    def test_access_log(self):
+        """
+        Every request is logged with its view, queries, render time and
+        size.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertLogs('blog.access', 'INFO') as logs:
+                response = self.client.get(reverse('blog:article_list'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['view'], 'blog:article_list')
+        self.assertEqual((record['method'], record['path'], record['status']), ('GET', '/', 200))
+        self.assertEqual(record['queries'], len(queries))
+        self.assertGreater(record['sql_ms'], 0)
+        self.assertGreater(record['template_ms'], 0)
+        self.assertLessEqual(record['sql_ms'] + record['template_ms'], record['duration_ms'])
+        self.assertEqual(record['bytes'], len(response.content))
+
+    @override_settings(BLOG_SLOW_REQUEST_MS = 0)
+    def test_slow_log(self):
+        """
+        A request over BLOG_SLOW_REQUEST_MS is logged with its queries.
+        """
+        with self.assertLogs('blog.slow', 'WARNING') as logs:
+            self.client.get(reverse('blog:article_list'), {'page': 2})
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(len(record['sql']), record['queries'])
+        self.assertTrue(any('blog_article' in query['sql'] for query in record['sql']))
+
+    def test_fast_request_not_in_slow_log(self):
+        """
+        A request under the threshold only goes to the access log.
+        """
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger('blog.slow').addHandler(handler)
+        try:
+            with override_settings(BLOG_SLOW_REQUEST_MS = 60000):
+                self.client.get(reverse('blog:article_list'))
+        finally:
+            logging.getLogger('blog.slow').removeHandler(handler)
+        self.assertEqual(records, [])
+
+
+class Test_Comment_Queue(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'queue', 'comments.sqlite3')
+        # The worker never wakes up during a test: the tests drain the queue.
+        self.settings = override_settings(BLOG_COMMENT_QUEUE = self.path, BLOG_COMMENT_QUEUE_INTERVAL = 3600)
+        self.settings.enable()
+
+    def tearDown(self):
+        stop_worker()
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def post_comment(self, text):
+        return self.client.post(reverse('blog:article_detail', kwargs = {'pk': self.article.pk}),
+            {'author': 'reader', 'text': text})
+
+    def test_write_behind(self):
+        """
+        A posted comment goes to the journal, and into the database when
+        the queue is drained.
+        """
+        url = reverse('blog:article_detail', kwargs = {'pk': self.article.pk})
+        self.assertNotContains(self.client.get(url), 'Queued comment')
+        for i in range(3):
+            self.assertRedirects(self.post_comment('Queued comment %s.' % i), url)
+        self.assertEqual(Comment.objects.count(), 0)
+        self.assertEqual(len(get_journal()), 3)
+
+        self.assertEqual(drain(batch_size = 2), 3)
+        self.assertEqual(len(get_journal()), 0)
+        self.assertEqual(list(Comment.objects.order_by('id').values_list('article', 'author', 'text',
+            'approved_comment')), [(self.article.pk, 'reader', 'Queued comment %s.' % i, False) for i in range(3)])
+        # bulk_create() sends no signal: the cached page is invalidated by hand.
+        self.assertContains(self.client.get(url), 'Queued comment 2.')
+
+    def test_invalid_comment(self):
+        """
+        Only valid comments are queued.
+        """
+        response = self.post_comment('')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(get_journal()), 0)
+
+    def test_survives_restart(self):
+        """
+        The journal is on disk: a new process delivers what the previous
+        one queued.
+        """
+        self.post_comment('Before the restart.')
+        self.assertEqual(len(CommentJournal(self.path)), 1)
+        self.assertEqual(drain(CommentJournal(self.path)), 1)
+        self.assertEqual(Comment.objects.get().text, 'Before the restart.')
+
+    def test_redelivery(self):
+        """
+        A batch claimed by a worker that died is delivered once its lease
+        expires, and not before.
+        """
+        journal = get_journal()
+        self.post_comment('Held comment.')
+        claim, rows = journal.claim(10)
+        self.assertEqual([row[3] for row in rows], ['Held comment.'])
+        self.assertEqual(drain(), 0)
+        self.assertEqual(len(journal), 1)
+        journal.acknowledge(claim)
+
+        self.post_comment('Orphaned comment.')
+        journal.claim(10, lease = -1)
+        self.assertEqual(drain(), 1)
+        self.assertEqual(Comment.objects.get().text, 'Orphaned comment.')
+
+    def test_deleted_article(self):
+        """
+        A comment on an article deleted before its delivery is buried, and
+        the comments behind it are delivered.
+        """
+        doomed = create_article(title = 'Doomed article.', days = -2)
+        self.client.post(reverse('blog:article_detail', kwargs = {'pk': doomed.pk}),
+            {'author': 'reader', 'text': 'Too late.'})
+        self.post_comment('On time.')
+        doomed_id = doomed.pk
+        doomed.delete()
+        with self.assertLogs('blog.comment_queue', 'WARNING'):
+            self.assertEqual(drain(), 1)
+        self.assertEqual(Comment.objects.get().text, 'On time.')
+        journal = get_journal()
+        self.assertEqual(len(journal), 0)
+        self.assertEqual([(row[1], row[3]) for row in journal.dead()], [(doomed_id, 'Too late.')])
+
+    def test_bad_row(self):
+        """
+        A row the database refuses is buried after the batch is retried
+        row by row; the other rows of the batch are inserted.
+        """
+        for text in ('First.', 'Refused.', 'Third.'):
+            self.post_comment(text)
+        save = Comment.save
+
+        def refuse(comment, *args, **kwargs):
+            if comment.text == 'Refused.':
+                raise IntegrityError('refused')
+            return save(comment, *args, **kwargs)
+        with mock.patch.object(Comment.objects, 'bulk_create', side_effect = IntegrityError('batch')), \
+                mock.patch.object(Comment, 'save', refuse), self.assertLogs('blog.comment_queue', 'WARNING'):
+            self.assertEqual(drain(), 2)
+        self.assertEqual(list(Comment.objects.order_by('id').values_list('text', flat = True)), ['First.', 'Third.'])
+        self.assertEqual([row[3:] for row in get_journal().dead()], [('Refused.', 'refused')])
+        self.assertEqual(len(get_journal()), 0)
+
+    def test_drain_command(self):
+        self.post_comment('Drained comment.')
+        out = StringIO()
+        call_command('drain_comment_queue', stdout = out)
+        self.assertIn('Inserted 1 queued comments, 0 left.', out.getvalue())
+        self.assertEqual(Comment.objects.get().text, 'Drained comment.')
+        with override_settings(BLOG_COMMENT_QUEUE = None):
+            with self.assertRaisesRegex(CommandError, 'BLOG_COMMENT_QUEUE'):
+                call_command('drain_comment_queue')
+
+
+class Test_Comment_Pagination(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+        start = timezone.now() - datetime.timedelta(days = 1)
+        # Pairs of comments posted at the same time: the id breaks the tie.
+        self.comments = [Comment.objects.create(article = self.article, author = 'reader',
+            text = 'Comment %s.' % i, created_date = start + datetime.timedelta(minutes = i // 2))
+            for i in range(COMMENT_PAGE_SIZE * 2 + 5)]
+        Comment.objects.create(article = self.article, author = 'reader', text = 'Future comment.',
+            created_date = timezone.now() + datetime.timedelta(days = 1))
+
+    def test_detail_page(self):
+        """
+        The article page renders the first page of comments and the cursor
+        of the next one.
+        """
+        response = self.client.get(reverse('blog:article_detail', kwargs = {'pk': self.article.pk}))
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.comments[:COMMENT_PAGE_SIZE])
+        self.assertContains(response, 'Comment %s.' % (COMMENT_PAGE_SIZE - 1))
+        self.assertNotContains(response, 'Comment %s.' % COMMENT_PAGE_SIZE)
+        self.assertContains(response, 'data-cursor="%s"' % comments.next_cursor)
+
+    def test_comment_pages(self):
+        """
+        Following next_cursor from the article page walks every comment
+        once, in order, without the future ones.
+        """
+        response = self.client.get(reverse('blog:article_detail', kwargs = {'pk': self.article.pk}))
+        cursor = response.context['comments'].next_cursor
+        texts = [comment.text for comment in response.context['comments']]
+        url = reverse('blog:article_comments', kwargs = {'pk': self.article.pk})
+        while cursor:
+            data = json.loads(self.client.get(url, {'cursor': cursor}).content.decode('utf-8'))
+            self.assertLessEqual(len(data['comments']), COMMENT_PAGE_SIZE)
+            for item in data['comments']:
+                self.assertIn('<p>%s</p>' % item['text'], data['html'])
+            texts.extend(item['text'] for item in data['comments'])
+            cursor = data['next_cursor']
+        self.assertEqual(texts, [comment.text for comment in self.comments])
+
+    def test_draft_comments(self):
+        """
+        The comments of a draft are only served to its author.
+        """
+        draft = create_draft_article(title = 'Draft article.', days = -1)
+        Comment.objects.create(article = draft, author = 'reader', text = 'Early comment.',
+            created_date = timezone.now() - datetime.timedelta(hours = 1))
+        url = reverse('blog:article_comments', kwargs = {'pk': draft.pk})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.client.login(username = 'test_usr', password = 'secret')
+        data = json.loads(self.client.get(url).content.decode('utf-8'))
+        self.assertEqual([item['text'] for item in data['comments']], ['Early comment.'])
+        self.assertIsNone(data['next_cursor'])
+
+    def test_new_comment_invalidates_the_pages(self):
+        """
+        A new comment shows on the cached comment pages.
+        """
+        url = reverse('blog:article_comments', kwargs = {'pk': self.article.pk})
+        cursor = json.loads(self.client.get(url).content.decode('utf-8'))['next_cursor']
+        cursor = json.loads(self.client.get(url, {'cursor': cursor}).content.decode('utf-8'))['next_cursor']
+        self.assertEqual(len(json.loads(self.client.get(url, {'cursor': cursor}).content.decode('utf-8'))['comments']), 5)
+        Comment.objects.create(article = self.article, author = 'reader', text = 'New comment.')
+        data = json.loads(self.client.get(url, {'cursor': cursor}).content.decode('utf-8'))
+        self.assertEqual(data['comments'][-1]['text'], 'New comment.')
+
+
+class Test_Benchmarks(TestCase):
+    def test_seed_corpus(self):
+        """
+        The seeded corpus has its derived columns filled in, as if every row
+        had been saved one by one.
+        """
+        hot_id, category, author = seed_corpus(articles = 30, comments = 200, categories = 4,
+            authors = 3, hot_comments = 50)
+        self.assertEqual((Article.objects.count(), Comment.objects.count()), (30, 200))
+        self.assertEqual((Category.objects.count(), User.objects.count()), (4, 3))
+        hot = Article.objects.get(pk = hot_id)
+        self.assertEqual(hot, Article.objects.latest('created_date'))
+        self.assertGreaterEqual(hot.comments.count(), 50)
+        self.assertEqual((hot.category.urlstext, hot.author.username), (category, author))
+        for article in Article.objects.all():
+            self.assertEqual(article.approved_comment_count,
+                article.comments.filter(approved_comment = True).count())
+            self.assertTrue(article.excerpt)
+        self.assertEqual(sum(PublishedDay.objects.values_list('articles', flat = True)),
+            Article.objects.filter(published_date__isnull = False).count())
+
+    @override_settings(BLOG_RESPONSE_CACHE = None)
+    def test_run_benchmarks(self):
+        """
+        Every scenario answers and is measured.
+        """
+        hot = seed_corpus(articles = 20, comments = 60, categories = 3, authors = 2, hot_comments = 20)
+        get_search_backend().reset()
+        results = run_benchmarks(get_scenarios(*hot), iterations = 3, warmup = 1, allocation_iterations = 1)
+        self.assertEqual(list(results), ['article_list', 'article_list_ajax', 'category_list', 'author_list',
+            'date_list', 'search', 'article_detail', 'sidebar_tags'])
+        for result in results.values():
+            self.assertEqual(result['iterations'], 3)
+            self.assertLessEqual(result['min_ms'], result['p50_ms'])
+            self.assertLessEqual(result['p50_ms'], result['max_ms'])
+            self.assertGreater(result['queries'], 0)
+            self.assertGreater(result['peak_alloc_kb'], 0)
+
+    def test_compare(self):
+        """
+        A slower median beyond the tolerance, or more queries, is a
+        regression.
+        """
+        baseline = {'list': {'p50_ms': 10.0, 'queries': 4}, 'detail': {'p50_ms': 10.0, 'queries': 4}}
+        results = {'list': {'p50_ms': 12.0, 'queries': 4}, 'detail': {'p50_ms': 13.0, 'queries': 5},
+            'new': {'p50_ms': 100.0, 'queries': 50}}
+        self.assertEqual([name for name, message in compare(results, baseline, 0.25)], ['detail', 'detail'])
+        self.assertEqual(compare(results, baseline, 0.5), [('detail', '5 queries, was 4')])
+
+
+# Queries and milliseconds each route may take, with several articles and
+# comments on the page: a query per row shows as a broken budget. The
+# requests are logged in, which costs the session and user queries.
+# The pages with the sidebar count the second query of the calendar, run on
+# the days an article went live.
+ROUTE_BUDGETS = {
+    'blog:article_list': (7, 500),
+    'blog:article_categories_list': (7, 500),
+    'blog:article_author_list': (7, 500),
+    'blog:article_date_list': (7, 500),
+    'blog:search_list': (6, 500),
+    'blog:article_draft_list': (7, 500),
+    'blog:article_detail': (9, 500),
+    'blog:article_comments': (5, 500),
+    'blog:article_new': (6, 500),
+    'blog:article_edit': (9, 500),
+    'blog:article_publish': (14, 500),
+    'blog:article_delete': (8, 500),
+    'blog:comment_approve': (10, 500),
+    'blog:comment_remove': (6, 500),
+    'blog:calendar_month': (2, 500),
+    'blog:register': (5, 500),
+    'blog:api_article_list': (1, 500),
+    'blog:api_comment_list': (2, 500),
+}
+
+
+# The public routes requested by an anonymous visitor, with the response
+# cache off: no session or user queries, and every page rendered. The pages
+# with the sidebar count the second query of the calendar too.
+ANONYMOUS_ROUTE_BUDGETS = {
+    'blog:article_list': (5, 500),
+    'blog:article_categories_list': (5, 500),
+    'blog:article_author_list': (5, 500),
+    'blog:article_date_list': (5, 500),
+    'blog:search_list': (4, 500),
+    'blog:article_detail': (7, 500),
+    'blog:article_comments': (2, 500),
+    'blog:calendar_month': (2, 500),
+    'blog:register': (3, 500),
+    'blog:api_article_list': (1, 500),
+    'blog:api_comment_list': (2, 500),
+}
+
+
+@override_settings(BLOG_RESPONSE_CACHE = None)
+class Test_Query_Budgets(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.articles = [create_article(title = 'Article %s.' % i, days = -i) for i in range(1, 7)]
+        self.draft = create_draft_article(title = 'Draft article.', days = -1)
+        for article in self.articles:
+            for i in range(3):
+                Comment.objects.create(article = article, author = 'reader', text = 'Comment %s.' % i,
+                    approved_comment = i > 0)
+        self.comment = Comment.objects.filter(approved_comment = False).first()
+        self.client.login(username = 'test_usr', password = 'secret')
+
+    def route_requests(self):
+        article = self.articles[0]
+        date = timezone.localtime(article.published_date)
+        return {
+            'blog:article_list': reverse('blog:article_list'),
+            'blog:article_categories_list': reverse('blog:article_categories_list',
+                kwargs = {'categoryName': 'url_test_category'}),
+            'blog:article_author_list': reverse('blog:article_author_list', kwargs = {'authorName': 'test_usr'}),
+            'blog:article_date_list': reverse('blog:article_date_list', kwargs = {'year': '%04d' % date.year,
+                'month': '%02d' % date.month, 'day': '%02d' % date.day}),
+            'blog:search_list': reverse('blog:search_list') + '?srchtxt=article',
+            'blog:article_draft_list': reverse('blog:article_draft_list'),
+            'blog:article_detail': reverse('blog:article_detail', kwargs = {'pk': article.pk}),
+            'blog:article_comments': reverse('blog:article_comments', kwargs = {'pk': article.pk}),
+            'blog:article_new': reverse('blog:article_new'),
+            'blog:article_edit': reverse('blog:article_edit', kwargs = {'pk': article.pk}),
+            'blog:article_publish': reverse('blog:article_publish', kwargs = {'pk': self.draft.pk}),
+            'blog:article_delete': reverse('blog:article_delete', kwargs = {'pk': article.pk}),
+            'blog:comment_approve': reverse('blog:comment_approve', kwargs = {'pk': self.comment.pk}),
+            'blog:comment_remove': reverse('blog:comment_remove', kwargs = {'pk': self.comment.pk}),
+            'blog:calendar_month': reverse('blog:calendar_month', kwargs = {'year': '%04d' % date.year,
+                'month': '%02d' % date.month}),
+            'blog:register': reverse('blog:register'),
+            'blog:api_article_list': reverse('blog:api_article_list'),
+            'blog:api_comment_list': reverse('blog:api_comment_list', kwargs = {'pk': article.pk}),
+        }
+
+    def test_every_route_has_a_budget(self):
+        """
+        A new route comes with its budget.
+        """
+        self.assertEqual(set(ROUTE_BUDGETS), route_names(blog_urls))
+        self.assertEqual(set(self.route_requests()), route_names(blog_urls))
+        self.assertLessEqual(set(ANONYMOUS_ROUTE_BUDGETS), route_names(blog_urls))
+
+    def test_route_budgets(self):
+        """
+        No route runs more queries, or takes longer, than its budget.
+        """
+        for name, path in sorted(self.route_requests().items()):
+            queries, ms = ROUTE_BUDGETS[name]
+            with self.subTest(route = name):
+                # The first request compiles the templates.
+                if name not in ('blog:article_publish', 'blog:comment_approve'):
+                    self.client.get(path)
+                with query_budget(queries, ms = ms, label = name):
+                    response = self.client.get(path)
+                self.assertIn(response.status_code, (200, 302))
+
+    def test_anonymous_route_budgets(self):
+        """
+        No public route runs more queries, or takes longer, than its budget
+        for an anonymous visitor.
+        """
+        self.client.logout()
+        requests = self.route_requests()
+        for name, (queries, ms) in sorted(ANONYMOUS_ROUTE_BUDGETS.items()):
+            path = requests[name]
+            with self.subTest(route = name):
+                # The first request compiles the templates.
+                self.client.get(path)
+                with query_budget(queries, ms = ms, label = name):
+                    response = self.client.get(path)
+                self.assertEqual(response.status_code, 200)
+
+    def test_query_budget(self):
+        """
+        A broken budget fails with the SQL that ran.
+        """
+        with self.assertRaisesRegex(AssertionError, r'2 queries run, the budget is 1:\n1\. SELECT'):
+            with query_budget(1):
+                list(Category.objects.all())
+                list(Article.objects.all())
+        with self.assertRaisesRegex(AssertionError, r'took .* ms, the budget is 0 ms'):
+            with self.settings(BLOG_TIME_BUDGET_SCALE = 1), query_budget(1, ms = 0):
+                time.sleep(0.001)
+        # Without BLOG_TIME_BUDGET_SCALE only the queries are counted.
+        with query_budget(1, ms = 0):
+            time.sleep(0.001)
+
+        @query_budget(1)
+        def one_query():
+            return Category.objects.count()
+        self.assertEqual(one_query(), 1)
+
+
+class Test_Article_Excerpt(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create(username='test_usr', password ='secret')
+
+    def test_excerpt_computed_on_save(self):
+        """
+        The excerpt is the stripped, truncated body of the article.
+        """
+        article = create_article(title = 'Past article.', days = -5)
+        article.text = '<p>First &amp; line</p>\n<p>' + 'x' * 500 + '</p>'
+        article.save()
+        article = Article.objects.get(pk = article.pk)
+        self.assertTrue(article.excerpt.startswith('First &amp; line<br />'))
+        self.assertEqual(len(article.excerpt), 400)
+        self.assertNotIn('<p>', article.excerpt)
+
+    def test_excerpt_saved_with_update_fields(self):
+        """
+        Saving only the text writes the new excerpt too.
+        """
+        article = create_article(title = 'Past article.', days = -5)
+        article.text = '<p>New text</p>'
+        article.save(update_fields = ['text'])
+        self.assertEqual(Article.objects.get(pk = article.pk).excerpt, 'New text')
+
+    def test_backfill_excerpts_command(self):
+        """
+        backfill_excerpts fills the excerpts left empty by older rows.
+        """
+        article = create_article(title = 'Past article.', days = -5)
+        Article.objects.update(excerpt = '')
+        call_command('backfill_excerpts', stdout = StringIO())
+        self.assertEqual(Article.objects.get(pk = article.pk).excerpt, 'test_text')
+
+    def test_article_list_does_not_select_text(self):
+        """
+        The list pages render the excerpt without fetching the body.
+        """
+        create_article(title = 'Past article.', days = -5)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'test_text')
+        for query in queries.captured_queries:
+            self.assertNotIn('"blog_article"."text"', query['sql'])
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:article_list'),
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['json_object'][0]['text'], 'test_text')
+        for query in queries.captured_queries:
+            self.assertNotIn('"blog_article"."text"', query['sql'])
+
+
+@override_settings(BLOG_SEARCH_REFRESH_INTERVAL = 3600)
+class Test_Search_Index_Hooks(TransactionTestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create(username='test_usr', password ='secret')
+        self.backend = get_search_backend()
+        self.backend.reset()
+        self.backend.rebuild()
+
+    def tearDown(self):
+        self.backend.reset()
+
+    def test_commit_updates_index(self):
+        """
+        A committed save or delete reaches the index of the process without
+        waiting for the refresh.
+        """
+        article = create_article(title = 'Committed article', days = -5)
+        self.assertEqual(set(self.backend.score('committed')), {article.pk})
+        article.title = 'Renamed article'
+        article.save()
+        self.assertEqual(set(self.backend.score('committed')), set())
+        self.assertEqual(set(self.backend.score('renamed')), {article.pk})
+        article_id = article.pk
+        article.delete()
+        self.assertEqual(set(self.backend.score('renamed')), set())
+        self.assertNotIn(article_id, self.backend.article_ids)
+
+    def test_rolled_back_save_is_not_indexed(self):
+        """
+        The index follows commits only.
+        """
+        try:
+            with transaction.atomic():
+                create_article(title = 'Rolled back', days = -5)
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEqual(set(self.backend.score('rolled')), set())
+
+
+class Test_Search(TestCase):
+    def setUp(self):
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create(username='test_usr', password ='secret')
+        self.backend = get_search_backend()
+        self.backend.reset()
+
+    def search_titles(self, srchtxt):
+        response = self.client.get(reverse('blog:search_list'),
+            {'srchtxt': srchtxt})
+        self.assertEqual(response.status_code, 200)
+        return [article.title for article in response.context['list_article_pag']]
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Django, MySQL & AJAX!'),
+            ['django', 'mysql', 'ajax'])
+
+    def test_search_ranks_by_relevance(self):
+        """
+        Articles mentioning the terms more often, or in the title, rank first.
+        """
+        article = create_article(title = 'Python tips', days = -10)
+        article.text = '<p>A few words about python.</p>'
+        article.save()
+        article = create_article(title = 'Cooking', days = -5)
+        article.text = '<p>Nothing to see here, python once.</p>' + ' filler' * 50
+        article.save()
+        article = create_article(title = 'Gardening', days = -1)
+        article.text = '<p>No match.</p>'
+        article.save()
+        self.assertEqual(self.search_titles('python'), ['Python tips', 'Cooking'])
+
+    def test_search_ignores_markup(self):
+        """
+        Tag names and attributes in the rich text are not searchable.
+        """
+        article = create_article(title = 'Styled', days = -5)
+        article.text = '<p class="strong"><strong>Bold</strong> words</p>'
+        article.save()
+        self.assertEqual(self.search_titles('strong'), [])
+        self.assertEqual(self.search_titles('bold'), ['Styled'])
+
+    def test_search_hides_drafts_and_future_articles(self):
+        """
+        Only articles published in the past are returned.
+        """
+        create_article(title = 'Past searchable', days = -5)
+        create_article(title = 'Future searchable', days = 5)
+        create_draft_article(title = 'Draft searchable', days = -5)
+        self.assertEqual(self.search_titles('searchable'), ['Past searchable'])
+
+    def test_search_index_updates_incrementally(self):
+        """
+        Saved and deleted articles are applied to a built index.
+        """
+        article = create_article(title = 'Before edit', days = -5)
+        self.assertEqual(self.search_titles('edited'), [])
+        article.title = 'After edited'
+        article.save()
+        self.backend.index_article(article)
+        self.assertEqual(self.search_titles('edited'), ['After edited'])
+        self.backend.remove_article(article.pk)
+        self.assertEqual(self.search_titles('edited'), [])
+
+    @override_settings(BLOG_SEARCH_REFRESH_INTERVAL = 0)
+    def test_search_sees_other_processes(self):
+        """
+        Articles written, edited or deleted by another process, whose hooks
+        never ran here, are found or dropped by the next search.
+        """
+        article = create_article(title = 'Before edit', days = -5)
+        other = create_article(title = 'Doomed edited', days = -4)
+        self.assertEqual(self.search_titles('edited'), ['Doomed edited'])
+        later = timezone.now() + datetime.timedelta(seconds = 1)
+        Article.objects.filter(pk = article.pk).update(title = 'After edited', updated_at = later)
+        Article.objects.bulk_create([Article(author = article.author, category = article.category,
+            title = 'Bulk edited', text = 'text', published_date = article.published_date,
+            updated_at = later)])
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM blog_article WHERE id = %s', [other.pk])
+        self.assertEqual(sorted(self.search_titles('edited')), ['After edited', 'Bulk edited'])
+
+    def test_search_refresh_interval(self):
+        """
+        The table is checked at most every BLOG_SEARCH_REFRESH_INTERVAL
+        seconds.
+        """
+        article = create_article(title = 'Before edit', days = -5)
+        self.assertEqual(self.search_titles('before'), ['Before edit'])
+        Article.objects.filter(pk = article.pk).update(title = 'After edit',
+            updated_at = timezone.now() + datetime.timedelta(seconds = 1))
+        with override_settings(BLOG_SEARCH_REFRESH_INTERVAL = 3600):
+            with self.assertNumQueries(0):
+                self.backend.score('after')
+        with override_settings(BLOG_SEARCH_REFRESH_INTERVAL = 0):
+            self.assertEqual(self.search_titles('after'), ['After edit'])
+
+    def test_search_snippet_highlights_terms(self):
+        """
+        Hits carry a snippet around the matched terms, highlighted and
+        escaped, cut from the index rather than from the article body.
+        """
+        article = create_article(title = 'Long read', days = -5)
+        article.text = '<p>' + 'lorem ' * 100 + 'the <b>needle</b> & haystack ' + 'ipsum ' * 100 + '</p>'
+        article.save()
+        response = self.client.get(reverse('blog:search_list'),
+            {'srchtxt': 'needle haystack'})
+        snippet = response.context['list_article_pag'][0].snippet
+        self.assertIn('<mark>needle</mark> &amp; <mark>haystack</mark>', snippet)
+        self.assertTrue(snippet.startswith('&hellip; lorem'))
+        self.assertTrue(snippet.endswith('ipsum &hellip;'))
+        self.assertContains(response, '<mark>needle</mark>')
+        self.assertNotIn('ipsum ' * 40, snippet)
+
+    def test_search_snippet_without_body_column(self):
+        """
+        The results page does not select the article body.
+        """
+        create_article(title = 'Needle', days = -5)
+        self.backend.rebuild()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:search_list'),
+                {'srchtxt': 'needle'})
+        self.assertContains(response, '<mark>Needle</mark>')
+        for query in queries.captured_queries:
+            self.assertNotIn('"blog_article"."text"', query['sql'])
+
+    def test_search_paginates_ranked_results(self):
+        """
+        Ranked hits are split into pages of four.
+        """
+        for i in range(6):
+            create_article(title = 'Paged %s' % i, days = -10 + i)
+        response = self.client.get(reverse('blog:search_list'),
+            {'srchtxt': 'paged', 'page': 2})
+        self.assertEqual(len(response.context['list_article_pag']), 2)
+        self.assertEqual(response.context['paginator'].count, 6)
+
+
+class Test_Response_Cache(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+
+    def test_lru_cache_evicts_least_recently_used(self):
+        cache = LRUCache('', {'OPTIONS': {'MAX_ENTRIES': 2}})
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.incr('c'), 4)
+
+    def test_anonymous_list_served_from_cache(self):
+        """
+        A repeated anonymous hit runs no query at all.
+        """
+        self.client.get(reverse('blog:article_list'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Past article.')
+        self.client.get(reverse('aboutblog:about'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('aboutblog:about'))
+
+    def test_list_cache_keyed_on_ajax_and_page(self):
+        """
+        The AJAX feed and the HTML page are cached separately.
+        """
+        self.client.get(reverse('blog:article_list'))
+        response = self.client.get(reverse('blog:article_list'),
+            HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.json()['json_object'][0]['title'], 'Past article.')
+
+    def test_list_cache_invalidated_on_publish_and_approve(self):
+        """
+        Publishing an article or approving a comment renders the list again.
+        """
+        self.client.get(reverse('blog:article_list'))
+        draft = create_draft_article(title = 'Fresh article.', days = -1)
+        draft.publish()
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Fresh article.')
+
+        comment = Comment.objects.create(article = self.article, author = 'me',
+            text = 'text comment')
+        comment.approve()
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Comments: 1')
+
+    def test_list_cache_expires_with_scheduled_article(self):
+        """
+        A list is not cached past the publication of a scheduled article.
+        """
+        Article.objects.filter(pk = self.article.pk).update(
+            published_date = timezone.now() + datetime.timedelta(seconds = 1))
+        caches['default'].clear()
+        self.client.get(reverse('blog:article_list'))
+        # Only the validators and the COUNT run for the empty page, each time.
+        with self.assertNumQueries(3):
+            self.client.get(reverse('blog:article_list'),
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        with self.assertNumQueries(3):
+            self.client.get(reverse('blog:article_list'),
+                HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+
+    def test_lists_cached_again_after_scheduled_publication(self):
+        """
+        Once the scheduled article is live, the lists are cached again and
+        the feed has an ETag, without any save() in between.
+        """
+        Article.objects.filter(pk = self.article.pk).update(
+            published_date = timezone.now() + datetime.timedelta(seconds = 30))
+        caches['default'].clear()
+        cache = caches['default']
+        feed_url = reverse('blog:api_article_list')
+        etag = self.client.get(feed_url)['ETag']
+        self.assertLessEqual(get_publication_timeout(cache), 30)
+        # The scheduled time passes.
+        later = timezone.now() + datetime.timedelta(minutes = 1)
+        with mock.patch('django.utils.timezone.now', return_value = later):
+            self.assertEqual(get_publication_timeout(cache), get_default_timeout())
+            response = self.client.get(feed_url, HTTP_IF_NONE_MATCH = etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], etag)
+            self.client.get(reverse('blog:article_list'))
+            with self.assertNumQueries(0):
+                self.client.get(reverse('blog:article_list'))
+
+    def test_authenticated_user_bypasses_cache(self):
+        """
+        Logged in users always get a fresh page.
+        """
+        self.client.get(reverse('blog:article_list'))
+        self.client.login(username = 'test_usr', password = 'secret')
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Log out')
+        self.client.logout()
+
+    def test_detail_cache_per_csrf_cookie(self):
+        """
+        The article page embeds a CSRF token, so it is stored per CSRF cookie
+        and invalidated when a comment is added.
+        """
+        url = reverse('blog:article_detail', args = (self.article.id,))
+        self.client.get(url)
+        self.assertIn(settings.CSRF_COOKIE_NAME, self.client.cookies)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, 'Past article.')
+
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'fresh comment')
+        response = self.client.get(url)
+        self.assertContains(response, 'fresh comment')
+
+        other_client = Client()
+        response = other_client.get(url)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+
+    def test_generations_scoped_by_category(self):
+        """
+        A change in one category leaves the other category pages cached,
+        and moving an article refreshes both categories.
+        """
+        other = Category.objects.create(title = 'other_category',
+            text = 'text_other_category', urlstext = 'url_other_category')
+        url = reverse('blog:article_categories_list',
+            kwargs={'categoryName': 'url_test_category'})
+        other_url = reverse('blog:article_categories_list',
+            kwargs={'categoryName': 'url_other_category'})
+        article = create_article(title = 'Other article.', days = -1)
+        Article.objects.filter(pk = article.pk).update(category = other)
+        self.client.get(url)
+        self.client.get(other_url)
+
+        article = Article.objects.get(pk = article.pk)
+        article.title = 'Other article edited.'
+        article.save()
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        response = self.client.get(other_url)
+        self.assertContains(response, 'Other article edited.')
+
+        article.category = Category.objects.get(title = 'test_category')
+        article.save()
+        response = self.client.get(url)
+        self.assertContains(response, 'Other article edited.')
+        response = self.client.get(other_url)
+        self.assertNotContains(response, 'Other article edited.')
+
+    def test_generations_scoped_by_author_and_date(self):
+        """
+        Author and date pages are only refreshed by their own articles.
+        """
+        User.objects.create_user(username = 'other_usr', password = 'secret')
+        author_url = reverse('blog:article_author_list',
+            kwargs={'authorName': 'other_usr'})
+        strdate = date_to_str(timezone.localtime(self.article.published_date))
+        date_url = reverse('blog:article_date_list',
+            kwargs={'year': strdate['str_year'], 'month': strdate['str_month'],
+                'day': strdate['str_day']})
+        # A first article makes yesterday a calendar day already.
+        create_article(title = 'Yesterday article.', days = -1)
+        self.client.get(author_url)
+        self.client.get(date_url)
+        create_article(title = 'Another yesterday article.', days = -1)
+        with self.assertNumQueries(0):
+            self.client.get(author_url)
+            self.client.get(date_url)
+
+        self.article.title = 'Past article edited.'
+        self.article.save()
+        with self.assertNumQueries(0):
+            self.client.get(author_url)
+        response = self.client.get(date_url)
+        self.assertContains(response, 'Past article edited.')
+
+    def test_unapproved_comment_keeps_lists_cached(self):
+        """
+        A new comment only refreshes its article page until it is approved.
+        """
+        self.client.get(reverse('blog:article_list'))
+        comment = Comment.objects.create(article = self.article, author = 'me',
+            text = 'text comment')
+        with self.assertNumQueries(0):
+            self.client.get(reverse('blog:article_list'))
+        Comment.objects.get(pk = comment.pk).approve()
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertContains(response, 'Comments: 1')
+
+
+class Test_Conditional_Get(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category',
+            urlstext = 'url_test_category'
+        )
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+        self.article = create_article(title = 'Past article.', days = -5)
+
+    def revalidate(self, url, response, **extra):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'], **extra)
+
+    def test_list_not_modified(self):
+        """
+        A revisit of an unchanged list is answered with 304, from the
+        response cache without any query, or from the validators alone.
+        """
+        url = reverse('blog:article_list')
+        response = self.client.get(url)
+        self.assertTrue(response.has_header('ETag'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+        # Drop the cached page but keep the generations.
+        caches['default'].delete_many([key[len(':1:'):] for key in caches['default']._data
+            if key.startswith(':1:blog:response:')])
+        with self.assertNumQueries(2):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+        not_modified = self.client.get(url,
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+        ajax = self.client.get(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertNotEqual(ajax['ETag'], response['ETag'])
+
+    def test_list_modified(self):
+        """
+        Editing an article, approving a comment or renaming a category
+        changes the validators of the lists.
+        """
+        url = reverse('blog:article_list')
+        response = self.client.get(url)
+        self.article.title = 'Past article edited.'
+        self.article.save()
+        response = self.revalidate(url, response)
+        self.assertContains(response, 'Past article edited.')
+        Comment.objects.create(article = self.article, author = 'me',
+            text = 'approved', approved_comment = True)
+        response = self.revalidate(url, response)
+        self.assertContains(response, 'Comments: 1')
+        category = Category.objects.get()
+        category.title = 'renamed category'
+        category.save()
+        self.assertContains(self.revalidate(url, response), 'renamed category')
+
+    def test_detail_not_modified(self):
+        """
+        An article page is revalidated until one of its comments changes.
+        """
+        url = reverse('blog:article_detail', kwargs={'pk': self.article.pk})
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        comment = Comment.objects.create(article = self.article, author = 'me',
+            text = 'waiting')
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        comment.delete()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_authenticated_user_not_validated(self):
+        """
+        Pages of logged in users carry no validators.
+        """
+        self.client.login(username = 'test_usr', password = 'secret')
+        response = self.client.get(reverse('blog:article_list'))
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+class Test_Widget_Categories(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        for i in range(5):
+            Category.objects.create(title = 'category %s' % i,
+                text = 'text category', urlstext = 'url_category_%s' % i)
+
+    def render_widget(self):
+        return Template('{% load collection_extras %}{% get_widgets %}').render(Context())
+
+    def test_categories_widget_cached(self):
+        """
+        The sidebar costs one query on a miss and none once warm.
+        """
+        with self.assertNumQueries(1):
+            html = self.render_widget()
+        self.assertIn('url_category_4', html)
+        self.assertEqual(html.count('<li>'), 5)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render_widget(), html)
+
+    def test_categories_widget_invalidated(self):
+        """
+        Creating, editing or deleting a category renders the sidebar again.
+        """
+        self.render_widget()
+        category = Category.objects.create(title = 'category new',
+            text = 'text category', urlstext = 'url_category_new')
+        self.assertIn('url_category_new', self.render_widget())
+        category.title = 'category renamed'
+        category.save()
+        self.assertIn('category renamed', self.render_widget())
+        category.delete()
+        self.assertNotIn('category renamed', self.render_widget())
+
+
+class Test_Widget_Calendar(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        Category.objects.create(title = 'test_category',
+            text = 'text_test_category', urlstext = 'url_test_category')
+        User.objects.create_user(username = 'test_usr', password = 'secret')
+
+    def render_widget(self):
+        return Template('{% load collection_extras %}{% get_widgets_calendar %}').render(Context())
+
+    def day(self, days):
+        return timezone.localdate() + datetime.timedelta(days=days)
+
+    def counts(self):
+        return dict(PublishedDay.objects.values_list('day', 'articles'))
+
+    def test_published_days_maintained(self):
+        """
+        Publishing, moving, unpublishing and deleting articles keep the
+        per-day counts current; drafts are not counted.
+        """
+        first = create_article('first', -2)
+        create_article('second', -2)
+        draft = create_draft_article('draft', -1)
+        self.assertEqual(self.counts(), {self.day(-2): 2})
+        draft.publish()
+        self.assertEqual(self.counts(), {self.day(-2): 2, self.day(0): 1})
+        first.published_date = timezone.now() - datetime.timedelta(days=5)
+        first.save()
+        self.assertEqual(self.counts(), {self.day(-5): 1, self.day(-2): 1, self.day(0): 1})
+        first = Article.objects.get(pk=first.pk)
+        first.published_date = None
+        first.save()
+        draft.delete()
+        self.assertEqual(self.counts(), {self.day(-2): 1})
+
+    def test_calendar_widget(self):
+        """
+        The calendar lists the days with published articles up to today,
+        costs one query on a miss and none once warm.
+        """
+        create_article('past', -3)
+        create_article('future', 3)
+        with self.assertNumQueries(1):
+            html = self.render_widget()
+        self.assertIn('data-dates="%s"' % self.day(-3).isoformat(), html)
+        self.assertNotIn(self.day(3).isoformat(), html)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render_widget(), html)
+        create_article('today', 0)
+        self.assertIn(self.day(0).isoformat(), self.render_widget())
+
+    def test_calendar_window(self):
+        """
+        The page embeds the days of the last months only; the older months
+        are served one by one.
+        """
+        create_article('recent', -3)
+        create_article('old', -200)
+        old_day = self.day(-200)
+        html = self.render_widget()
+        self.assertIn(self.day(-3).isoformat(), html)
+        self.assertNotIn(old_day.isoformat(), html)
+        response = self.client.get(reverse('blog:calendar_month', kwargs = {'year': '%04d' % old_day.year,
+            'month': '%02d' % old_day.month}))
+        self.assertEqual(response.json(), {'days': [old_day.isoformat()]})
+        response = self.client.get(reverse('blog:calendar_month', kwargs = {'year': '2017', 'month': '13'}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_scheduled_today(self):
+        """
+        Today is a calendar day once its first article went live, not while
+        it is only scheduled; the widget is cached until then.
+        """
+        noon = timezone.make_aware(datetime.datetime.combine(timezone.localdate(), datetime.time(12)))
+        month_url = reverse('blog:calendar_month', kwargs = {'year': '%04d' % noon.year,
+            'month': '%02d' % noon.month})
+        cache = caches['default']
+        with mock.patch('django.utils.timezone.now', return_value = noon):
+            create_article('scheduled', 0.125)
+            with mock.patch.object(cache, 'set', wraps = cache.set) as cache_set:
+                self.assertNotIn(noon.date().isoformat(), self.render_widget())
+            self.assertEqual(cache_set.call_args[0][2], 3 * 3600)
+            self.assertEqual(self.client.get(month_url).json(), {'days': []})
+        cache.clear()
+        with mock.patch('django.utils.timezone.now', return_value = noon + datetime.timedelta(hours = 3)):
+            self.assertIn(noon.date().isoformat(), self.render_widget())
+            self.assertEqual(self.client.get(month_url).json(), {'days': [noon.date().isoformat()]})
+
+
 #--------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------
 #--------------------------------------------------------------------------------------
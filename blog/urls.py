@@ -1,10 +1,11 @@
 from django.conf.urls import url, include
-from . import views
+from . import api, views
 
 app_name = 'blog'
 urlpatterns = [
     url(r'^$', views.ArticleListView.as_view(), name='article_list'),
     url(r'^article/(?P<pk>[0-9]+)/$', views.ArticleDetail.as_view(), name='article_detail'),
+    url(r'^article/(?P<pk>[0-9]+)/comments/$', views.article_comments, name='article_comments'),
     url(r'^article/new/$', views.ArticleCreate.as_view(), name='article_new'),
     url(r'^article/(?P<pk>[0-9]+)/edit/$', views.ArticleUpdate.as_view(), name='article_edit'),
     url(r'^drafts/$', views.DraftArticleListView.as_view(), name='article_draft_list'),
@@ -16,5 +17,8 @@ urlpatterns = [
     url(r'^author/(?P<authorName>\w+)/$', views.ArticleListView.as_view(), name='article_author_list'),
     url(r'^search/$', views.SearchArticleListView.as_view(), name='search_list'),
     url(r'^article/(?P<year>\d{4})/(?P<month>\d{2})/(?P<day>\d{2})/$', views.ArticleListView.as_view(), name='article_date_list'),
+    url(r'^calendar/(?P<year>\d{4})/(?P<month>\d{2})/$', views.calendar_month, name='calendar_month'),
     url(r'^accounts/register/$', views.RegisterFormView.as_view(), name='register'),
+    url(r'^api/articles/$', api.article_feed, name='api_article_list'),
+    url(r'^api/articles/(?P<pk>[0-9]+)/comments/$', api.comment_feed, name='api_comment_list'),
 ]
@@ -1,3 +1,5 @@
+import datetime
+
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
@@ -6,8 +8,14 @@ from django.shortcuts import redirect
 from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from .models import Article, Comment
+from .models import Article, Comment, PublishedDay
 from .forms import ArticleForm, CommentForm
+from .pagination import encode_cursor, get_keyset_page, parse_ordering, row_values
+from .search import get_search_backend
+from .images import schedule_article_image
+from .comment_queue import enqueue_comment, get_queue_path
+from .cache import EPOCH, SIDEBAR_CACHE_TAGS, cache_response, conditional_page
+from .storage import IMMUTABLE_CACHE_CONTROL, is_content_addressed
 
 from django.views.generic.list import ListView
 from django.views.generic.detail import DetailView
@@ -16,19 +24,101 @@ from django.views.generic.edit import FormMixin, DeleteView, CreateView, UpdateV
 from django.http import JsonResponse, HttpResponse, HttpResponseNotFound, Http404
 from django.core import serializers
 
-from django.utils.html import strip_tags
 from django.utils.safestring import mark_safe
-from html import unescape
-from django.template.defaultfilters import linebreaksbr, truncatechars
 
 from django.views.decorators.vary import vary_on_headers
+from django.views.decorators.http import require_safe
+from django.template.loader import render_to_string
+from django.db.models import Count, Max
 from json import dumps
-from django.db.models import Case, Sum, When, IntegerField
 
 from django.views.generic.edit import FormView
 from django.contrib.auth.forms import UserCreationForm
 
 from django.db.models.functions import Length
+from django.views import static
+
+def published_day_range(year, month, day):
+    """
+    Return the [start, end) datetimes of a local calendar day, or None if
+    the date does not exist. Comparing the indexed column with a range keeps
+    the date pages sargable, unlike the __year/__month/__day lookups.
+    """
+    try:
+        date = datetime.date(int(year), int(month), int(day))
+    except ValueError:
+        return None
+    start = timezone.make_aware(datetime.datetime.combine(date, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+def filter_article_list(articles, kwargs):
+    """
+    Narrow articles to the visible ones of the list page addressed by the
+    URL kwargs: a category, an author, a date or the front page.
+    """
+    articles = articles.filter(published_date__lte=timezone.now())
+    categoryName = kwargs.get('categoryName', "")
+    authorName = kwargs.get('authorName', "")
+
+    year = kwargs.get('year', "")
+    month = kwargs.get('month', "")
+    day = kwargs.get('day', "")
+
+    if categoryName:
+        articles = articles.filter(category__urlstext=categoryName)
+    elif authorName:
+        articles = articles.filter(author__username=authorName)
+    elif year and month and day:
+        day_range = published_day_range(year, month, day)
+        if day_range is None:
+            articles = articles.none()
+        else:
+            articles = articles.filter(published_date__gte=day_range[0], published_date__lt=day_range[1])
+    return articles
+
+def article_list_cache_tags(request, *args, **kwargs):
+    if kwargs.get('categoryName'):
+        tag = 'category:%s' % kwargs['categoryName']
+    elif kwargs.get('authorName'):
+        tag = 'author:%s' % kwargs['authorName']
+    elif kwargs.get('year') and kwargs.get('month') and kwargs.get('day'):
+        tag = 'date:%s-%s-%s' % (kwargs['year'], kwargs['month'], kwargs['day'])
+    else:
+        tag = 'articles'
+    return [tag] + SIDEBAR_CACHE_TAGS
+
+def article_detail_cache_tags(request, *args, **kwargs):
+    return ['article:%s' % kwargs['pk']] + SIDEBAR_CACHE_TAGS
+
+def article_comments_cache_tags(request, *args, **kwargs):
+    return ['article:%s' % kwargs['pk']]
+
+def calendar_month_cache_tags(request, *args, **kwargs):
+    return ['calendar']
+
+def article_list_validators(request, *args, **kwargs):
+    """
+    Freshness of a list page from two indexed aggregates: the number and the
+    latest publication of its visible articles, and the last article edit.
+    """
+    stats = filter_article_list(Article.objects.all(), kwargs).aggregate(
+        count=Count('id'), published=Max('published_date'))
+    updated = Article.objects.aggregate(updated=Max('updated_at'))['updated']
+    modified = max(date for date in (stats['published'], updated, EPOCH) if date is not None)
+    return (stats['count'], stats['published'], updated), modified
+
+def article_detail_validators(request, *args, **kwargs):
+    """
+    Freshness of an article page: the last edit of the article and of its
+    comments, and the number of comments. None while the page is not found.
+    """
+    row = Article.objects.filter(pk=kwargs['pk'], published_date__lte=timezone.now()).annotate(
+        comments_updated=Max('comments__updated_at'), comments_count=Count('comments')).values_list(
+        'updated_at', 'comments_updated', 'comments_count').first()
+    if row is None:
+        return None
+    return row, max(row[0], row[1] or row[0])
 
 def ger_articles_page(articles, page, paginate_by = 4):
     paginator = Paginator(articles, paginate_by)
@@ -42,49 +132,120 @@ def ger_articles_page(articles, page, paginate_by = 4):
         articles_page = paginator.page(paginator.num_pages)
     return articles_page
 
-class ArticleListView(ListView):
+
+# Comments of an article page, oldest first; the first page is rendered
+# with the article, the next ones are fetched from article_comments.
+COMMENT_ORDERING = ('created_date', 'id')
+COMMENT_PAGE_SIZE = 20
+
+def visible_articles(request):
+    """
+    The articles whose page request may see: the published ones and the
+    drafts of its user.
+    """
+    articles = Article.objects.filter(published_date__lte=timezone.now())
+    if request.user.is_authenticated():
+        articles = Article.objects.filter(author__username = request.user) | articles
+    return articles
+
+def get_comments_page(article_id, cursor=None):
+    """
+    A KeysetPage of the comments of an article, served by the
+    (article, created_date) index.
+    """
+    comments = Comment.objects.filter(article_id=article_id, created_date__lte=timezone.now())
+    return get_keyset_page(comments, cursor, COMMENT_ORDERING, COMMENT_PAGE_SIZE)
+
+
+class KeysetPaginationMixin(object):
+    """
+    Lets a list view page with keyset (seek) cursors instead of OFFSET.
+
+    Keyset mode is used when the view is created with
+    pagination_mode='keyset' or when the request carries a ?cursor=
+    parameter. Numbered pages still expose next/previous cursors, so a
+    client can switch to cursors from any page.
+    """
+    pagination_mode = 'offset'
+    keyset_ordering = ('-published_date', 'title', 'id')
+
+    def use_keyset_pagination(self):
+        return self.pagination_mode == 'keyset' or 'cursor' in self.request.GET
+
+    def get_list_queryset(self, articles):
+        """
+        Attach the author and the category to every row, so the list
+        templates render without per-card queries. The rich-text body is not
+        fetched; cards show the stored excerpt and approved-comment count.
+        """
+        return articles.select_related('author', 'category').defer('text')
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Paginate the queryset planned by get_queryset() exactly once; the
+        resulting page serves page_obj, list_article_pag and the AJAX feed.
+        """
+        if self.use_keyset_pagination() and hasattr(queryset, 'order_by'):
+            page = get_keyset_page(queryset, self.request.GET.get('cursor'),
+                self.keyset_ordering, page_size)
+        else:
+            page = ger_articles_page(queryset, self.request.GET.get('page'), page_size)
+        return (getattr(page, 'paginator', None), page, page.object_list, page.has_other_pages())
+
+    def get_page_cursors(self, page):
+        if getattr(page, 'is_keyset', False):
+            return page.next_cursor, page.previous_cursor
+        next_cursor = previous_cursor = None
+        rows = list(page.object_list) if page else []
+        if rows and hasattr(page.paginator.object_list, 'order_by'):
+            keys = parse_ordering(self.keyset_ordering)
+            if page.has_next():
+                next_cursor = encode_cursor(row_values(rows[-1], keys), 'next')
+            if page.has_previous():
+                previous_cursor = encode_cursor(row_values(rows[0], keys), 'prev')
+        return next_cursor, previous_cursor
+
+    def get_context_data(self, **kwargs):
+        context = super(KeysetPaginationMixin, self).get_context_data(**kwargs)
+        context['list_article_pag'] = context['page_obj']
+        context['next_cursor'], context['previous_cursor'] = self.get_page_cursors(context['list_article_pag'])
+        return context
+
+
+class ArticleListView(KeysetPaginationMixin, ListView):
     allow_empty = True
     context_object_name = 'articles'
     model = Article
     paginate_by = 4
     template_name = "blog/article_list.html"
+    # GET requests read from a replica, see blog.routers.
+    replica_reads = True
 
     @method_decorator(vary_on_headers('X-Requested-With'))
+    @method_decorator(cache_response(article_list_cache_tags, expire_on_publication=True))
+    @method_decorator(conditional_page(article_list_cache_tags, article_list_validators))
     def dispatch(self, *args, **kwargs):
         return super(ArticleListView, self).dispatch(*args, **kwargs)
 
     def field_json_queryset(self, articles):
-        articles = articles.values('id', 'image', 'published_date', 'title', 'text', 'author__username', 'category__urlstext', 'category__title').annotate(approved_comments=Sum(Case(When(comments__approved_comment=True, then=1),default=0,output_field=IntegerField())))
+        articles = articles.values('id', 'image', 'published_date', 'title', 'excerpt', 'author__username', 'category__urlstext', 'category__title', 'approved_comment_count')
         return articles
 
     def get_queryset(self):
-        articles = Article.objects.filter(published_date__lte=timezone.now())
-        articles = articles.order_by('-published_date', 'title')
-        categoryName = self.kwargs.get('categoryName', "")
-        authorName = self.kwargs.get('authorName', "")
-
-        year = self.kwargs.get('year', "")
-        month = self.kwargs.get('month', "")
-        day = self.kwargs.get('day', "")
-
-        if categoryName:
-            articles = articles.filter(category__urlstext=categoryName)
-        elif authorName:
-            articles = articles.filter(author__username=authorName)
-        elif year and month and day:
-            articles = articles.filter(published_date__year=year).filter(published_date__month=month).filter(published_date__day=day)
-
-        return articles
+        articles = filter_article_list(Article.objects.all(), self.kwargs)
+        articles = articles.order_by('-published_date', 'title', 'id')
+        if self.request.is_ajax():
+            return self.field_json_queryset(articles)
+        return self.get_list_queryset(articles)
 
     def get_context_data(self, **kwargs):
         context = super(ArticleListView, self).get_context_data(**kwargs)
         context['mode_list'] = 'simple'
-        context['list_article_pag'] = ger_articles_page(self.get_queryset(), self.request.GET.get('page'), self.paginate_by)
         return context
 
     def render_to_response(self, context, **response_kwargs):
         if self.request.is_ajax():
-            mensajes = ger_articles_page(self.field_json_queryset(self.get_queryset()), self.request.GET.get('page'), self.paginate_by)
+            mensajes = context['page_obj']
             json_object_records=[]
 
             for line in mensajes:
@@ -92,31 +253,27 @@ class ArticleListView(ListView):
                 json_object_dict['id'] = line['id']
                 json_object_dict['image'] = line['image']
                 json_object_dict['published_date'] = line['published_date']
-                json_object_dict['text'] = truncatechars(linebreaksbr(strip_tags(unescape(line['text']))),400)
+                json_object_dict['text'] = line['excerpt']
                 json_object_dict['title'] = line['title']
                 json_object_dict['username'] = line['author__username']
                 json_object_dict['category_urlstext'] = line['category__urlstext']
                 json_object_dict['category_title'] = line['category__title']
-                json_object_dict['approved_comments'] = line['approved_comments']
+                json_object_dict['approved_comments'] = line['approved_comment_count']
                 json_object_records.append(json_object_dict)
 
             json_page_records=[]
             json_page_dict = {}
             json_page_dict['has_other_pages'] = mensajes.has_other_pages()
             json_page_dict['has_previous'] = mensajes.has_previous()
-            json_page_dict['paginator_page_range'] = mensajes.paginator.page_range[-1]
             json_page_dict['has_next'] = mensajes.has_next()
-            json_page_dict['end_index'] = mensajes.end_index()
-            json_page_dict['start_index'] = mensajes.start_index()
-
-            cur = 1;
-            if (self.request.GET.get('page')):
-                try:
-                    cur = int(self.request.GET.get('page'))
-                except ValueError:
-                    cur = 1
-
-            json_page_dict['current_page'] = cur
+            json_page_dict['next_cursor'], json_page_dict['previous_cursor'] = self.get_page_cursors(mensajes)
+            json_page_dict['is_keyset'] = getattr(mensajes, 'is_keyset', False)
+            if not json_page_dict['is_keyset']:
+                json_page_dict['paginator_page_range'] = mensajes.paginator.page_range[-1]
+                json_page_dict['end_index'] = mensajes.end_index()
+                json_page_dict['start_index'] = mensajes.start_index()
+
+            json_page_dict['current_page'] = getattr(mensajes, 'number', 1)
             json_page_records.append(json_page_dict)
 
             json_object = {}
@@ -128,12 +285,13 @@ class ArticleListView(ListView):
 
 
 
-class SearchArticleListView(ListView):
+class SearchArticleListView(KeysetPaginationMixin, ListView):
     allow_empty = True
     context_object_name = 'articles'
     model = Article
     paginate_by = 4
     template_name = "blog/article_list.html"
+    replica_reads = True
 
     def __init__(self, **kwargs):
         self.message = ''
@@ -150,57 +308,55 @@ class SearchArticleListView(ListView):
         articles = ''
         if self.srchtxt:
             articles = Article.objects.filter(published_date__lte=timezone.now())
-            articles = articles.order_by('-published_date', 'title')
-            articles = articles.filter(text__icontains=self.srchtxt)
+            articles = articles.order_by('-published_date', 'title', 'id')
+            articles = get_search_backend().search(self.srchtxt, self.get_list_queryset(articles))
         return articles
 
     def get_context_data(self, **kwargs):
         context = super(SearchArticleListView, self).get_context_data(**kwargs)
         context['mode_list'] = 'search'
-        context['list_article_pag'] = ger_articles_page(self.get_queryset(), self.request.GET.get('page'), self.paginate_by)
         context['message'] = self.message
         context['srchtxt'] = self.srchtxt
         return context
 
 
 @method_decorator(login_required, name='dispatch')
-class DraftArticleListView(ListView):
+class DraftArticleListView(KeysetPaginationMixin, ListView):
     allow_empty = True
     context_object_name = 'articles'
     model = Article
     paginate_by = 4
     template_name = "blog/article_list.html"
+    keyset_ordering = ('-created_date', 'title', 'id')
 
     def get_queryset(self):
         articles = Article.objects.filter(published_date__isnull=True, author__username = self.request.user)
-        articles = articles.order_by('-created_date', 'title')
-        return articles
+        articles = articles.order_by('-created_date', 'title', 'id')
+        return self.get_list_queryset(articles)
 
     def get_context_data(self, **kwargs):
         context = super(DraftArticleListView, self).get_context_data(**kwargs)
         context['mode_list'] = 'draft'
-        context['list_article_pag'] = ger_articles_page(self.get_queryset(), self.request.GET.get('page'), self.paginate_by)
         return context
 
 
+@method_decorator(cache_response(article_detail_cache_tags), name='dispatch')
+@method_decorator(conditional_page(article_detail_cache_tags, article_detail_validators), name='dispatch')
 class ArticleDetail(FormMixin, DetailView):
     context_object_name = 'article'
     model = Article
     template_name = "blog/article_detail.html"
     form_class = CommentForm
+    replica_reads = True
 
     def get_context_data(self, **kwargs):
         context = super(ArticleDetail, self).get_context_data(**kwargs)
         context['form'] = CommentForm(initial={'post': self.object})
-        context['comments'] = Comment.objects.filter(article__id=self.object.id).filter(created_date__lte=timezone.now()).order_by('created_date')
+        context['comments'] = get_comments_page(self.object.id)
         return context
 
     def get_queryset(self):
-        if self.request.user.is_authenticated():
-            articles = Article.objects.filter(author__username = self.request.user) | Article.objects.filter(published_date__lte=timezone.now())
-        else:
-            articles = Article.objects.filter(published_date__lte=timezone.now())
-        return articles
+        return visible_articles(self.request)
 
     def get_success_url(self):
         return reverse('blog:article_detail', kwargs={'pk': self.object.id})
@@ -214,9 +370,13 @@ class ArticleDetail(FormMixin, DetailView):
             return self.form_invalid(form)
 
     def form_valid(self, form):
-        comment = form.save(commit=False)
-        comment.article = self.object
-        comment.save()
+        if get_queue_path():
+            # Inserted shortly after by the comment queue worker.
+            enqueue_comment(self.object.id, form.cleaned_data['author'], form.cleaned_data['text'])
+        else:
+            comment = form.save(commit=False)
+            comment.article = self.object
+            comment.save()
         return super(ArticleDetail, self).form_valid(form)
 
 
@@ -244,7 +404,10 @@ class ArticleCreate(CreateView):
     def form_valid(self, form):
         self.object = form.save(commit=False)
         self.object.author = self.request.user
-        return super(ArticleCreate, self).form_valid(form)
+        response = super(ArticleCreate, self).form_valid(form)
+        if self.object.image:
+            schedule_article_image(self.object)
+        return response
 
 
 @method_decorator(login_required, name='dispatch')
@@ -264,7 +427,13 @@ class ArticleUpdate(UpdateView):
     def form_valid(self, form):
         self.object = form.save(commit=False)
         self.object.author = self.request.user
-        return super(ArticleUpdate, self).form_valid(form)
+        image_changed = 'image' in form.changed_data
+        if image_changed:
+            self.object.image_widths = ''
+        response = super(ArticleUpdate, self).form_valid(form)
+        if image_changed:
+            schedule_article_image(self.object)
+        return response
 
 
 @method_decorator(login_required, name='dispatch')
@@ -285,6 +454,48 @@ class RegisterFormView(FormView):
         form.save()
         return super(RegisterFormView, self).form_valid(form)
 
+@require_safe
+@cache_response(article_comments_cache_tags)
+@conditional_page(article_comments_cache_tags, article_detail_validators)
+def article_comments(request, pk):
+    """
+    The page of comments of an article after ?cursor=, as JSON: the items,
+    their HTML for the article page and the cursor of the next page.
+    """
+    article = get_object_or_404(visible_articles(request).only('id'), pk=pk)
+    comments = get_comments_page(article.id, request.GET.get('cursor'))
+    return JsonResponse({
+        'comments': [{
+            'id': comment.id,
+            'author': comment.author,
+            'text': comment.text,
+            'created_date': comment.created_date,
+            'approved': comment.approved_comment,
+        } for comment in comments],
+        'html': render_to_string('blog/comment_list.html', {'comments': comments}, request=request),
+        'next_cursor': comments.next_cursor,
+    })
+
+article_comments.replica_reads = True
+
+@require_safe
+@cache_response(calendar_month_cache_tags, expire_on_publication=True)
+def calendar_month(request, year, month):
+    """
+    The days of a month with published articles, as JSON, for the months
+    before the ones the archive calendar embeds.
+    """
+    try:
+        first = datetime.date(int(year), int(month), 1)
+    except ValueError:
+        raise Http404
+    last = (first + datetime.timedelta(days=31)).replace(day=1) - datetime.timedelta(days=1)
+    days = PublishedDay.published_days(first, last)[0]
+    return JsonResponse({'days': [day.isoformat() for day in days]})
+
+calendar_month.replica_reads = True
+
+
 @login_required
 def article_publish(request, pk):
     article = get_object_or_404(Article, pk=pk)
@@ -300,3 +511,14 @@ def comment_approve(request, pk):
     comment = get_object_or_404(Comment, pk=pk)
     comment.approve()
     return redirect(reverse('blog:article_detail', kwargs={'pk': comment.article.pk}))
+
+
+def serve_media(request, path, document_root=None, show_indexes=False):
+    """
+    django.views.static.serve() for MEDIA_URL, marking the content-addressed
+    uploads as cacheable forever.
+    """
+    response = static.serve(request, path, document_root, show_indexes)
+    if response.status_code == 200 and is_content_addressed(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
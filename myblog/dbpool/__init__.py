@@ -0,0 +1,248 @@
+"""
+Pooled database backends.
+
+ENGINE 'myblog.dbpool.mysql' (or 'myblog.dbpool.sqlite3') is Django's
+backend with one change: closing a connection, which Django does at the
+end of every request, hands the DB-API connection back to a pool of the
+process instead of closing it, and the next connect() takes it from the
+pool. Requests then skip the TCP and authentication round trips to the
+database server.
+
+The pool is configured by the 'POOL' dictionary of the database settings:
+
+    MAX_SIZE               most connections open at once (10)
+    TIMEOUT                seconds connect() waits for a free connection
+                           before raising OperationalError (10)
+    MAX_LIFETIME           seconds after which a connection is closed
+                           instead of reused (1800); keep it below the
+                           server's wait_timeout
+    MAX_IDLE               seconds a connection may sit unused (300)
+    HEALTH_CHECK_INTERVAL  a connection unused for that many seconds runs
+                           SELECT 1 before it is handed out again (30)
+
+Leave CONN_MAX_AGE at 0: the pool does the reuse, and across threads.
+"""
+import collections
+import os
+import threading
+import time
+
+DEFAULT_POOL_OPTIONS = {
+    'MAX_SIZE': 10,
+    'TIMEOUT': 10,
+    'MAX_LIFETIME': 1800,
+    'MAX_IDLE': 300,
+    'HEALTH_CHECK_INTERVAL': 30,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool(object):
+    """
+    A bounded set of open DB-API connections shared by the threads of a
+    process. Connections are handed out most recently used first, so that
+    the others age out when the load drops.
+    """
+
+    def __init__(self, max_size=10, timeout=10, max_lifetime=1800, max_idle=300, health_check_interval=30):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.max_idle = max_idle
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+        self._condition = threading.Condition()
+        # (connection, created, last used) of the idle connections.
+        self._idle = collections.deque()
+        # Creation time of every open connection, idle or in use, by id().
+        self._created = {}
+
+    @property
+    def size(self):
+        return len(self._created)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def _discard(self, connection):
+        self._created.pop(id(connection), None)
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _check_fork(self):
+        if os.getpid() != self.pid:
+            # The sockets belong to the parent process: forget them without
+            # closing them.
+            self.pid = os.getpid()
+            self._idle.clear()
+            self._created.clear()
+
+    def acquire(self, connect, check):
+        """
+        Return an idle connection that passes check(connection) when it
+        was unused for health_check_interval, or a new one from connect()
+        while the pool has room. Raise PoolTimeout when none frees up
+        within timeout seconds.
+        """
+        deadline = time.time() + self.timeout
+        while True:
+            candidate = None
+            with self._condition:
+                self._check_fork()
+                while True:
+                    now = time.time()
+                    while self._idle and candidate is None:
+                        connection, created, last_used = self._idle.pop()
+                        if now - created >= self.max_lifetime or now - last_used >= self.max_idle:
+                            self._discard(connection)
+                        else:
+                            candidate = connection, now - last_used >= self.health_check_interval
+                    if candidate is not None or self.size < self.max_size:
+                        break
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise PoolTimeout('All %s pooled connections are in use.' % self.max_size)
+                    self._condition.wait(remaining)
+                if candidate is None:
+                    # Reserve the slot, then connect without holding the lock.
+                    placeholder = object()
+                    self._created[id(placeholder)] = now
+            if candidate is None:
+                break
+            connection, needs_check = candidate
+            if not needs_check or check(connection):
+                return connection, True
+            with self._condition:
+                self._discard(connection)
+                self._condition.notify()
+
+        try:
+            connection = connect()
+        except Exception:
+            with self._condition:
+                del self._created[id(placeholder)]
+                self._condition.notify()
+            raise
+        with self._condition:
+            del self._created[id(placeholder)]
+            self._created[id(connection)] = time.time()
+        return connection, False
+
+    def release(self, connection, reusable=True):
+        """
+        Take back a connection handed out by acquire(); it is closed
+        instead of kept when not reusable or too old.
+        """
+        with self._condition:
+            self._check_fork()
+            created = self._created.get(id(connection))
+            now = time.time()
+            if created is None:
+                # Not ours (opened before a fork): just close it.
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+            elif reusable and now - created < self.max_lifetime:
+                self._idle.append((connection, created, now))
+            else:
+                self._discard(connection)
+            self._condition.notify()
+
+    def close(self):
+        """
+        Close the idle connections.
+        """
+        with self._condition:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+
+def get_pool(alias, settings_dict):
+    """
+    The pool of the process for the database alias, created from the POOL
+    options of its settings.
+    """
+    # The test runner points the alias to another database: never hand out
+    # a connection to the previous one.
+    key = (alias,) + tuple(str(settings_dict.get(name)) for name in ('NAME', 'USER', 'HOST', 'PORT'))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = dict(DEFAULT_POOL_OPTIONS, **settings_dict.get('POOL', {}))
+            pool = _pools[key] = ConnectionPool(max_size=options['MAX_SIZE'], timeout=options['TIMEOUT'],
+                max_lifetime=options['MAX_LIFETIME'], max_idle=options['MAX_IDLE'],
+                health_check_interval=options['HEALTH_CHECK_INTERVAL'])
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+class PooledDatabaseWrapperMixin(object):
+    """
+    Take DatabaseWrapper connections from, and give them back to, the pool
+    of the alias.
+    """
+
+    @property
+    def pool(self):
+        return get_pool(self.alias, self.settings_dict)
+
+    def new_connection(self, conn_params):
+        """
+        Open a connection to the database server.
+        """
+        return super(PooledDatabaseWrapperMixin, self).get_new_connection(conn_params)
+
+    def check_connection(self, connection):
+        try:
+            cursor = connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection, self.pooled_connection_reused = self.pool.acquire(
+                lambda: self.new_connection(conn_params), self.check_connection)
+        except PoolTimeout as error:
+            raise self.Database.OperationalError(str(error))
+        return connection
+
+    def init_connection_state(self):
+        # The session settings outlive the wrapper that made them.
+        if not getattr(self, 'pooled_connection_reused', False):
+            super(PooledDatabaseWrapperMixin, self).init_connection_state()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # A connection left in a transaction, or after an error other than
+        # a constraint violation, is not handed to the next request.
+        reusable = (not self.in_atomic_block and not self.errors_occurred
+            and self.autocommit == self.settings_dict['AUTOCOMMIT'])
+        if reusable and not self.autocommit:
+            try:
+                self.connection.rollback()
+            except Exception:
+                reusable = False
+        self.pool.release(self.connection, reusable)
@@ -0,0 +1,12 @@
+from django.db.backends.mysql import base
+
+from .. import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    def check_connection(self, connection):
+        try:
+            connection.ping()
+        except base.Database.Error:
+            return False
+        return True
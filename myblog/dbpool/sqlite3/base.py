@@ -0,0 +1,17 @@
+from django.db.backends.sqlite3 import base
+
+from .. import PooledDatabaseWrapperMixin
+
+
+class DatabaseWrapper(PooledDatabaseWrapperMixin, base.DatabaseWrapper):
+    """
+    The SQLite backend with pooled connections, as a stand-in for a database
+    server in benchmarks. Every connection to an in-memory database is a
+    database of its own, so those are never pooled.
+    """
+
+    def get_new_connection(self, conn_params):
+        if self.is_in_memory_db():
+            self.pooled_connection_reused = False
+            return self.new_connection(conn_params)
+        return super(DatabaseWrapper, self).get_new_connection(conn_params)
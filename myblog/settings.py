@@ -39,14 +39,15 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'blog',
-    'django_cleanup',
     'ckeditor',
     'ckeditor_uploader',
     'aboutblog',
 ]
 
 MIDDLEWARE = [
+    'blog.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'blog.routers.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -59,7 +60,8 @@ ROOT_URLCONF = 'myblog.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, timing the renders for the access log.
+        'BACKEND': 'blog.instrumentation.InstrumentedTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -92,15 +94,47 @@ DATABASES = {
         #'HOST': 'localhost',
         #'PORT': '5432',
 
-        'ENGINE': 'django.db.backends.mysql',
+        # The MySQL backend with a connection pool, see myblog.dbpool.
+        'ENGINE': 'myblog.dbpool.mysql',
         'NAME': 'volmirs45$myblog',
         'USER': 'volmirs45',
         'PASSWORD': 'Starost53',
         'HOST': 'volmirs45.mysql.pythonanywhere-services.com',
+        'POOL': {
+            'MAX_SIZE': 10,
+            'TIMEOUT': 10,
+            # Below the server's wait_timeout (300 seconds here).
+            'MAX_LIFETIME': 280,
+            'MAX_IDLE': 120,
+            'HEALTH_CHECK_INTERVAL': 30,
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+# blog.cache.LRUCache lives in the worker process; use the 'filesystem' cache
+# for BLOG_RESPONSE_CACHE when several worker processes serve the site, so
+# they share the cached pages and their invalidation.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'blog.cache.LRUCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    'filesystem': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache'),
+    },
+}
+
+BLOG_RESPONSE_CACHE = 'default'
+BLOG_RESPONSE_CACHE_TIMEOUT = 300
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -145,6 +179,10 @@ STATIC_URL = '/static/'
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
+# collectstatic writes the bundles of blog.assets, hashes every file and
+# precompresses the text files.
+STATICFILES_STORAGE = 'blog.assets.BundleStaticFilesStorage'
+
 LOGIN_REDIRECT_URL = '/'
 
 CKEDITOR_UPLOAD_PATH = 'uploads/'
@@ -156,3 +194,99 @@ CKEDITOR_CONFIGS = {
 }
 CKEDITOR_JQUERY_URL = '//ajax.googleapis.com/ajax/libs/jquery/2.1.1/jquery.min.js'
 CKEDITOR_IMAGE_BACKEND = 'pillow'
+
+# Search
+# blog.search.InvertedIndexBackend ranks with BM25 from an in-process index;
+# blog.search.DatabaseSearchBackend falls back to icontains lookups.
+
+BLOG_SEARCH_BACKEND = 'blog.search.InvertedIndexBackend'
+
+# Image derivatives
+# Threads resizing uploaded article images (blog.images); 0 resizes them
+# during the request that saved the article.
+
+BLOG_IMAGE_WORKERS = 2
+
+# Uploaded media
+# CKEditor uploads and article images are stored once per distinct content
+# under media/cas/ (blog.storage). Serve that directory with
+# "Cache-Control: public, max-age=31536000, immutable"; manage.py gc_media
+# deletes the files no article uses any more.
+
+DEFAULT_FILE_STORAGE = 'blog.storage.ContentAddressedStorage'
+
+# Comment queue
+# Path of an SQLite journal to make posted comments write-behind: requests
+# append to it and a worker thread of each process inserts them in batches
+# (blog.comment_queue), e.g. os.path.join(BASE_DIR, 'queue', 'comments.sqlite3').
+# None inserts every comment during its request.
+
+BLOG_COMMENT_QUEUE = None
+BLOG_COMMENT_QUEUE_BATCH = 500
+BLOG_COMMENT_QUEUE_INTERVAL = 1.0
+
+# Read replicas
+# Aliases of DATABASES that the list, search and detail pages read from
+# (blog.routers). A client that wrote reads from the primary for
+# BLOG_REPLICA_LAG seconds, which should exceed the replication delay.
+
+DATABASE_ROUTERS = ['blog.routers.ReplicaRouter']
+BLOG_READ_REPLICAS = []
+BLOG_REPLICA_LAG = 5
+
+# Logging
+# One JSON line per request in logs/access.log (blog.instrumentation); the
+# requests slower than BLOG_SLOW_REQUEST_MS milliseconds are written to
+# logs/slow.log with their queries.
+
+BLOG_SLOW_REQUEST_MS = 500
+
+# The test runner keeps the tests out of these files.
+TEST_RUNNER = 'myblog.test_runner.BlogTestRunner'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {
+            'format': '%(message)s',
+        },
+        'verbose': {
+            'format': '%(asctime)s %(levelname)s %(name)s %(message)s',
+        },
+    },
+    'handlers': {
+        'access_file': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'access.log'),
+            'formatter': 'message',
+        },
+        'slow_file': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'slow.log'),
+            'formatter': 'message',
+        },
+        'error_file': {
+            'level': 'ERROR',
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': os.path.join(BASE_DIR, 'logs', 'error.log'),
+            'formatter': 'verbose',
+        },
+    },
+    'loggers': {
+        'blog.access': {
+            'handlers': ['access_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'blog.slow': {
+            'handlers': ['slow_file'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+        'django.request': {
+            'handlers': ['error_file'],
+            'level': 'ERROR',
+        },
+    },
+}
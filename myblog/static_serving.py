@@ -0,0 +1,213 @@
+"""
+Serving of STATIC_ROOT and MEDIA_ROOT straight from the WSGI application.
+
+StaticFilesApplication wraps the Django application: GET and HEAD requests
+for an existing file under STATIC_URL or MEDIA_URL are answered without
+building a request, resolving the URL or running any middleware. Full files
+go through the server's wsgi.file_wrapper (sendfile() under gunicorn and
+uWSGI). A precompressed file.br or file.gz next to the file is sent to the
+clients that accept it, single byte ranges get 206 Partial Content, and
+conditional requests get 304 Not Modified. Hashed static names
+(ManifestStaticFilesStorage) and content-addressed uploads (blog.storage)
+never change, so they are cacheable forever.
+
+Everything else, including missing files, is passed to Django.
+"""
+import mimetypes
+import os
+import re
+from email.utils import formatdate, parsedate_tz, mktime_tz
+
+from django.conf import settings
+from django.core.handlers.wsgi import get_path_info
+
+from blog.storage import IMMUTABLE_CACHE_CONTROL, is_content_addressed
+
+# name.<12 hex digits>.ext, as written by ManifestStaticFilesStorage.
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/]+$')
+DEFAULT_CACHE_CONTROL = 'public, max-age=60'
+BLOCK_SIZE = 64 * 1024
+
+# (Accept-Encoding token, file suffix), preferred first.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('font/woff2', '.woff2')
+
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def http_date(timestamp):
+    return formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    parsed = parsedate_tz(value) if value else None
+    return mktime_tz(parsed) if parsed else None
+
+
+def accepts(environ, token):
+    for item in environ.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, _, params = item.strip().partition(';')
+        if name.strip().lower() == token:
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+
+def parse_range(value, size):
+    """
+    (start, end) inclusive of the single byte range value of a size byte
+    file; None if the header is not a single byte range, False if the
+    range lies outside the file.
+    """
+    match = RANGE.match(value.replace(' ', ''))
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # The last N bytes.
+        length = int(end)
+        if not length:
+            return False
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        return False
+    return start, end
+
+
+def read_range(file, start, length):
+    try:
+        file.seek(start)
+        while length > 0:
+            block = file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        file.close()
+
+
+class StaticFilesApplication(object):
+    """
+    WSGI middleware serving the files under the given (URL prefix, directory)
+    roots, by default STATIC_URL and MEDIA_URL.
+    """
+
+    def __init__(self, application, roots=None):
+        self.application = application
+        if roots is None:
+            roots = [(settings.STATIC_URL, settings.STATIC_ROOT), (settings.MEDIA_URL, settings.MEDIA_ROOT)]
+        self.roots = [(prefix, os.path.realpath(directory)) for prefix, directory in roots
+            if prefix and prefix.startswith('/') and directory]
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') in ('GET', 'HEAD'):
+            found = self.find(get_path_info(environ))
+            if found is not None:
+                return self.serve(environ, start_response, *found)
+        return self.application(environ, start_response)
+
+    def find(self, path):
+        """
+        (path on disk, file name relative to its root) of the URL path, or
+        None when no file is there.
+        """
+        for prefix, directory in self.roots:
+            if not path.startswith(prefix):
+                continue
+            name = path[len(prefix):]
+            if not name or '\x00' in name or '\\' in name:
+                return None
+            full_path = os.path.realpath(os.path.join(directory, name))
+            # No escaping the root with .. or a symbolic link.
+            if not full_path.startswith(directory + os.sep) or not os.path.isfile(full_path):
+                return None
+            return full_path, name
+        return None
+
+    def cache_control(self, name):
+        if HASHED_NAME.search(name) or is_content_addressed(name):
+            return IMMUTABLE_CACHE_CONTROL
+        return DEFAULT_CACHE_CONTROL
+
+    def serve(self, environ, start_response, full_path, name):
+        content_type, encoding = mimetypes.guess_type(full_path)
+        if encoding is not None:
+            # A file that is itself compressed (photo.tar.gz) is sent as is.
+            content_type = 'application/octet-stream'
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in ('application/javascript', 'application/json'):
+            content_type += '; charset=utf-8'
+
+        content_encoding = None
+        range_header = environ.get('HTTP_RANGE')
+        if not range_header:
+            # Byte ranges always refer to the identity encoding.
+            for token, suffix in ENCODINGS:
+                if accepts(environ, token) and os.path.isfile(full_path + suffix):
+                    full_path, content_encoding = full_path + suffix, token
+                    break
+
+        stat = os.stat(full_path)
+        etag = '"%x-%x%s"' % (int(stat.st_mtime), stat.st_size,
+            '-' + content_encoding if content_encoding else '')
+        headers = [
+            ('Content-Type', content_type),
+            ('Cache-Control', self.cache_control(name)),
+            ('Last-Modified', http_date(stat.st_mtime)),
+            ('ETag', etag),
+            ('Accept-Ranges', 'bytes'),
+            ('Vary', 'Accept-Encoding'),
+        ]
+        if content_encoding:
+            headers.append(('Content-Encoding', content_encoding))
+
+        if self.not_modified(environ, etag, stat.st_mtime):
+            start_response('304 Not Modified', [header for header in headers if header[0] != 'Content-Type'])
+            return []
+
+        size = stat.st_size
+        status, start, length = '200 OK', 0, size
+        if range_header and self.range_applies(environ, etag, stat.st_mtime):
+            byte_range = parse_range(range_header, size)
+            if byte_range is False:
+                headers.append(('Content-Range', 'bytes */%s' % size))
+                headers.append(('Content-Length', '0'))
+                start_response('416 Range Not Satisfiable', headers)
+                return []
+            if byte_range is not None:
+                start, end = byte_range
+                status, length = '206 Partial Content', end - start + 1
+                headers.append(('Content-Range', 'bytes %s-%s/%s' % (start, end, size)))
+        headers.append(('Content-Length', str(length)))
+        start_response(status, headers)
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+
+        file = open(full_path, 'rb')
+        if length == size:
+            file_wrapper = environ.get('wsgi.file_wrapper')
+            if file_wrapper is not None:
+                return file_wrapper(file, BLOCK_SIZE)
+        return read_range(file, start, length)
+
+    def not_modified(self, environ, etag, mtime):
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or 'W/' + etag in tags
+        since = parse_http_date(environ.get('HTTP_IF_MODIFIED_SINCE'))
+        return since is not None and int(mtime) <= since
+
+    def range_applies(self, environ, etag, mtime):
+        # If-Range: the range only holds for the version the client has.
+        if_range = environ.get('HTTP_IF_RANGE')
+        if not if_range:
+            return True
+        if if_range.startswith(('"', 'W/')):
+            return if_range == etag
+        since = parse_http_date(if_range)
+        return since is not None and int(mtime) <= since
@@ -0,0 +1,29 @@
+"""
+The test runner of the project: Django's, with the log files of LOGGING
+detached while the tests run, so that a test run does not append its
+requests to logs/. Tests still see the records with assertLogs().
+"""
+import logging
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+
+class BlogTestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super(BlogTestRunner, self).setup_test_environment(**kwargs)
+        self.detached_handlers = []
+        for name in getattr(settings, 'LOGGING', {}).get('loggers', {}):
+            logger = logging.getLogger(name)
+            for handler in list(logger.handlers):
+                if isinstance(handler, logging.FileHandler):
+                    logger.removeHandler(handler)
+                    self.detached_handlers.append((logger, handler))
+            if not logger.handlers:
+                logger.addHandler(logging.NullHandler())
+
+    def teardown_test_environment(self, **kwargs):
+        for logger, handler in self.detached_handlers:
+            logger.handlers = [h for h in logger.handlers if not isinstance(h, logging.NullHandler)]
+            logger.addHandler(handler)
+        super(BlogTestRunner, self).teardown_test_environment(**kwargs)
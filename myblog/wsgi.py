@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "myblog.settings")
 
 application = get_wsgi_application()
+
+# Deliver the comments left in the journal by the previous run.
+from blog.comment_queue import start_worker
+start_worker()
+
+# Static files and uploads are served before Django sees the request.
+from myblog.static_serving import StaticFilesApplication
+application = StaticFilesApplication(application)